@@ -0,0 +1,230 @@
+"""Admission control for the api blueprint.
+
+Each request is put in a class -- write (anything but GET/HEAD), read,
+or analytics (/api/stats/*, search, flagged entries) -- and must take a
+slot before its view runs. A slot needs room under the class limit and
+under ADMISSION_MAX_CONCURRENT overall. Requests that can't get one wait
+in a queue of at most ADMISSION_QUEUE_SIZE, served writes first, for at
+most ADMISSION_QUEUE_SECONDS. A request is shed with a 503 and
+Retry-After when the queue is full (a write first pushes out the
+newest waiting read or analytics request) or its wait runs out, so a
+slow database holds a bounded number of workers and writes still get
+through.
+
+Queued requests wait inside a worker thread, so the limits default to
+WORKER_THREADS (gunicorn's --threads). Reads and analytics -- active and
+queued, plus the open SSE streams that init_blueprint is told about --
+may hold at most WORKER_THREADS - ADMISSION_WRITE_RESERVE threads; past
+that they are shed at once, so an incoming write always finds a thread
+to reach the queue in.
+
+Views marked @exempt (the SSE stream, which holds its request for
+minutes, and the metrics endpoint) and demo requests skip admission.
+"""
+import itertools
+import math
+import os
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") not in ("0", "false", "False")
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", "8"))  # keep in step with gunicorn --threads
+ADMISSION_WRITE_RESERVE = int(os.environ.get("ADMISSION_WRITE_RESERVE", "1"))
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", str(WORKER_THREADS)))
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", str(WORKER_THREADS)))
+ADMISSION_QUEUE_SECONDS = float(os.environ.get("ADMISSION_QUEUE_SECONDS", "2"))
+ADMISSION_RETRY_AFTER = float(os.environ.get("ADMISSION_RETRY_AFTER", "1"))
+
+NON_WRITE_THREADS = max(WORKER_THREADS - ADMISSION_WRITE_RESERVE, 1)
+
+# Class -> (priority, concurrency limit); lower priority numbers are served first
+CLASSES = {
+    'write': (0, int(os.environ.get("ADMISSION_WRITE_LIMIT", str(ADMISSION_MAX_CONCURRENT)))),
+    'read': (1, int(os.environ.get("ADMISSION_READ_LIMIT", str(NON_WRITE_THREADS)))),
+    'analytics': (2, int(os.environ.get("ADMISSION_ANALYTICS_LIMIT", str(max(WORKER_THREADS // 2, 1))))),
+}
+ANALYTICS_ENDPOINTS = {'api.search_tips', 'api.get_flagged_tips'}
+
+
+class Waiter:
+    def __init__(self, route_class, seq):
+        self.route_class = route_class
+        self.priority = CLASSES[route_class][0]
+        self.seq = seq
+        self.granted = False
+        self.shed = None  # reason, once pushed out of the queue
+
+
+class AdmissionController:
+    """Per-class concurrency limits with a bounded priority wait queue"""
+
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, queue_size=ADMISSION_QUEUE_SIZE,
+                 queue_seconds=ADMISSION_QUEUE_SECONDS, threads=WORKER_THREADS,
+                 write_reserve=ADMISSION_WRITE_RESERVE):
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.queue_seconds = queue_seconds
+        self.threads = threads
+        self.write_reserve = write_reserve
+        self.held_threads = lambda: 0  # threads held by exempt long-lived requests
+        self.cond = threading.Condition()
+        self.waiters = []  # kept sorted by (priority, seq)
+        self.seq = itertools.count()
+        self.active = {name: 0 for name in CLASSES}
+        self.admitted = {name: 0 for name in CLASSES}
+        self.shed = {name: {'threads': 0, 'queue_full': 0, 'timeout': 0, 'evicted': 0} for name in CLASSES}
+        self.max_queue_depth = 0
+        self.wait_seconds_total = 0.0
+        self.waited = 0
+
+    def _has_room(self, route_class):
+        return (sum(self.active.values()) < self.max_concurrent
+                and self.active[route_class] < CLASSES[route_class][1])
+
+    def _non_write_threads(self):
+        """Worker threads held by reads and analytics, running or queued, and exempt streams"""
+        return (self.active['read'] + self.active['analytics']
+                + sum(1 for waiter in self.waiters if waiter.route_class != 'write')
+                + self.held_threads())
+
+    def _grant_waiters(self):
+        granted = False
+        for waiter in list(self.waiters):
+            if self._has_room(waiter.route_class):
+                self.waiters.remove(waiter)
+                self.active[waiter.route_class] += 1
+                waiter.granted = granted = True
+            elif sum(self.active.values()) >= self.max_concurrent:
+                break
+        if granted:
+            self.cond.notify_all()
+
+    def acquire(self, route_class):
+        """Take a slot; returns None when admitted or the reason the request was shed"""
+        with self.cond:
+            if route_class != 'write' and self._non_write_threads() >= self.threads - self.write_reserve:
+                # Taking another thread could leave none for an incoming write
+                self.shed[route_class]['threads'] += 1
+                return 'threads'
+
+            priority = CLASSES[route_class][0]
+            ahead = any(waiter.priority <= priority for waiter in self.waiters)
+            if not ahead and self._has_room(route_class):
+                self.active[route_class] += 1
+                self.admitted[route_class] += 1
+                return None
+
+            if len(self.waiters) >= self.queue_size:
+                victim = self.waiters[-1]
+                if victim.priority <= priority:
+                    self.shed[route_class]['queue_full'] += 1
+                    return 'queue_full'
+                self.waiters.pop()
+                victim.shed = 'evicted'
+                self.cond.notify_all()
+
+            waiter = Waiter(route_class, next(self.seq))
+            self.waiters.append(waiter)
+            self.waiters.sort(key=lambda w: (w.priority, w.seq))
+            self.max_queue_depth = max(self.max_queue_depth, len(self.waiters))
+
+            start = time.monotonic()
+            deadline = start + self.queue_seconds
+            while not waiter.granted and waiter.shed is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.waiters.remove(waiter)
+                    waiter.shed = 'timeout'
+                    break
+                self.cond.wait(remaining)
+
+            self.wait_seconds_total += time.monotonic() - start
+            self.waited += 1
+            if waiter.granted:
+                self.admitted[route_class] += 1
+                return None
+            self.shed[route_class][waiter.shed] += 1
+            return waiter.shed
+
+    def release(self, route_class):
+        with self.cond:
+            self.active[route_class] -= 1
+            self._grant_waiters()
+
+    def metrics(self):
+        with self.cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'queue_size': self.queue_size,
+                'threads': self.threads,
+                'write_reserve': self.write_reserve,
+                'held_threads': self.held_threads(),
+                'queue_depth': len(self.waiters),
+                'max_queue_depth': self.max_queue_depth,
+                'avg_wait_ms': round(self.wait_seconds_total / self.waited * 1000, 2) if self.waited else 0,
+                'classes': {
+                    name: {
+                        'limit': CLASSES[name][1],
+                        'active': self.active[name],
+                        'queued': sum(1 for waiter in self.waiters if waiter.route_class == name),
+                        'admitted': self.admitted[name],
+                        'shed': dict(self.shed[name]),
+                    }
+                    for name in CLASSES
+                },
+            }
+
+
+controller = AdmissionController()
+
+
+def exempt(view):
+    """Let a view skip admission control"""
+    view.admission_exempt = True
+    return view
+
+
+def classify(req):
+    """Route class of a request, or None when it skips admission"""
+    view = current_app.view_functions.get(req.endpoint)
+    if view is None or getattr(view, 'admission_exempt', False):
+        return None
+    if req.method in ('GET', 'HEAD'):
+        if req.args.get('demo', 'false').lower() == 'true':
+            return None
+        if req.path.startswith('/api/stats/') or req.endpoint in ANALYTICS_ENDPOINTS:
+            return 'analytics'
+        return 'read'
+    return 'write'
+
+
+def _admit():
+    route_class = classify(request)
+    if route_class is None:
+        return None
+    reason = controller.acquire(route_class)
+    if reason is not None:
+        response = jsonify({'error': 'Server is busy, please retry shortly', 'reason': reason})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(math.ceil(ADMISSION_RETRY_AFTER))
+        return response
+    g.admission_class = route_class
+    return None
+
+
+def _release(exc):
+    route_class = g.pop('admission_class', None)
+    if route_class is not None:
+        controller.release(route_class)
+
+
+def init_blueprint(bp, held_threads=None):
+    """Install admission on a blueprint; held_threads() counts threads held by exempt streams"""
+    if not ADMISSION_ENABLED:
+        return
+    if held_threads is not None:
+        controller.held_threads = held_threads
+    bp.before_request(_admit)
+    bp.teardown_request(_release)
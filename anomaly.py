@@ -0,0 +1,345 @@
+"""Anomaly detection for mistyped or suspicious tip entries.
+
+Every entry is scored against two robust weekday baselines: its user's
+(user, weekday) and its section's (restaurant, section, weekday). For
+each metric the baseline is the group median and 1.4826 x MAD, and the
+score is the robust z-score (value - median) / sigma. A metric is
+anomalous when every baseline with enough samples puts it beyond
+ANOMALY_Z_THRESHOLD, so a great night that is normal for the section
+isn't flagged just because it is unusual for the user.
+
+A full pass fetches the scored columns once, computes all group medians
+with NumPy sorts (no per-group Python loops), stores the baselines and
+replaces tip_entry_flags. Incremental passes score only entries changed
+since the last run against the stored baselines.
+
+    python anomaly.py          # incremental (full pass if no baselines yet)
+    python anomaly.py --full
+"""
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import Float, case, cast, func, literal_column, select
+
+from app import db
+from models import User, TipEntry, TipEntryFlag, AnomalyBaseline, JobState
+from events import publish_flags_event
+import sync
+
+logger = logging.getLogger(__name__)
+
+Z_THRESHOLD = float(os.environ.get("ANOMALY_Z_THRESHOLD", "3.5"))
+MIN_GROUP_SIZE = int(os.environ.get("ANOMALY_MIN_GROUP_SIZE", "8"))
+WATERMARK_KEY = "anomaly.watermark"
+BATCH_SIZE = 5000
+
+METRICS = ('total_tips', 'hours_worked', 'tips_per_hour', 'tip_percentage')
+SCOPES = ('user', 'section')
+MAD_SCALE = 1.4826  # makes MAD a consistent estimator of the standard deviation
+
+
+def _columns():
+    return [
+        TipEntry.id, TipEntry.user_id, TipEntry.section, TipEntry.weekday,
+        cast(TipEntry.total_tips, Float),
+        cast(TipEntry.hours_worked, Float),
+        cast(TipEntry.tips_per_hour, Float),
+        # No sales recorded: the percentage is meaningless, leave it out (NaN)
+        case((TipEntry.sales_amount > literal_column('0'), cast(TipEntry.tip_percentage, Float))),
+    ]
+
+
+def _codes(values):
+    """Integer codes for hashable values (None -> -1); returns (codes, distinct values)"""
+    distinct = sorted({v for v in values if v is not None})
+    lookup = {v: i for i, v in enumerate(distinct)}
+    lookup[None] = -1
+    return np.fromiter(map(lookup.__getitem__, values), dtype=np.int64, count=len(values)), distinct
+
+
+def _fetch_tuples(stmt):
+    """Rows of a select as plain tuples.
+
+    Statements without parameters (the full pass) run straight on the
+    DB-API cursor: building a Row per result costs about as much as the
+    fetch itself at a million rows. Anything with parameters goes through
+    SQLAlchemy so values get bound properly.
+    """
+    connection = db.session.connection()
+    compiled = stmt.compile(dialect=connection.dialect)
+    if compiled.params:
+        return connection.execute(stmt).all()
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(str(compiled))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def _fetch(since=None):
+    """Column arrays for entries (changed since `since`, if given).
+
+    Only plain numbers and short strings are fetched -- converting dates
+    for every row costs more than all the statistics.
+    """
+    stmt = select(*_columns())
+    if since is not None:
+        stmt = stmt.where(TipEntry.updated_at >= since)
+    rows = _fetch_tuples(stmt)
+    ids, user_ids, sections, weekdays, *metrics = zip(*rows) if rows else [()] * (4 + len(METRICS))
+
+    user_codes, users = _codes(user_ids)
+    section_codes, section_names = _codes(sections)
+    restaurants = dict(db.session.query(User.id, User.restaurant_id).filter(User.id.in_(users)).all()) \
+        if users else {}
+    restaurant_codes, restaurant_ids = _codes([restaurants.get(u) or '' for u in users])
+
+    data = {
+        'id': np.asarray(ids, dtype=np.int64),
+        'user': user_codes,
+        'users': users,
+        'restaurant': restaurant_codes[user_codes] if len(user_codes) else user_codes,
+        'restaurants': restaurant_ids,
+        'section': section_codes,
+        'sections': section_names,
+        'weekday': np.asarray(weekdays, dtype=np.int64),
+    }
+    for metric, values in zip(METRICS, metrics):
+        data[metric] = np.asarray(values, dtype=float)  # NULL becomes NaN
+    return data
+
+
+def _groups(data, scope):
+    """(codes, labels) for a scope's (key, weekday) groups; code -1 means no group.
+
+    Labels are (group_key, weekday) as stored in anomaly_baselines.
+    """
+    if scope == 'user':
+        keys = data['users']
+        key_codes = data['user']
+    else:
+        n_sections = len(data['sections'])
+        keys = [f"{r}:{s}" for r in data['restaurants'] for s in data['sections']]
+        key_codes = np.where(data['section'] >= 0, data['restaurant'] * n_sections + data['section'], -1)
+    codes = np.where(key_codes >= 0, key_codes * 7 + data['weekday'], -1)
+    labels = [(key, weekday) for key in keys for weekday in range(7)]
+    return codes, labels
+
+
+def group_median(codes, values, n_groups):
+    """Median of `values` per group code; NaN for empty groups.
+
+    One float sort plus one stable sort of the codes puts every group's
+    values in order, side by side. Codes are narrowed first so the stable
+    sort can use radix sort.
+    """
+    order = np.argsort(values)
+    narrow = codes[order].astype(np.min_scalar_type(max(n_groups - 1, 0)))
+    order = order[np.argsort(narrow, kind='stable')]
+    sorted_values = values[order]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = np.full(n_groups, np.nan)
+    present = counts > 0
+    lo = starts[present] + (counts[present] - 1) // 2
+    hi = starts[present] + counts[present] // 2
+    medians[present] = (sorted_values[lo] + sorted_values[hi]) / 2
+    return medians, counts
+
+
+def group_baselines(codes, values, n_groups):
+    """(median, sigma, samples) arrays per group, ignoring NaN values and code -1"""
+    valid = (codes >= 0) & ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    medians, counts = group_median(codes, values, n_groups)
+    deviations = np.abs(values - medians[codes])
+    mads, _ = group_median(codes, deviations, n_groups)
+    sigma = MAD_SCALE * mads
+    # More than half the group sharing one value gives MAD 0; fall back to mean absolute deviation
+    mean_dev = np.bincount(codes, weights=deviations, minlength=n_groups) / np.maximum(counts, 1)
+    sigma = np.where(sigma > 0, sigma, 1.2533 * mean_dev)
+    return medians, sigma, counts
+
+
+def robust_z(values, codes, medians, sigma, counts):
+    """z-scores of values against their group baselines; NaN where no usable baseline"""
+    safe = np.where(codes >= 0, codes, 0)
+    usable = (codes >= 0) & (counts[safe] >= MIN_GROUP_SIZE) & (sigma[safe] > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = (values - medians[safe]) / sigma[safe]
+    return np.where(usable, z, np.nan)
+
+
+def score(data, baselines):
+    """Flag rows whose metrics are outliers against every usable baseline.
+
+    baselines: {scope: {metric: (codes, medians, sigma, counts)}}
+    Returns a list of flag dicts.
+    """
+    flagged = np.zeros(len(data['id']), dtype=bool)
+    best = np.zeros(len(data['id']))
+    details = {}
+    for metric in METRICS:
+        values = data[metric]
+        zs = {scope: robust_z(values, *baselines[scope][metric]) for scope in SCOPES}
+        abs_z = np.stack([np.abs(zs['user']), np.abs(zs['section'])])
+        has_baseline = ~np.isnan(abs_z).all(axis=0)
+        # Anomalous only if no usable baseline considers it normal
+        with np.errstate(invalid='ignore'):
+            closest = np.nanmin(np.where(np.isnan(abs_z), np.inf, abs_z), axis=0)
+        anomalous = has_baseline & ~np.isnan(values) & (closest > Z_THRESHOLD)
+        flagged |= anomalous
+        best = np.where(anomalous, np.maximum(best, closest), best)
+        details[metric] = (anomalous, zs)
+
+    flags = []
+    for i in np.flatnonzero(flagged):
+        reasons = {}
+        for metric, (anomalous, zs) in details.items():
+            if anomalous[i]:
+                reasons[metric] = {
+                    'value': round(float(data[metric][i]), 2),
+                    **{f'z_{scope}': round(float(z[i]), 2) for scope, z in zs.items() if not np.isnan(z[i])},
+                }
+        flags.append({
+            'tip_id': int(data['id'][i]),
+            'user_id': data['users'][data['user'][i]],
+            'score': float(best[i]),
+            'reasons': json.dumps(reasons),
+        })
+
+    # Dates are only needed for the (few) flagged rows
+    work_dates = {}
+    ids = [flag['tip_id'] for flag in flags]
+    for i in range(0, len(ids), BATCH_SIZE):
+        work_dates.update(db.session.query(TipEntry.id, TipEntry.work_date)
+                          .filter(TipEntry.id.in_(ids[i:i + BATCH_SIZE])).all())
+    for flag in flags:
+        flag['work_date'] = work_dates[flag['tip_id']]
+    return flags
+
+
+def _set_watermark(watermark):
+    state = db.session.get(JobState, WATERMARK_KEY) or JobState(key=WATERMARK_KEY)
+    state.value = watermark.isoformat()
+    db.session.add(state)
+
+
+def _latest(since=None):
+    # next_watermark only needs the newest row, not every timestamp
+    stmt = select(func.max(TipEntry.updated_at))
+    if since is not None:
+        stmt = stmt.where(TipEntry.updated_at >= since)
+    return [db.session.execute(stmt).scalar()]
+
+
+def _get_watermark():
+    state = db.session.get(JobState, WATERMARK_KEY)
+    return datetime.fromisoformat(state.value) if state and state.value else None
+
+
+def _insert(model, rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(model.__table__.insert(), rows[i:i + BATCH_SIZE])
+
+
+def full_pass():
+    """Recompute baselines from every entry and re-flag everything"""
+    started_at = datetime.now(timezone.utc)
+    data = _fetch()
+    baselines, baseline_rows = {}, []
+    for scope in SCOPES:
+        codes, labels = _groups(data, scope)
+        baselines[scope] = {}
+        for metric in METRICS:
+            medians, sigma, counts = group_baselines(codes, data[metric], len(labels))
+            baselines[scope][metric] = (codes, medians, sigma, counts)
+            for code in np.flatnonzero(counts > 0):
+                key, weekday = labels[code]
+                baseline_rows.append({
+                    'scope': scope, 'group_key': key, 'weekday': weekday, 'metric': metric,
+                    'median': float(medians[code]), 'sigma': float(sigma[code]), 'samples': int(counts[code]),
+                })
+    flags = score(data, baselines)
+
+    db.session.execute(AnomalyBaseline.__table__.delete())
+    db.session.execute(TipEntryFlag.__table__.delete())
+    _insert(AnomalyBaseline, baseline_rows)
+    _insert(TipEntryFlag, flags)
+    _set_watermark(sync.next_watermark(None, started_at, _latest()))
+    db.session.commit()
+    return len(data['id']), len(flags)
+
+
+def incremental_pass(watermark):
+    """Score entries changed since the watermark against the stored baselines"""
+    started_at = datetime.now(timezone.utc)
+    since = sync.delta_floor(watermark)
+    data = _fetch(since)
+    if len(data['id']):
+        stored = {}
+        for b in db.session.query(AnomalyBaseline).all():
+            stored[(b.scope, b.group_key, b.weekday, b.metric)] = (b.median, b.sigma, b.samples)
+
+        baselines = {}
+        for scope in SCOPES:
+            codes, labels = _groups(data, scope)
+            baselines[scope] = {}
+            for metric in METRICS:
+                found = [stored.get((scope, key, weekday, metric), (np.nan, 0.0, 0)) for key, weekday in labels]
+                medians, sigma, counts = (np.asarray(col) for col in zip(*found)) if found else \
+                    (np.empty(0), np.empty(0), np.empty(0, dtype=np.int64))
+                baselines[scope][metric] = (codes, medians, sigma, counts.astype(np.int64))
+        flags = score(data, baselines)
+
+        ids = data['id'].tolist()
+        for i in range(0, len(ids), BATCH_SIZE):
+            TipEntryFlag.query.filter(TipEntryFlag.tip_id.in_(ids[i:i + BATCH_SIZE])) \
+                .delete(synchronize_session=False)
+        _insert(TipEntryFlag, flags)
+    else:
+        flags = []
+
+    _set_watermark(sync.next_watermark(watermark, started_at, _latest(since)))
+    db.session.commit()
+    return len(data['id']), len(flags)
+
+
+def run(full=False):
+    """Run the detector; returns a summary dict"""
+    start = time.perf_counter()
+    watermark = None if full else _get_watermark()
+    if watermark is None or not db.session.query(AnomalyBaseline.id).first():
+        mode = 'full'
+        scanned, flagged = full_pass()
+    else:
+        mode = 'incremental'
+        scanned, flagged = incremental_pass(watermark)
+    if scanned:
+        publish_flags_event(flagged)
+    summary = {
+        'mode': mode,
+        'scanned': scanned,
+        'flagged': flagged,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    logger.info("Anomaly detection: %s", summary)
+    return summary
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Flag anomalous tip entries')
+    parser.add_argument('--full', action='store_true', help='Recompute baselines and re-flag every entry')
+    args = parser.parse_args()
+
+    with app.app_context():
+        print(run(full=args.full))
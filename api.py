@@ -1,15 +1,32 @@
-from flask import Blueprint, request, jsonify
-from datetime import datetime, date, timedelta
+from flask import Blueprint, Response, request, jsonify
+from datetime import datetime, date, timedelta, timezone
 from decimal import Decimal
+import json
 import os
-from sqlalchemy import func, and_, or_
+import sqlite3
+from sqlalchemy import func, case, exists
 from sqlalchemy.orm import joinedload
 from app import db
-from models import User, TipEntry
+from models import (User, TipEntry, TipEntryTombstone, TipEntryFlag, TipHeatmapCell, TipPoolRule,
+                    PayrollSnapshot, TipArchiveSummary)
 from auth import require_auth, get_current_user
 from demo_data import get_demo_data
+from events import bus, publish_tip_event
+from cache import stats_cache
+from scheduler import scheduler, last_runs
+import admission
+import archive
+import bulk
+import heatmap
+import replica
+import search
+import sync
+import tip_pool
 
 api_bp = Blueprint('api', __name__)
+admission.init_blueprint(api_bp, held_threads=bus.subscriber_count)  # each SSE stream holds a thread
+
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
 
 def validate_tip_entry(data):
     """Validate tip entry data"""
@@ -33,14 +50,34 @@ def validate_tip_entry(data):
     except (ValueError, TypeError):
         errors.append('Card tips must be a valid number')
     
-    # Validate hours_worked
+    # Validate shift times (optional, HH:MM, both or neither)
+    shift_start = data.get('shift_start') or None
+    shift_end = data.get('shift_end') or None
+    shift_hours = None
+    if shift_start or shift_end:
+        try:
+            shift_start = datetime.strptime(str(shift_start), '%H:%M').time()
+            shift_end = datetime.strptime(str(shift_end), '%H:%M').time()
+        except ValueError:
+            errors.append('Shift start and end must both be given as HH:MM')
+            shift_start = shift_end = None
+        if shift_start is not None and shift_start == shift_end:
+            errors.append('Shift end must differ from shift start')
+        elif shift_start is not None:
+            shift_hours = heatmap.shift_hours(shift_start, shift_end)
+
+    # Validate hours_worked (defaults to the shift length when shift times are given)
     hours_worked = data.get('hours_worked')
+    if hours_worked in (None, '') and shift_hours is not None:
+        hours_worked = shift_hours
     try:
         hours_worked = float(hours_worked)
         if hours_worked <= 0:
             errors.append('Hours worked must be greater than 0')
         if hours_worked > 24:
             errors.append('Hours worked cannot exceed 24')
+        if shift_hours is not None and heatmap.exceeds_shift(hours_worked, shift_start, shift_end):
+            errors.append('Hours worked cannot exceed the shift length')
     except (ValueError, TypeError):
         errors.append('Hours worked must be a valid number')
 
@@ -80,6 +117,9 @@ def validate_tip_entry(data):
     else:
         work_date = date.today()
 
+    if errors:
+        return errors, None
+
     return errors, {
         'cash_tips': round(cash_tips, 2),
         'card_tips': round(card_tips, 2),
@@ -87,7 +127,9 @@ def validate_tip_entry(data):
         'sales_amount': round(sales_amount, 2),
         'section': section,
         'comments': comments,
-        'work_date': work_date
+        'work_date': work_date,
+        'shift_start': shift_start,
+        'shift_end': shift_end
     }
 
 @api_bp.route('/tips', methods=['POST'])
@@ -132,15 +174,26 @@ def create_tip_entry():
             section=validated_data.get('section'),
             work_date=work_date,
             weekday=weekday,
+            shift_start=validated_data['shift_start'],
+            shift_end=validated_data['shift_end'],
             comments=validated_data.get('comments') or None
         )
         
         db.session.add(tip_entry)
+        db.session.flush()
+        heatmap.apply_entry(tip_entry, 1)
+
+        tip_dict = tip_entry.to_dict()
+        tip_dict['user_name'] = user.name
+        # Payroll snapshots covering the date change in the same transaction as the entry
+        tip_pool.apply_entry(tip_dict, user.restaurant_id, user.role, 1)
         db.session.commit()
-        
+
+        publish_tip_event('tip_created', tip_dict, user.restaurant_id)
+
         return jsonify({
             'success': True,
-            'tip_entry': tip_entry.to_dict()
+            'tip_entry': tip_dict
         }), 201
         
     except Exception as e:
@@ -165,35 +218,37 @@ def get_tips():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        # Build query
-        query = TipEntry.query.options(joinedload(TipEntry.user))
-        
-        # Role-based filtering
-        user = User.query.filter_by(id=current_user['id']).first()
-        if not user or user.role != 'manager':
-            query = query.filter_by(user_id=current_user['id'])
-        
-        # Date filtering
+        # Date range
         if start_date and end_date:
             try:
                 start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-                query = query.filter(and_(
-                    TipEntry.work_date >= start_date,
-                    TipEntry.work_date <= end_date
-                ))
             except ValueError:
                 return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
         else:
             try:
                 days_int = int(days)
                 start_date = date.today() - timedelta(days=days_int)
-                query = query.filter(TipEntry.work_date >= start_date)
+                end_date = None
             except ValueError:
                 return jsonify({'error': 'Invalid days parameter'}), 400
+
+        # Build query (includes archived entries only if the range reaches them)
+        entries = archive.entries(start_date)
+        query = db.session.query(entries).options(joinedload(entries.user))
+        
+        # Role-based filtering
+        user = User.query.filter_by(id=current_user['id']).first()
+        if not user or user.role != 'manager':
+            query = query.filter(entries.user_id == current_user['id'])
+        
+        # Date filtering
+        query = query.filter(entries.work_date >= start_date)
+        if end_date:
+            query = query.filter(entries.work_date <= end_date)
         
         # Order by date descending
-        tips = query.order_by(TipEntry.work_date.desc()).all()
+        tips = query.order_by(entries.work_date.desc()).all()
 
         result = []
         for tip in tips:
@@ -207,6 +262,282 @@ def get_tips():
         return jsonify({'error': str(e)}), 500
 
 
+@api_bp.route('/tips/changes', methods=['GET'])
+@replica.use_primary
+@require_auth
+def get_tip_changes():
+    """Get entries created, updated or deleted since a sync token"""
+    try:
+        started_at = datetime.now(timezone.utc)
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+
+        # Window start: explicit start_date, else `days` back from today
+        start_date = request.args.get('start_date')
+        try:
+            if start_date:
+                start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+            else:
+                start_date = date.today() - timedelta(days=int(request.args.get('days', '30')))
+        except ValueError:
+            return jsonify({'error': 'Invalid start_date or days parameter'}), 400
+
+        watermark = None
+        token = request.args.get('since')
+        if token:
+            watermark = sync.decode_token(token)
+            if watermark is None:
+                return jsonify({'error': 'Invalid sync token'}), 400
+            if sync.token_expired(watermark):
+                watermark = None  # tombstones are gone; fall back to a full snapshot
+
+        user = User.query.filter_by(id=current_user['id']).first()
+        is_manager = bool(user and user.role == 'manager')
+
+        # Archiving moves rows without tombstones, so clients keep archived entries
+        entries = archive.entries(start_date)
+        query = db.session.query(entries).options(joinedload(entries.user)).filter(entries.work_date >= start_date)
+        if not is_manager:
+            query = query.filter(entries.user_id == current_user['id'])
+        if watermark is not None:
+            query = query.filter(entries.updated_at >= sync.delta_floor(watermark))
+        tips = query.order_by(entries.work_date.desc()).all()
+
+        deleted = []
+        moved = []
+        if watermark is not None:
+            # No work_date filter: an entry may have been edited out of the window before it was deleted
+            tomb_query = db.session.query(TipEntryTombstone.tip_id, TipEntryTombstone.deleted_at).filter(
+                TipEntryTombstone.deleted_at >= sync.delta_floor(watermark),
+            )
+            # Entries edited to a date before the window leave the client's cache like deletions
+            moved_query = db.session.query(TipEntry.id, TipEntry.updated_at).filter(
+                TipEntry.updated_at >= sync.delta_floor(watermark),
+                TipEntry.work_date < start_date,
+            )
+            if not is_manager:
+                tomb_query = tomb_query.filter(TipEntryTombstone.user_id == current_user['id'])
+                moved_query = moved_query.filter(TipEntry.user_id == current_user['id'])
+            deleted = tomb_query.all()
+            moved = moved_query.all()
+
+        live_ids = {tip.id for tip in tips}
+        result = []
+        for tip in tips:
+            tip_dict = tip.to_dict()
+            tip_dict['user_name'] = tip.user.name if tip.user else None
+            result.append(tip_dict)
+
+        new_watermark = sync.next_watermark(
+            watermark,
+            started_at,
+            [tip.updated_at for tip in tips] + [row.deleted_at for row in deleted]
+            + [row.updated_at for row in moved],
+        )
+
+        return jsonify({
+            'tips': result,
+            'deleted': sorted(({row.tip_id for row in deleted} | {row.id for row in moved}) - live_ids),
+            'full': watermark is None,
+            'start_date': start_date.isoformat(),
+            'sync_token': sync.encode_token(new_watermark),
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/tips/search', methods=['GET'])
+@require_auth
+def search_tips():
+    """Full-text search over entry comments, best matches first"""
+    try:
+        q = request.args.get('q', '')
+        if not search.tokenize(q):
+            return jsonify({'error': 'Search query (q) is required'}), 400
+
+        try:
+            limit = min(max(int(request.args.get('limit', '20')), 1), 100)
+        except ValueError:
+            return jsonify({'error': 'Invalid limit parameter'}), 400
+
+        demo_mode = request.args.get('demo', 'false').lower() == 'true'
+        if demo_mode:
+            tokens = search.tokenize(q)
+            tips = [t for t in get_demo_data('tips')['tips']
+                    if all(token in (t['comments'] or '').lower() for token in tokens)]
+            return jsonify({'tips': [{**t, 'score': 1.0} for t in tips[:limit]], 'next_cursor': None})
+
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+
+        cursor = request.args.get('cursor')
+        if cursor:
+            cursor = search.decode_cursor(cursor)
+            if cursor is None:
+                return jsonify({'error': 'Invalid cursor'}), 400
+
+        query = TipEntry.query.options(joinedload(TipEntry.user))
+
+        # Role-based filtering: managers search their restaurant, everyone else their own entries
+        user = User.query.filter_by(id=current_user['id']).first()
+        if user and user.role == 'manager':
+            if user.restaurant_id:
+                query = query.join(User, User.id == TipEntry.user_id) \
+                    .filter(User.restaurant_id == user.restaurant_id)
+        else:
+            query = query.filter(TipEntry.user_id == current_user['id'])
+
+        # Date filtering (optional: searches all history by default)
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        days = request.args.get('days')
+        try:
+            if start_date:
+                query = query.filter(TipEntry.work_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+            if end_date:
+                query = query.filter(TipEntry.work_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        if days and not start_date:
+            try:
+                query = query.filter(TipEntry.work_date >= date.today() - timedelta(days=int(days)))
+            except ValueError:
+                return jsonify({'error': 'Invalid days parameter'}), 400
+
+        rows, next_cursor = search.search(query, q, limit, cursor)
+
+        result = []
+        for tip, score in rows:
+            tip_dict = tip.to_dict()
+            tip_dict['user_name'] = tip.user.name if tip.user else None
+            tip_dict['score'] = round(score, 6)
+            result.append(tip_dict)
+
+        return jsonify({'tips': result, 'next_cursor': next_cursor})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/tips/flagged', methods=['GET'])
+@require_auth
+def get_flagged_tips():
+    """List entries the anomaly job flagged, highest score first"""
+    try:
+        demo_mode = request.args.get('demo', 'false').lower() == 'true'
+        if demo_mode:
+            return jsonify({'flagged': []})
+
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+
+        try:
+            limit = min(max(int(request.args.get('limit', '50')), 1), 500)
+        except ValueError:
+            return jsonify({'error': 'Invalid limit parameter'}), 400
+
+        query = db.session.query(TipEntryFlag, TipEntry).join(TipEntry, TipEntry.id == TipEntryFlag.tip_id) \
+            .options(joinedload(TipEntry.user))
+
+        # Same scope as search: managers see their restaurant, everyone else their own entries
+        user = User.query.filter_by(id=current_user['id']).first()
+        if user and user.role == 'manager':
+            if user.restaurant_id:
+                query = query.join(User, User.id == TipEntry.user_id) \
+                    .filter(User.restaurant_id == user.restaurant_id)
+        else:
+            query = query.filter(TipEntryFlag.user_id == current_user['id'])
+
+        days = request.args.get('days')
+        if days:
+            try:
+                query = query.filter(TipEntryFlag.work_date >= date.today() - timedelta(days=int(days)))
+            except ValueError:
+                return jsonify({'error': 'Invalid days parameter'}), 400
+
+        rows = query.order_by(TipEntryFlag.score.desc(), TipEntryFlag.tip_id.desc()).limit(limit).all()
+
+        result = []
+        for flag, tip in rows:
+            tip_dict = tip.to_dict()
+            tip_dict['user_name'] = tip.user.name if tip.user else None
+            result.append({**flag.to_dict(), 'tip': tip_dict})
+
+        return jsonify({'flagged': result})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/tips/bulk', methods=['PATCH'])
+@require_auth
+def bulk_update_tips():
+    """Edit many entries, selected by ids or a filter, in one transaction"""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+
+        data = request.get_json() or {}
+        try:
+            ids, filters = bulk.parse_selection(data)
+            changes = bulk.validate_changes(data)
+            user = User.query.filter_by(id=current_user['id']).first()
+            rows = bulk.select_rows(user, current_user['id'], ids, filters)
+            bulk.check_rows(rows, changes)
+        except bulk.BulkError as e:
+            db.session.rollback()
+            return jsonify({'errors': [str(e)]}), 400
+
+        before, after, owners = bulk.update_rows(rows, changes) if rows else ([], [], {})
+        db.session.commit()
+        bulk.publish_events(before, after, owners)
+        scheduler.trigger('anomaly.incremental')
+
+        result = {'success': True, 'updated': len(after)}
+        if ids is not None:
+            result['missing_ids'] = sorted(set(ids) - {tip['id'] for tip in after})
+        return jsonify(result)
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/tips/bulk-delete', methods=['POST'])
+@require_auth
+def bulk_delete_tips():
+    """Delete many entries, selected by ids or a filter, in one transaction"""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+
+        data = request.get_json() or {}
+        try:
+            ids, filters = bulk.parse_selection(data)
+            user = User.query.filter_by(id=current_user['id']).first()
+            rows = bulk.select_rows(user, current_user['id'], ids, filters)
+        except bulk.BulkError as e:
+            db.session.rollback()
+            return jsonify({'errors': [str(e)]}), 400
+
+        deleted, owners = bulk.delete_rows(rows) if rows else ([], {})
+        db.session.commit()
+        bulk.publish_events(deleted, [], owners)
+        scheduler.trigger('anomaly.incremental')
+
+        result = {'success': True, 'deleted': len(deleted)}
+        if ids is not None:
+            result['missing_ids'] = sorted(set(ids) - {tip['id'] for tip in deleted})
+        return jsonify(result)
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 @api_bp.route('/tips/<int:tip_id>', methods=['DELETE'])
 @require_auth
 def delete_tip_entry(tip_id):
@@ -226,9 +557,19 @@ def delete_tip_entry(tip_id):
         if not tip:
             return jsonify({'error': 'Tip entry not found'}), 404
 
+        tip_dict = tip.to_dict()
+        tip_dict['user_name'] = tip.user.name if tip.user else None
+        restaurant_id = tip.user.restaurant_id if tip.user else None
+        role = tip.user.role if tip.user else None
+
+        heatmap.apply_entry(tip, -1)
         db.session.delete(tip)
+        db.session.add(TipEntryTombstone(tip_id=tip.id, user_id=tip.user_id, work_date=tip.work_date))
+        tip_pool.apply_entry(tip_dict, restaurant_id, role, -1)
         db.session.commit()
 
+        publish_tip_event('tip_deleted', tip_dict, restaurant_id)
+
         return jsonify({'success': True})
 
     except Exception as e:
@@ -254,6 +595,15 @@ def get_sections():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _exclude_flagged_requested():
+    return request.args.get('exclude_flagged', 'false').lower() == 'true'
+
+def _exclude_flagged(query, entries=TipEntry):
+    """Drop entries the anomaly job flagged when ?exclude_flagged=true"""
+    if _exclude_flagged_requested():
+        query = query.filter(~exists().where(TipEntryFlag.tip_id == entries.id))
+    return query
+
 @api_bp.route('/stats/daily', methods=['GET'])
 @require_auth
 def get_daily_stats():
@@ -272,43 +622,47 @@ def get_daily_stats():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        # Build query
-        query = db.session.query(
-            TipEntry.work_date,
-            func.sum(TipEntry.cash_tips).label('total_cash'),
-            func.sum(TipEntry.card_tips).label('total_card'),
-            func.sum(TipEntry.total_tips).label('total_tips'),
-            func.sum(TipEntry.hours_worked).label('total_hours'),
-            func.avg(TipEntry.tips_per_hour).label('avg_tips_per_hour'),
-            func.sum(TipEntry.sales_amount).label('total_sales')
-        )
-        
-        # Role-based filtering
-        user = User.query.filter_by(id=current_user['id']).first()
-        if not user or user.role != 'manager':
-            query = query.filter(TipEntry.user_id == current_user['id'])
-        
-        # Date filtering
+        # Date range
         if start_date and end_date:
             try:
                 start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-                query = query.filter(and_(
-                    TipEntry.work_date >= start_date,
-                    TipEntry.work_date <= end_date
-                ))
             except ValueError:
                 return jsonify({'error': 'Invalid date format'}), 400
         else:
             try:
                 days_int = int(days)
                 start_date = date.today() - timedelta(days=days_int)
-                query = query.filter(TipEntry.work_date >= start_date)
+                end_date = None
             except ValueError:
                 return jsonify({'error': 'Invalid days parameter'}), 400
+
+        # Build query
+        entries = archive.entries(start_date)
+        query = db.session.query(
+            entries.work_date,
+            func.sum(entries.cash_tips).label('total_cash'),
+            func.sum(entries.card_tips).label('total_card'),
+            func.sum(entries.total_tips).label('total_tips'),
+            func.sum(entries.hours_worked).label('total_hours'),
+            func.avg(entries.tips_per_hour).label('avg_tips_per_hour'),
+            func.sum(entries.sales_amount).label('total_sales'),
+            func.count(entries.id).label('entries')
+        )
+        
+        # Role-based filtering
+        user = User.query.filter_by(id=current_user['id']).first()
+        if not user or user.role != 'manager':
+            query = query.filter(entries.user_id == current_user['id'])
+        query = _exclude_flagged(query, entries)
+        
+        # Date filtering
+        query = query.filter(entries.work_date >= start_date)
+        if end_date:
+            query = query.filter(entries.work_date <= end_date)
         
         # Group by date and order
-        daily_stats = query.group_by(TipEntry.work_date).order_by(TipEntry.work_date).all()
+        daily_stats = query.group_by(entries.work_date).order_by(entries.work_date).all()
         
         result = []
         for stat in daily_stats:
@@ -323,7 +677,8 @@ def get_daily_stats():
                 'total_hours': float(stat.total_hours or 0),
                 'avg_tips_per_hour': float(stat.avg_tips_per_hour or 0),
                 'total_sales': total_sales,
-                'avg_tip_percentage': avg_tip_percentage
+                'avg_tip_percentage': avg_tip_percentage,
+                'entries': stat.entries
             })
         
         return jsonify({'daily_stats': result})
@@ -345,34 +700,39 @@ def get_weekday_stats():
         if not current_user:
             return jsonify({'error': 'Authentication required'}), 401
         
+        # Date range (last 90 days by default for meaningful averages)
+        days = request.args.get('days', '90')
+        try:
+            start_date = date.today() - timedelta(days=int(days))
+        except ValueError:
+            start_date = None
+
         # Build query for weekday averages
+        entries = archive.entries(start_date)
         query = db.session.query(
-            TipEntry.weekday,
-            func.avg(TipEntry.cash_tips).label('avg_cash'),
-            func.avg(TipEntry.card_tips).label('avg_card'),
-            func.avg(TipEntry.total_tips).label('avg_tips'),
-            func.avg(TipEntry.hours_worked).label('avg_hours'),
-            func.avg(TipEntry.tips_per_hour).label('avg_tips_per_hour'),
-            func.avg(TipEntry.sales_amount).label('avg_sales'),
-            func.avg(TipEntry.tip_percentage).label('avg_tip_percentage')
+            entries.weekday,
+            func.avg(entries.cash_tips).label('avg_cash'),
+            func.avg(entries.card_tips).label('avg_card'),
+            func.avg(entries.total_tips).label('avg_tips'),
+            func.avg(entries.hours_worked).label('avg_hours'),
+            func.avg(entries.tips_per_hour).label('avg_tips_per_hour'),
+            func.avg(entries.sales_amount).label('avg_sales'),
+            func.avg(entries.tip_percentage).label('avg_tip_percentage'),
+            func.count(entries.id).label('entries')
         )
         
         # Role-based filtering
         user = User.query.filter_by(id=current_user['id']).first()
         if not user or user.role != 'manager':
-            query = query.filter(TipEntry.user_id == current_user['id'])
+            query = query.filter(entries.user_id == current_user['id'])
+        query = _exclude_flagged(query, entries)
         
-        # Date filtering (last 90 days by default for meaningful averages)
-        days = request.args.get('days', '90')
-        try:
-            days_int = int(days)
-            start_date = date.today() - timedelta(days=days_int)
-            query = query.filter(TipEntry.work_date >= start_date)
-        except ValueError:
-            pass
+        # Date filtering
+        if start_date is not None:
+            query = query.filter(entries.work_date >= start_date)
         
         # Group by weekday
-        weekday_stats = query.group_by(TipEntry.weekday).order_by(TipEntry.weekday).all()
+        weekday_stats = query.group_by(entries.weekday).order_by(entries.weekday).all()
         
         # Map weekday numbers to names
         weekday_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
@@ -388,7 +748,8 @@ def get_weekday_stats():
                 'avg_hours': round(float(stat.avg_hours or 0), 2),
                 'avg_tips_per_hour': round(float(stat.avg_tips_per_hour or 0), 2),
                 'avg_sales': round(float(stat.avg_sales or 0), 2),
-                'avg_tip_percentage': round(float(stat.avg_tip_percentage or 0), 2)
+                'avg_tip_percentage': round(float(stat.avg_tip_percentage or 0), 2),
+                'entries': stat.entries
             })
         
         return jsonify({'weekday_stats': result})
@@ -410,32 +771,38 @@ def get_section_stats():
         if not current_user:
             return jsonify({'error': 'Authentication required'}), 401
 
+        # Date range (default last 90 days)
+        days = request.args.get('days', '90')
+        try:
+            start_date = date.today() - timedelta(days=int(days))
+        except ValueError:
+            start_date = None
+
         # Build query for section averages
+        entries = archive.entries(start_date)
         query = db.session.query(
-            TipEntry.section,
-            func.avg(TipEntry.total_tips).label('avg_tips')
-        ).filter(TipEntry.section.isnot(None))
+            entries.section,
+            func.avg(entries.total_tips).label('avg_tips'),
+            func.count(entries.id).label('entries')
+        ).filter(entries.section.isnot(None))
 
         # Role-based filtering
         user = User.query.filter_by(id=current_user['id']).first()
         if not user or user.role != 'manager':
-            query = query.filter(TipEntry.user_id == current_user['id'])
+            query = query.filter(entries.user_id == current_user['id'])
+        query = _exclude_flagged(query, entries)
 
-        # Date filtering (default last 90 days)
-        days = request.args.get('days', '90')
-        try:
-            days_int = int(days)
-            start_date = date.today() - timedelta(days=days_int)
-            query = query.filter(TipEntry.work_date >= start_date)
-        except ValueError:
-            pass
+        # Date filtering
+        if start_date is not None:
+            query = query.filter(entries.work_date >= start_date)
 
-        section_stats = query.group_by(TipEntry.section).order_by(TipEntry.section).all()
+        section_stats = query.group_by(entries.section).order_by(entries.section).all()
 
         result = [
             {
                 'section': stat.section,
-                'avg_tips': round(float(stat.avg_tips or 0), 2)
+                'avg_tips': round(float(stat.avg_tips or 0), 2),
+                'entries': stat.entries
             }
             for stat in section_stats
         ]
@@ -459,28 +826,32 @@ def get_breakdown_stats():
         if not current_user:
             return jsonify({'error': 'Authentication required'}), 401
         
+        # Date range
+        days = request.args.get('days', '30')
+        try:
+            start_date = date.today() - timedelta(days=int(days))
+        except ValueError:
+            start_date = None
+
         # Build query for totals
+        entries = archive.entries(start_date)
         query = db.session.query(
-            func.sum(TipEntry.cash_tips).label('total_cash'),
-            func.sum(TipEntry.card_tips).label('total_card'),
-            func.sum(TipEntry.total_tips).label('total_tips'),
-            func.sum(TipEntry.sales_amount).label('total_sales'),
-            func.sum(TipEntry.hours_worked).label('total_hours')
+            func.sum(entries.cash_tips).label('total_cash'),
+            func.sum(entries.card_tips).label('total_card'),
+            func.sum(entries.total_tips).label('total_tips'),
+            func.sum(entries.sales_amount).label('total_sales'),
+            func.sum(entries.hours_worked).label('total_hours')
         )
         
         # Role-based filtering
         user = User.query.filter_by(id=current_user['id']).first()
         if not user or user.role != 'manager':
-            query = query.filter(TipEntry.user_id == current_user['id'])
+            query = query.filter(entries.user_id == current_user['id'])
+        query = _exclude_flagged(query, entries)
         
         # Date filtering
-        days = request.args.get('days', '30')
-        try:
-            days_int = int(days)
-            start_date = date.today() - timedelta(days=days_int)
-            query = query.filter(TipEntry.work_date >= start_date)
-        except ValueError:
-            pass
+        if start_date is not None:
+            query = query.filter(entries.work_date >= start_date)
         
         result = query.first()
         
@@ -512,7 +883,486 @@ def get_breakdown_stats():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/stats/monthly', methods=['GET'])
+@require_auth
+def get_monthly_stats():
+    """Get monthly totals over long history; archived months come from summaries"""
+    try:
+        demo_mode = request.args.get('demo', 'false').lower() == 'true'
+        if demo_mode:
+            return jsonify(get_demo_data('monthly_stats'))
+
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+
+        try:
+            months = min(max(int(request.args.get('months', '24')), 1), 120)
+        except ValueError:
+            return jsonify({'error': 'Invalid months parameter'}), 400
+        first_month = archive.month_start(date.today())
+        for _ in range(months - 1):
+            first_month = archive.month_start(first_month - timedelta(days=1))
+
+        # Same scope as search: managers see their restaurant, everyone else their own entries
+        user = User.query.filter_by(id=current_user['id']).first()
+
+        def scoped(query, user_id_column):
+            if user and user.role == 'manager':
+                if user.restaurant_id:
+                    query = query.join(User, User.id == user_id_column) \
+                        .filter(User.restaurant_id == user.restaurant_id)
+                return query
+            return query.filter(user_id_column == current_user['id'])
+
+        # Hot entries grouped by day (at most the horizon's worth of rows), archived ones by month
+        hot = scoped(db.session.query(
+            TipEntry.work_date.label('day'),
+            func.sum(TipEntry.total_tips).label('total_tips'),
+            func.sum(TipEntry.hours_worked).label('total_hours'),
+            func.sum(TipEntry.sales_amount).label('total_sales'),
+            func.count(TipEntry.id).label('entries'),
+        ).filter(TipEntry.work_date >= first_month), TipEntry.user_id).group_by(TipEntry.work_date)
+        cold = scoped(db.session.query(
+            TipArchiveSummary.month.label('day'),
+            func.sum(TipArchiveSummary.total_tips).label('total_tips'),
+            func.sum(TipArchiveSummary.hours_worked).label('total_hours'),
+            func.sum(TipArchiveSummary.sales_amount).label('total_sales'),
+            func.sum(TipArchiveSummary.entries).label('entries'),
+        ).filter(TipArchiveSummary.month >= first_month), TipArchiveSummary.user_id) \
+            .group_by(TipArchiveSummary.month)
+
+        totals = {}
+        for row in list(hot) + list(cold):
+            month = totals.setdefault(archive.month_start(row.day), [0.0, 0.0, 0.0, 0])
+            month[0] += float(row.total_tips or 0)
+            month[1] += float(row.total_hours or 0)
+            month[2] += float(row.total_sales or 0)
+            month[3] += int(row.entries or 0)
+
+        result = []
+        for month, (tips, hours, sales, count) in sorted(totals.items()):
+            result.append({
+                'month': month.strftime('%Y-%m'),
+                'total_tips': round(tips, 2),
+                'total_hours': round(hours, 2),
+                'total_sales': round(sales, 2),
+                'tips_per_hour': round(tips / hours, 2) if hours > 0 else 0,
+                'tip_percentage': round(tips / sales * 100, 2) if sales > 0 else 0,
+                'entries': count,
+            })
+
+        return jsonify({'monthly_stats': result})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/stats/heatmap', methods=['GET'])
+@require_auth
+def get_heatmap_stats():
+    """Get all-time tips by weekday and hour of day from the heatmap cube"""
+    try:
+        demo_mode = request.args.get('demo', 'false').lower() == 'true'
+        if demo_mode:
+            return jsonify(get_demo_data('heatmap'))
+
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+
+        section = request.args.get('section')
+        section = section.strip().lower() if section else None
+        by_section = request.args.get('by_section', 'false').lower() == 'true'
+
+        user = User.query.filter_by(id=current_user['id']).first()
+        group_columns = [TipHeatmapCell.weekday, TipHeatmapCell.hour]
+        if by_section:
+            group_columns.append(TipHeatmapCell.section)
+
+        query = db.session.query(
+            *group_columns,
+            func.sum(TipHeatmapCell.total_tips).label('total_tips'),
+            func.sum(TipHeatmapCell.total_sales).label('total_sales'),
+            func.sum(TipHeatmapCell.total_hours).label('total_hours'),
+            func.sum(TipHeatmapCell.shifts).label('shifts'),
+        )
+        if user and user.role == 'manager':
+            if user.restaurant_id:
+                query = query.join(User, User.id == TipHeatmapCell.user_id) \
+                    .filter(User.restaurant_id == user.restaurant_id)
+        else:
+            query = query.filter(TipHeatmapCell.user_id == current_user['id'])
+        if section:
+            query = query.filter(TipHeatmapCell.section == section)
+
+        cells = []
+        for row in query.group_by(*group_columns).all():
+            tips = float(row.total_tips or 0)
+            sales = float(row.total_sales or 0)
+            hours = float(row.total_hours or 0)
+            cell = {
+                'weekday': row.weekday,
+                'hour': row.hour,
+                'total_tips': round(tips, 2),
+                'total_sales': round(sales, 2),
+                'total_hours': round(hours, 2),
+                'tips_per_hour': round(tips / hours, 2) if hours > 0 else 0,
+                'tip_percentage': round(tips / sales * 100, 2) if sales > 0 else 0,
+                'shifts': int(row.shifts or 0),
+            }
+            if by_section:
+                cell['section'] = row.section or None
+            cells.append(cell)
+        cells.sort(key=lambda c: (c['weekday'], c['hour'], c.get('section') or ''))
+
+        return jsonify({'heatmap': cells})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _supports_window_functions():
+    """SQLite only gained window functions in 3.25"""
+    return db.engine.dialect.name != 'sqlite' or sqlite3.sqlite_version_info >= (3, 25)
+
+def _competition_rank(rows, key):
+    """1224-style ranking, used when the database can't run RANK()"""
+    ranks = {}
+    ordered = sorted(rows, key=key, reverse=True)
+    for i, row in enumerate(ordered):
+        if i and key(row) == key(ordered[i - 1]):
+            ranks[id(row)] = ranks[id(ordered[i - 1])]
+        else:
+            ranks[id(row)] = i + 1
+    return ranks
+
+@api_bp.route('/stats/team', methods=['GET'])
+@replica.use_primary
+@require_auth
+def get_team_stats():
+    """Get per-server leaderboard with deltas against the previous period"""
+    try:
+        demo_mode = request.args.get('demo', 'false').lower() == 'true'
+        if demo_mode:
+            return jsonify(get_demo_data('team_stats'))
+
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+
+        user = User.query.filter_by(id=current_user['id']).first()
+        if not user or user.role != 'manager':
+            return jsonify({'error': 'Manager role required'}), 403
+
+        # Date window (same parameters as get_tips)
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        if start_date and end_date:
+            try:
+                start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+                end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        else:
+            try:
+                days_int = int(request.args.get('days', '30'))
+            except ValueError:
+                return jsonify({'error': 'Invalid days parameter'}), 400
+            end_date = date.today()
+            start_date = end_date - timedelta(days=days_int)
+        if start_date > end_date:
+            return jsonify({'error': 'start_date must be before end_date'}), 400
+
+        period_days = (end_date - start_date).days + 1
+        prev_start = start_date - timedelta(days=period_days)
+        prev_end = start_date - timedelta(days=1)
+
+        scope = user.restaurant_id
+        cache_key = ('team', start_date.isoformat(), end_date.isoformat(), _exclude_flagged_requested())
+        cached = stats_cache.get(scope, cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
+        # One pass over both periods: conditional sums split current vs previous
+        entries = archive.entries(prev_start)
+        in_current = entries.work_date >= start_date
+        cur_tips = func.sum(case((in_current, entries.total_tips), else_=0))
+        cur_hours = func.sum(case((in_current, entries.hours_worked), else_=0))
+        cur_sales = func.sum(case((in_current, entries.sales_amount), else_=0))
+        cur_entries = func.sum(case((in_current, 1), else_=0))
+        prev_tips = func.sum(case((in_current, 0), else_=entries.total_tips))
+        prev_hours = func.sum(case((in_current, 0), else_=entries.hours_worked))
+        prev_sales = func.sum(case((in_current, 0), else_=entries.sales_amount))
+        prev_entries = func.sum(case((in_current, 0), else_=1))
+
+        columns = [
+            entries.user_id,
+            User.name.label('user_name'),
+            cur_tips.label('cur_tips'), cur_hours.label('cur_hours'),
+            cur_sales.label('cur_sales'), cur_entries.label('cur_entries'),
+            prev_tips.label('prev_tips'), prev_hours.label('prev_hours'),
+            prev_sales.label('prev_sales'), prev_entries.label('prev_entries'),
+        ]
+        use_window = _supports_window_functions()
+        if use_window:
+            columns += [
+                func.rank().over(order_by=cur_tips.desc()).label('rank'),
+                func.rank().over(order_by=prev_tips.desc()).label('prev_rank'),
+            ]
+
+        query = db.session.query(*columns).join(User, User.id == entries.user_id).filter(
+            entries.work_date >= prev_start,
+            entries.work_date <= end_date,
+        )
+        if scope:
+            query = query.filter(User.restaurant_id == scope)
+        query = _exclude_flagged(query, entries)
+        rows = query.group_by(entries.user_id, User.name).all()
+
+        if use_window:
+            ranks = {id(r): r.rank for r in rows}
+            prev_ranks = {id(r): r.prev_rank for r in rows}
+        else:
+            ranks = _competition_rank(rows, key=lambda r: float(r.cur_tips or 0))
+            prev_ranks = _competition_rank(rows, key=lambda r: float(r.prev_tips or 0))
+
+        def summarize(tips, hours, sales, entries):
+            tips, hours, sales = float(tips or 0), float(hours or 0), float(sales or 0)
+            return {
+                'total_tips': round(tips, 2),
+                'total_hours': round(hours, 2),
+                'total_sales': round(sales, 2),
+                'tips_per_hour': round(tips / hours, 2) if hours > 0 else 0,
+                'tip_percentage': round(tips / sales * 100, 2) if sales > 0 else 0,
+                'entries': int(entries or 0),
+            }
+
+        team = []
+        for row in rows:
+            current = summarize(row.cur_tips, row.cur_hours, row.cur_sales, row.cur_entries)
+            previous = summarize(row.prev_tips, row.prev_hours, row.prev_sales, row.prev_entries)
+            rank = ranks[id(row)]
+            prev_rank = prev_ranks[id(row)] if previous['entries'] else None
+            team.append({
+                'user_id': row.user_id,
+                'user_name': row.user_name,
+                'rank': rank,
+                **current,
+                'previous': {**previous, 'rank': prev_rank},
+                'delta': {
+                    'total_tips': round(current['total_tips'] - previous['total_tips'], 2),
+                    'tips_per_hour': round(current['tips_per_hour'] - previous['tips_per_hour'], 2),
+                    'tip_percentage': round(current['tip_percentage'] - previous['tip_percentage'], 2),
+                    'rank': (prev_rank - rank) if prev_rank is not None else None,
+                },
+            })
+        team.sort(key=lambda t: (t['rank'], t['user_name'] or ''))
+
+        result = {
+            'period': {'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()},
+            'previous_period': {'start_date': prev_start.isoformat(), 'end_date': prev_end.isoformat()},
+            'team': team,
+        }
+        stats_cache.set(scope, cache_key, result)
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _require_manager():
+    """Return (user, None) for a manager, or (None, error response)"""
+    current_user = get_current_user()
+    if not current_user:
+        return None, (jsonify({'error': 'Authentication required'}), 401)
+    user = User.query.filter_by(id=current_user['id']).first()
+    if not user or user.role != 'manager':
+        return None, (jsonify({'error': 'Manager role required'}), 403)
+    return user, None
+
+@api_bp.route('/pool/rules', methods=['GET'])
+@require_auth
+def get_pool_rules():
+    """Get the tip pool rules for the manager's restaurant"""
+    try:
+        user, error = _require_manager()
+        if error:
+            return error
+
+        rules = TipPoolRule.query.filter(
+            tip_pool.scope_filter(TipPoolRule.restaurant_id, user.restaurant_id)
+        ).order_by(TipPoolRule.id).all()
+        return jsonify({'rules': [r.to_dict() for r in rules]})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/pool/rules', methods=['PUT'])
+@require_auth
+def replace_pool_rules():
+    """Replace the tip pool rules for the manager's restaurant"""
+    try:
+        user, error = _require_manager()
+        if error:
+            return error
+
+        data = request.get_json() or {}
+        try:
+            rules = tip_pool.validate_rules(data.get('rules'))
+        except tip_pool.PoolRuleError as e:
+            return jsonify({'errors': [str(e)]}), 400
+
+        tip_pool.replace_rules(user.restaurant_id, rules)
+        return jsonify({'success': True, 'rules': rules})
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/pool/snapshots', methods=['POST'])
+@require_auth
+def create_pool_snapshot():
+    """Compute and store the tip pool distribution for a pay period"""
+    try:
+        user, error = _require_manager()
+        if error:
+            return error
+
+        data = request.get_json() or {}
+        try:
+            period_start = datetime.strptime(data.get('period_start', ''), '%Y-%m-%d').date()
+            period_end = datetime.strptime(data.get('period_end', ''), '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return jsonify({'error': 'period_start and period_end are required (YYYY-MM-DD)'}), 400
+        if period_start > period_end:
+            return jsonify({'error': 'period_start must be before period_end'}), 400
+        if (period_end - period_start).days > 62:
+            return jsonify({'error': 'Pay periods cannot exceed 62 days'}), 400
+
+        try:
+            snapshot = tip_pool.create_snapshot(user.restaurant_id, period_start, period_end)
+        except tip_pool.PoolRuleError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify({'success': True, 'snapshot': snapshot.to_dict()}), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/pool/snapshots', methods=['GET'])
+@require_auth
+def get_pool_snapshots():
+    """List payroll snapshots for the manager's restaurant, newest period first"""
+    try:
+        user, error = _require_manager()
+        if error:
+            return error
+
+        snapshots = PayrollSnapshot.query.filter(
+            tip_pool.scope_filter(PayrollSnapshot.restaurant_id, user.restaurant_id)
+        ).order_by(PayrollSnapshot.period_start.desc(), PayrollSnapshot.id.desc()).limit(50).all()
+        return jsonify({'snapshots': [s.to_dict(include_lines=False) for s in snapshots]})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/pool/snapshots/<int:snapshot_id>', methods=['GET'])
+@require_auth
+def get_pool_snapshot(snapshot_id):
+    """Get one payroll snapshot with per-person lines"""
+    try:
+        user, error = _require_manager()
+        if error:
+            return error
+
+        snapshot = PayrollSnapshot.query.filter(
+            PayrollSnapshot.id == snapshot_id,
+            tip_pool.scope_filter(PayrollSnapshot.restaurant_id, user.restaurant_id),
+        ).first()
+        if not snapshot:
+            return jsonify({'error': 'Snapshot not found'}), 404
+
+        result = snapshot.to_dict()
+        result['lines'].sort(key=lambda line: line['user_name'] or '')
+        return jsonify({'snapshot': result})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/jobs', methods=['GET'])
+@require_auth
+def get_jobs():
+    """Scheduled job metrics for this worker plus each job's last recorded run"""
+    try:
+        user, error = _require_manager()
+        if error:
+            return error
+
+        result = scheduler.metrics()
+        recorded = last_runs()
+        for job in result['jobs']:
+            job['last_run'] = recorded.get(job['name'])
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/admission', methods=['GET'])
+@admission.exempt
+@require_auth
+def get_admission():
+    """Admission control limits, queue depth and shed counts for this worker"""
+    try:
+        user, error = _require_manager()
+        if error:
+            return error
+        return jsonify(admission.controller.metrics())
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/stream', methods=['GET'])
+@admission.exempt
+@require_auth
+def stream_events():
+    """Stream tip changes in the caller's scope as Server-Sent Events"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    user = User.query.filter_by(id=current_user['id']).first()
+    is_manager = bool(user and user.role == 'manager')
+    user_id = current_user['id']
+
+    # Same scope as the REST endpoints: managers see everything, servers their own
+    def in_scope(event):
+        return is_manager or event.get('user_id') == user_id
+
+    subscription = bus.subscribe(in_scope)
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                events, overflowed = subscription.drain(SSE_HEARTBEAT_SECONDS)
+                if overflowed:
+                    # Buffer dropped events; the client must refetch
+                    yield 'event: resync\ndata: {}\n\n'
+                    continue
+                if not events:
+                    yield ': heartbeat\n\n'
+                    continue
+                for event in events:
+                    yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            bus.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
 @api_bp.route('/user/role', methods=['GET'])
+@replica.use_primary
 @require_auth
 def get_user_role():
     """Get current user's role"""
@@ -0,0 +1,175 @@
+"""Hot/cold tiering for tip entries.
+
+Entries whose work_date is older than ARCHIVE_HORIZON_DAYS are moved
+from tip_entries into tip_entries_archive (range-partitioned by month on
+Postgres, a plain table on SQLite) and added to the monthly
+tip_archive_summaries. tip_entries and its indexes then only ever hold
+the horizon, whatever the length of history.
+
+Reads go through entries(start_date): a range starting inside the
+horizon queries tip_entries alone, one reaching further back gets
+TipEntry aliased over a UNION ALL of both tables. Archived entries are
+read-only -- edits, deletes, bulk changes, search and anomaly scoring
+only see hot rows -- but still count in the heatmap cube and payroll
+snapshots.
+
+    python archive.py
+"""
+import logging
+import os
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import delete, select, text, union_all
+from sqlalchemy.orm import aliased
+
+from app import db
+from models import TipEntry, TipEntryArchive, TipArchiveSummary, TipEntryFlag
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_HORIZON_DAYS = int(os.environ.get("ARCHIVE_HORIZON_DAYS", "400"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "5000"))
+
+COLUMNS = [column.name for column in TipEntry.__table__.columns]
+SUMMED = ('cash_tips', 'card_tips', 'total_tips', 'hours_worked', 'sales_amount')
+
+HOT = TipEntry.__table__
+COLD = TipEntryArchive.__table__
+
+
+def horizon():
+    """Oldest work_date kept in tip_entries"""
+    return date.today() - timedelta(days=ARCHIVE_HORIZON_DAYS)
+
+
+def reaches_archive(start_date):
+    return start_date is None or start_date < horizon()
+
+
+def entries(start_date=None):
+    """Entity to query tip entries from for a range starting at start_date (None: all history).
+
+    TipEntry itself when the range is inside the horizon. Otherwise
+    TipEntry aliased over hot UNION ALL archive, with start_date applied
+    to both sides so Postgres only scans the partitions it needs.
+    """
+    if not reaches_archive(start_date):
+        return TipEntry
+    hot = select(*(HOT.c[name] for name in COLUMNS))
+    cold = select(*(COLD.c[name] for name in COLUMNS))
+    if start_date is not None:
+        hot = hot.where(HOT.c.work_date >= start_date)
+        cold = cold.where(COLD.c.work_date >= start_date)
+    return aliased(TipEntry, union_all(hot, cold).subquery('tip_entries_all'))
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def _ensure_partitions(first_day, last_day):
+    """Create the monthly archive partitions covering [first_day, last_day] (Postgres only)"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    month = month_start(first_day)
+    while month <= last_day:
+        following = _next_month(month)
+        db.session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {COLD.name}_{month:%Y%m} PARTITION OF {COLD.name} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+        ))
+        month = following
+
+
+def summary_rows(rows, sign=1):
+    """Monthly summary increments for entry rows (sign=-1 to take them back out)"""
+    summaries = {}
+    for row in rows:
+        key = (row.user_id, month_start(row.work_date), row.weekday, row.section or '')
+        summary = summaries.get(key)
+        if summary is None:
+            summary = summaries[key] = {
+                'user_id': key[0], 'month': key[1], 'weekday': key[2], 'section': key[3],
+                **{column: Decimal(0) for column in SUMMED},
+                'tips_per_hour_sum': Decimal(0),
+                'entries': 0,
+            }
+        for column in SUMMED:
+            summary[column] += Decimal(getattr(row, column)) * sign
+        summary['tips_per_hour_sum'] += Decimal(row.tips_per_hour) * sign
+        summary['entries'] += sign
+    return list(summaries.values())
+
+
+def _upsert_summaries(rows, batch_size=500):
+    table = TipArchiveSummary.__table__
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    added = SUMMED + ('tips_per_hour_sum', 'entries')
+    for i in range(0, len(rows), batch_size):
+        stmt = insert(table).values(rows[i:i + batch_size])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'month', 'weekday', 'section'],
+            set_={column: table.c[column] + stmt.excluded[column] for column in added},
+        )
+        db.session.execute(stmt)
+
+
+def _move_batch(source, dest, condition, sign):
+    """Move up to ARCHIVE_BATCH_SIZE rows matching condition from source to dest and commit.
+
+    sign=1 archives (adds to summaries), sign=-1 restores. Returns rows moved.
+    """
+    ids = db.session.execute(
+        select(source.c.id).where(condition).order_by(source.c.id)
+        .limit(ARCHIVE_BATCH_SIZE).with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not ids:
+        return 0
+
+    rows = db.session.execute(select(*(source.c[name] for name in COLUMNS)).where(source.c.id.in_(ids))).all()
+    if dest is COLD:
+        _ensure_partitions(min(r.work_date for r in rows), max(r.work_date for r in rows))
+    db.session.execute(dest.insert(), [dict(row._mapping) for row in rows])
+    _upsert_summaries(summary_rows(rows, sign))
+
+    if source is HOT:
+        # Flags describe hot rows only (and SQLite doesn't cascade)
+        db.session.execute(delete(TipEntryFlag).where(TipEntryFlag.tip_id.in_(ids)))
+    db.session.execute(delete(source).where(source.c.id.in_(ids)))
+    if sign < 0:
+        db.session.execute(delete(TipArchiveSummary).where(TipArchiveSummary.entries <= 0))
+    db.session.commit()
+    return len(ids)
+
+
+def run():
+    """Archive entries past the horizon; returns a summary dict.
+
+    Archived rows that are inside the horizon again (ARCHIVE_HORIZON_DAYS
+    was raised) are moved back first.
+    """
+    cutoff = horizon()
+    restored = archived = 0
+    while moved := _move_batch(COLD, HOT, COLD.c.work_date >= cutoff, -1):
+        restored += moved
+    while moved := _move_batch(HOT, COLD, HOT.c.work_date < cutoff, 1):
+        archived += moved
+    summary = {'horizon': cutoff.isoformat(), 'archived': archived, 'restored': restored}
+    logger.info("Archive: %s", summary)
+    return summary
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        print(run())
@@ -0,0 +1,170 @@
+"""Build-time static asset pipeline.
+
+`python assets.py` minifies the CSS and JS under static/, names each
+file after a hash of its contents (js/app.js -> js/app.3f2a1b9c04de.js),
+writes .gz (and .br, with the optional brotli package) variants next to
+it in static/dist/, and records the names in static/dist/manifest.json.
+
+Templates link assets with asset_url('js/app.js'). With a manifest that
+resolves to /assets/<hashed name>, served with a one-year immutable
+Cache-Control and the best precompressed variant the client accepts;
+without one (development) it falls back to the plain /static/ URL.
+JS is minified only when the optional rjsmin package is installed.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import request, send_from_directory, url_for
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+ASSET_MAX_AGE = int(os.environ.get("ASSET_MAX_AGE", str(365 * 24 * 3600)))
+
+# Formats worth precompressing; images are hashed and copied as they are
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.map')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+manifest = {}
+
+
+# ---------- build ----------
+
+CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/)', re.S)
+
+
+def minify_css(source):
+    """Drop comments and collapse whitespace outside strings"""
+    out = []
+    for i, token in enumerate(CSS_TOKENS.split(source)):
+        if i % 2:
+            if not token.startswith('/*'):
+                out.append(token)
+            continue
+        token = re.sub(r'\s+', ' ', token)
+        token = re.sub(r' ?([{};,>]) ?', r'\1', token)
+        out.append(token.replace(';}', '}'))
+    return ''.join(out).strip()
+
+
+def minify_js(source):
+    try:
+        import rjsmin
+    except ImportError:
+        return source
+    return rjsmin.jsmin(source)
+
+
+def _minify(path, data):
+    if path.endswith('.css'):
+        return minify_css(data.decode('utf-8')).encode('utf-8')
+    if path.endswith('.js'):
+        return minify_js(data.decode('utf-8')).encode('utf-8')
+    return data
+
+
+def _hashed_name(path, data):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Rebuild dist_dir from static_dir; returns the manifest"""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        logger.warning("brotli is not installed; building gzip variants only")
+
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    built = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            path = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = _minify(path, f.read())
+
+            name = _hashed_name(path, data)
+            target = os.path.join(dist_dir, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            if path.endswith(COMPRESSIBLE):
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(data, 9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(data, quality=11))
+            built[path] = name
+
+    with open(os.path.join(dist_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(built, f, indent=2, sort_keys=True)
+    return built
+
+
+# ---------- serving ----------
+
+def load_manifest(path=MANIFEST_PATH):
+    manifest.clear()
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest.update(json.load(f))
+    except FileNotFoundError:
+        logger.info("No asset manifest at %s; serving unhashed static files", path)
+    return manifest
+
+
+def asset_url(path):
+    """URL for a file under static/: the hashed build when there is one"""
+    name = manifest.get(path)
+    if name is None:
+        return url_for('static', filename=path)
+    return url_for('assets', filename=name)
+
+
+def serve(filename):
+    """Serve a built asset, precompressed when the client accepts it"""
+    path = safe_join(DIST_DIR, filename)
+    if path is None or filename.endswith(('.gz', '.br')) or not os.path.isfile(path):
+        raise NotFound()
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            encoding, filename = name, filename + suffix
+            break
+
+    response = send_from_directory(DIST_DIR, filename, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    load_manifest()
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve)
+    app.add_template_global(asset_url)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    result = build()
+    for path, name in sorted(result.items()):
+        print(f"{path} -> {name}")
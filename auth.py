@@ -1,5 +1,7 @@
+import jwt
 from flask import Blueprint, request, jsonify, session, current_app
 from supabase import create_client
+import sessions
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -11,6 +13,37 @@ def get_supabase_client():
         return None
     return create_client(url, key)
 
+def verify_access_token(access_token):
+    """Resolve a Supabase access token to a user dict, or None if invalid.
+
+    When SUPABASE_JWT_SECRET is configured the token is verified locally
+    (no round trip to Supabase); otherwise Supabase is asked directly.
+    """
+    secret = current_app.config.get("SUPABASE_JWT_SECRET")
+    if secret:
+        try:
+            claims = jwt.decode(access_token, secret, algorithms=['HS256'], audience='authenticated')
+        except jwt.InvalidTokenError:
+            return None
+        metadata = claims.get('user_metadata') or {}
+        return {
+            'id': claims['sub'],
+            'email': claims.get('email'),
+            'name': metadata.get('name', ''),
+        }
+
+    supabase = get_supabase_client()
+    if not supabase:
+        return None
+    user_response = supabase.auth.get_user(access_token)
+    if user_response and user_response.user:
+        return {
+            'id': user_response.user.id,
+            'email': user_response.user.email,
+            'name': user_response.user.user_metadata.get('name', '') if user_response.user.user_metadata else '',
+        }
+    return None
+
 @auth_bp.route('/session', methods=['POST'])
 def set_session():
     """Set user session from Supabase auth"""
@@ -21,22 +54,16 @@ def set_session():
         if not access_token:
             return jsonify({'error': 'Access token required'}), 400
         
-        # Verify token with Supabase
-        supabase = get_supabase_client()
-        if supabase:
-            try:
-                user_response = supabase.auth.get_user(access_token)
-                if user_response and user_response.user:
-                    session['user'] = {
-                        'id': user_response.user.id,
-                        'email': user_response.user.email,
-                        'name': user_response.user.user_metadata.get('name', '') if user_response.user.user_metadata else '',
-                        'access_token': access_token
-                    }
-                    return jsonify({'success': True})
-            except Exception as auth_error:
-                return jsonify({'error': f'Authentication failed: {str(auth_error)}'}), 401
-        
+        # Verify token (locally or with Supabase)
+        try:
+            user = verify_access_token(access_token)
+        except Exception as auth_error:
+            return jsonify({'error': f'Authentication failed: {str(auth_error)}'}), 401
+
+        if user:
+            session['user'] = {**user, 'access_token': access_token}
+            return jsonify({'success': True})
+
         return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -47,6 +74,17 @@ def logout():
     session.clear()
     return jsonify({'success': True})
 
+@auth_bp.route('/logout-all', methods=['POST'])
+def logout_all():
+    """Revoke every session of the current user, on all devices"""
+    user = session.get('user')
+    if not user:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    revoked = sessions.revoke_user(user['id'])
+    session.clear()
+    return jsonify({'success': True, 'revoked': revoked})
+
 @auth_bp.route('/user', methods=['GET'])
 def get_user():
     """Get current user"""
@@ -0,0 +1,247 @@
+"""Endpoint benchmark suite.
+
+Loads seeded datasets of increasing size (see demo_data.bulk_load), times
+every api_bp endpoint for a server and a manager session, writes the
+results as JSON and optionally fails when latency regresses past a stored
+baseline.
+
+    python benchmark.py --sizes small,medium --output bench.json
+    python benchmark.py --sizes small --baseline bench_baseline.json
+    python benchmark.py --sizes small --save-baseline bench_baseline.json
+
+By default a throwaway SQLite file is used. Pass --database-url to run
+against a local Postgres (its users/tip_entries tables are truncated).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# restaurants x servers x years
+SIZES = {
+    'small': (1, 10, 1),
+    'medium': (3, 25, 2),
+    'large': (10, 40, 3),
+    'xlarge': (20, 50, 4),  # ~1M tip entries
+}
+
+# (name, method, path) -- every api_bp route should appear here at least once
+ENDPOINTS = [
+    ('tips_30d', 'GET', '/api/tips?days=30'),
+    ('tips_365d', 'GET', '/api/tips?days=365'),
+    ('tip_changes_full', 'GET', '/api/tips/changes?days=30'),
+    ('tips_search', 'GET', '/api/tips/search?q=busy'),
+    ('tips_flagged', 'GET', '/api/tips/flagged'),
+    ('sections', 'GET', '/api/sections'),
+    ('stats_daily', 'GET', '/api/stats/daily?days=30'),
+    ('stats_daily_unflagged', 'GET', '/api/stats/daily?days=30&exclude_flagged=true'),
+    ('stats_weekday', 'GET', '/api/stats/weekday?days=90'),
+    ('stats_section', 'GET', '/api/stats/section?days=90'),
+    ('stats_breakdown', 'GET', '/api/stats/breakdown?days=30'),
+    ('stats_breakdown_3y', 'GET', '/api/stats/breakdown?days=1095'),
+    ('stats_monthly', 'GET', '/api/stats/monthly?months=36'),
+    ('stats_heatmap', 'GET', '/api/stats/heatmap'),
+    ('stats_team', 'GET', '/api/stats/team?days=30'),
+    ('pool_rules', 'GET', '/api/pool/rules'),
+    ('pool_snapshots', 'GET', '/api/pool/snapshots'),
+    ('jobs', 'GET', '/api/jobs'),
+    ('admission', 'GET', '/api/admission'),
+    ('user_role', 'GET', '/api/user/role'),
+    ('create_delete_tip', 'POST', '/api/tips'),
+]
+
+# Endpoints that answer 403 for non-managers
+MANAGER_ONLY = {'stats_team', 'pool_rules', 'pool_snapshots', 'jobs', 'admission'}
+
+# Routes intentionally left out of the timing run
+SKIPPED_ROUTES = {'/api/requests', '/api/stream', '/api/tips/bulk', '/api/tips/bulk-delete'}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(samples):
+    return {
+        'n': len(samples),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def login(client, user):
+    """Attach a Flask session for `user` to the test client"""
+    with client.session_transaction() as sess:
+        sess['user'] = {'id': user['id'], 'email': user['email'], 'name': user['name']}
+
+
+def uncovered_routes(app):
+    covered = {path.split('?')[0] for _, _, path in ENDPOINTS}
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if not rule.endpoint.startswith('api.') or rule.rule in SKIPPED_ROUTES:
+            continue
+        if '<' in rule.rule:
+            continue  # parameterised routes are exercised by their parent scenario
+        if rule.rule not in covered:
+            missing.append(rule.rule)
+    return sorted(set(missing))
+
+
+def time_endpoint(client, method, path, iterations, warmup):
+    samples = []
+    for i in range(warmup + iterations):
+        start = time.perf_counter()
+        if method == 'POST' and path == '/api/tips':
+            resp = client.post(path, json={
+                'cash_tips': 20, 'card_tips': 80, 'hours_worked': 6,
+                'sales_amount': 500, 'section': 'bar', 'comments': 'benchmark',
+            })
+            if resp.status_code == 201:
+                client.delete(f"/api/tips/{resp.get_json()['tip_entry']['id']}")
+        else:
+            resp = client.open(path, method=method)
+        elapsed = (time.perf_counter() - start) * 1000
+        if resp.status_code >= 400:
+            raise RuntimeError(f'{method} {path} returned {resp.status_code}: {resp.get_data(as_text=True)[:200]}')
+        if i >= warmup:
+            samples.append(elapsed)
+    return summarize(samples)
+
+
+def run(sizes, iterations, warmup, seed):
+    from app import app
+    import archive
+    import demo_data
+
+    missing = uncovered_routes(app)
+    if missing:
+        print(f'WARNING: api routes not benchmarked: {", ".join(missing)}', file=sys.stderr)
+
+    results = {}
+    for size in sizes:
+        restaurants, servers, years = SIZES[size]
+        load_start = time.perf_counter()
+        user_count, tip_count = demo_data.bulk_load(
+            restaurants=restaurants, servers=servers, years=years, seed=seed, truncate=True)
+        print(f'[{size}] loaded {user_count} users / {tip_count} tips '
+              f'in {time.perf_counter() - load_start:.1f}s')
+        with app.app_context():
+            # Match production, where the nightly archive job keeps tip_entries to the horizon
+            archived = archive.run()['archived']
+        print(f'[{size}] archived {archived} tips past the horizon')
+
+        users = demo_data.generate_users(restaurants, servers, 1, seed)
+        scopes = {
+            'server': next(u for u in users if u['role'] == 'server'),
+            'manager': next(u for u in users if u['role'] == 'manager'),
+        }
+        results[size] = {'tip_entries': tip_count, 'scopes': {}}
+        for scope, user in scopes.items():
+            client = app.test_client()
+            login(client, user)
+            scope_results = {}
+            for name, method, path in ENDPOINTS:
+                if name in MANAGER_ONLY and scope != 'manager':
+                    continue
+                scope_results[name] = time_endpoint(client, method, path, iterations, warmup)
+                print(f'[{size}/{scope}] {name:<20} p50={scope_results[name]["p50_ms"]:8.2f}ms '
+                      f'p95={scope_results[name]["p95_ms"]:8.2f}ms')
+            results[size]['scopes'][scope] = scope_results
+    return results
+
+
+def compare(results, baseline, tolerance, slack_ms):
+    """Return a list of regressions (p50 above baseline * (1 + tolerance) + slack)"""
+    regressions = []
+    for size, size_data in results.items():
+        base_size = baseline.get('results', {}).get(size)
+        if not base_size:
+            continue
+        for scope, endpoints in size_data['scopes'].items():
+            for name, stats in endpoints.items():
+                base = base_size.get('scopes', {}).get(scope, {}).get(name)
+                if not base:
+                    continue
+                limit = base['p50_ms'] * (1 + tolerance) + slack_ms
+                if stats['p50_ms'] > limit:
+                    regressions.append(
+                        f'{size}/{scope}/{name}: p50 {stats["p50_ms"]:.2f}ms > {limit:.2f}ms '
+                        f'(baseline {base["p50_ms"]:.2f}ms)'
+                    )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Tip Tracker API endpoints')
+    parser.add_argument('--database-url', help='Database to load and benchmark (default: temp SQLite file)')
+    parser.add_argument('--sizes', default='small', help=f'Comma separated: {",".join(SIZES)}')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--baseline', help='Fail if p50 regresses past this baseline JSON')
+    parser.add_argument('--save-baseline', help='Write results as a new baseline JSON')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative p50 regression')
+    parser.add_argument('--slack-ms', type=float, default=2.0, help='Allowed absolute p50 regression')
+    args = parser.parse_args()
+
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f'Unknown size(s): {", ".join(unknown)}')
+
+    # Scheduled jobs (anomaly passes etc.) would skew the timings
+    os.environ.setdefault('SCHEDULER_ENABLED', '0')
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        fd, path = tempfile.mkstemp(prefix='tiptracker-bench-', suffix='.db')
+        os.close(fd)
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    results = run(sizes, args.iterations, args.warmup, args.seed)
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'database': os.environ['DATABASE_URL'].split('://', 1)[0],
+            'iterations': args.iterations,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+        if regressions:
+            print('Latency regressions:', file=sys.stderr)
+            for line in regressions:
+                print(f'  {line}', file=sys.stderr)
+            return 1
+        print('No regressions against baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""Set-based bulk edit and delete for /api/tips/bulk and /api/tips/bulk-delete.
+
+Rows are selected (and locked on Postgres) once, changed with a single
+UPDATE or DELETE, and every derived structure -- computed columns,
+tombstones, the heatmap cube and payroll snapshots -- is adjusted in the
+same transaction. The caller commits and then publishes events.
+"""
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import case, cast, delete, func, insert, literal, select, update
+
+from app import db
+from models import User, TipEntry, TipEntryTombstone
+from events import publish_bulk_event, publish_tip_event
+import heatmap
+import tip_pool
+
+BULK_MAX_ROWS = int(os.environ.get("BULK_MAX_ROWS", "5000"))
+# Above this many rows, dashboards get one tips_bulk_changed event per user
+# instead of a created/deleted event per row
+BULK_ROW_EVENTS_MAX = int(os.environ.get("BULK_ROW_EVENTS_MAX", "50"))
+
+NO_OWNER = (None, None, None)  # (name, role, restaurant_id)
+
+EDITABLE_FIELDS = ('cash_tips', 'card_tips', 'hours_worked', 'sales_amount', 'section', 'comments', 'work_date')
+
+
+class BulkError(ValueError):
+    """Raised for a malformed selection or change set"""
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d').date()
+    except ValueError:
+        raise BulkError(f'{name} must be a date (YYYY-MM-DD)')
+
+
+def parse_selection(data):
+    """Return (ids, filters) from {"ids": [...]} or {"filter": {...}}"""
+    ids = data.get('ids')
+    filters = data.get('filter')
+    if (ids is None) == (filters is None):
+        raise BulkError('Provide either ids or filter')
+
+    if ids is not None:
+        if not isinstance(ids, list) or not ids:
+            raise BulkError('ids must be a non-empty list')
+        try:
+            ids = sorted({int(i) for i in ids})
+        except (TypeError, ValueError):
+            raise BulkError('ids must be integers')
+        if len(ids) > BULK_MAX_ROWS:
+            raise BulkError(f'At most {BULK_MAX_ROWS} ids per request')
+        return ids, None
+
+    if not isinstance(filters, dict):
+        raise BulkError('filter must be an object')
+    if 'start_date' not in filters or 'end_date' not in filters:
+        raise BulkError('filter requires start_date and end_date')
+    parsed = {
+        'start_date': _parse_date(filters['start_date'], 'start_date'),
+        'end_date': _parse_date(filters['end_date'], 'end_date'),
+    }
+    if parsed['start_date'] > parsed['end_date']:
+        raise BulkError('start_date must be before end_date')
+    if filters.get('section') is not None:
+        parsed['section'] = str(filters['section']).strip().lower() or None
+    if filters.get('user_id'):
+        parsed['user_id'] = str(filters['user_id'])
+    if filters.get('weekday') is not None:
+        try:
+            parsed['weekday'] = int(filters['weekday'])
+        except (TypeError, ValueError):
+            raise BulkError('weekday must be 0-6')
+        if not 0 <= parsed['weekday'] <= 6:
+            raise BulkError('weekday must be 0-6')
+    return None, parsed
+
+
+def validate_changes(data):
+    """Validate a {"set": {...}} change set with the same rules as validate_tip_entry"""
+    changes = data.get('set')
+    if not isinstance(changes, dict) or not changes:
+        raise BulkError('set must be a non-empty object')
+    unknown = sorted(set(changes) - set(EDITABLE_FIELDS))
+    if unknown:
+        raise BulkError(f'Fields cannot be bulk edited: {", ".join(unknown)}')
+
+    validated = {}
+    for field in ('cash_tips', 'card_tips', 'hours_worked', 'sales_amount'):
+        if field not in changes:
+            continue
+        label = field.replace('_', ' ').capitalize()
+        try:
+            value = round(float(changes[field]), 2)
+        except (TypeError, ValueError):
+            raise BulkError(f'{label} must be a valid number')
+        if field == 'hours_worked':
+            if value <= 0 or value > 24:
+                raise BulkError('Hours worked must be greater than 0 and at most 24')
+        elif value < 0:
+            raise BulkError(f'{label} cannot be negative')
+        validated[field] = value
+
+    if 'section' in changes:
+        section = changes['section']
+        if section is not None:
+            section = str(section).strip().lower() or None
+        if section and len(section) > 50:
+            raise BulkError('Section cannot exceed 50 characters')
+        validated['section'] = section
+
+    if 'comments' in changes:
+        comments = changes['comments']
+        if comments is not None:
+            comments = str(comments).strip() or None
+        if comments and len(comments) > 500:
+            raise BulkError('Comments cannot exceed 500 characters')
+        validated['comments'] = comments
+
+    if 'work_date' in changes:
+        work_date = _parse_date(changes['work_date'], 'work_date')
+        if work_date > date.today():
+            raise BulkError('Work date cannot be in the future')
+        validated['work_date'] = work_date
+    return validated
+
+
+def check_rows(rows, changes):
+    """Apply the per-row rules of validate_tip_entry to the selected rows.
+
+    A new hours_worked can't exceed the shift length of any row that has
+    shift_start/shift_end set.
+    """
+    if 'hours_worked' not in changes:
+        return
+    too_long = [row.id for row in rows
+                if heatmap.exceeds_shift(changes['hours_worked'], row.shift_start, row.shift_end)]
+    if too_long:
+        shown = ', '.join(str(i) for i in too_long[:10]) + (', ...' if len(too_long) > 10 else '')
+        raise BulkError(f'Hours worked cannot exceed the shift length (entries {shown})')
+
+
+def select_rows(user, current_user_id, ids, filters):
+    """Lock and load the entries a request may touch.
+
+    Managers reach their restaurant's entries (every entry without a
+    restaurant), everyone else only their own. Raises BulkError when a
+    filter matches more than BULK_MAX_ROWS entries.
+    """
+    query = TipEntry.query
+    if user and user.role == 'manager':
+        if user.restaurant_id:
+            query = query.filter(TipEntry.user_id.in_(
+                select(User.id).where(User.restaurant_id == user.restaurant_id)))
+    else:
+        query = query.filter(TipEntry.user_id == current_user_id)
+
+    if ids is not None:
+        query = query.filter(TipEntry.id.in_(ids))
+    else:
+        query = query.filter(
+            TipEntry.work_date >= filters['start_date'],
+            TipEntry.work_date <= filters['end_date'],
+        )
+        if 'section' in filters:
+            query = query.filter(TipEntry.section == filters['section'] if filters['section']
+                                 else TipEntry.section.is_(None))
+        if 'user_id' in filters:
+            query = query.filter(TipEntry.user_id == filters['user_id'])
+        if 'weekday' in filters:
+            query = query.filter(TipEntry.weekday == filters['weekday'])
+
+    rows = query.order_by(TipEntry.id).limit(BULK_MAX_ROWS + 1).with_for_update().all()
+    if len(rows) > BULK_MAX_ROWS:
+        raise BulkError(f'Filter matches more than {BULK_MAX_ROWS} entries; narrow it')
+    return rows
+
+
+def _owners(rows):
+    """{user_id: (name, role, restaurant_id)} for the rows' owners"""
+    user_ids = {row.user_id for row in rows}
+    if not user_ids:
+        return {}
+    users = db.session.query(User.id, User.name, User.role, User.restaurant_id) \
+        .filter(User.id.in_(user_ids)).all()
+    return {u.id: (u.name, u.role, u.restaurant_id) for u in users}
+
+
+def _snapshot(rows, owners):
+    """Dicts (with user_name) of rows as they are now"""
+    result = []
+    for row in rows:
+        tip = row.to_dict()
+        tip['user_name'] = owners.get(row.user_id, NO_OWNER)[0]
+        result.append(tip)
+    return result
+
+
+def derived_values(values):
+    """SQL for total_tips / tips_per_hour / tip_percentage after an edit.
+
+    Mirrors calculate_tip_totals() in schema.sql; unchanged inputs read
+    the row's current column.
+    """
+    def source(field):
+        if field in values:
+            # Typed as numeric so Postgres picks round(numeric, int)
+            return cast(literal(Decimal(str(values[field]))), db.Numeric(10, 2))
+        return getattr(TipEntry, field)
+
+    cash, card, hours, sales = (source(f) for f in ('cash_tips', 'card_tips', 'hours_worked', 'sales_amount'))
+    total = func.coalesce(cash, 0) + func.coalesce(card, 0)
+    return {
+        'total_tips': total,
+        'tips_per_hour': case((func.coalesce(hours, 0) > 0, func.round(total / hours, 2)), else_=0),
+        'tip_percentage': case((func.coalesce(sales, 0) > 0, func.round(total / sales * 100, 2)), else_=0),
+    }
+
+
+def update_rows(rows, changes):
+    """Apply a change set to the selected rows; returns (before, after, owners)"""
+    owners = _owners(rows)
+    before = _snapshot(rows, owners)
+    ids = [row.id for row in rows]
+
+    cells = {}
+    for row in rows:
+        heatmap.accumulate(cells, heatmap.entry_cells(row, -1))
+
+    values = dict(changes)
+    if 'work_date' in values:
+        values['weekday'] = values['work_date'].weekday()
+    money = {k: v for k, v in values.items() if k in ('cash_tips', 'card_tips', 'hours_worked', 'sales_amount')}
+    db.session.execute(
+        update(TipEntry).where(TipEntry.id.in_(ids))
+        .values(**values, **derived_values(money), updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+
+    rows = TipEntry.query.filter(TipEntry.id.in_(ids)).order_by(TipEntry.id).populate_existing().all()
+    for row in rows:
+        heatmap.accumulate(cells, heatmap.entry_cells(row, 1))
+    heatmap.apply_cells(cells, set(owners))
+    after = _snapshot(rows, owners)
+
+    pool_entries = []
+    for tips, sign in ((before, -1), (after, 1)):
+        for tip in tips:
+            _, role, restaurant_id = owners.get(tip['user_id'], NO_OWNER)
+            pool_entries.append((tip, restaurant_id, role, sign))
+    tip_pool.apply_entries(pool_entries)
+    return before, after, owners
+
+
+def delete_rows(rows):
+    """Delete the selected rows and record tombstones; returns (deleted dicts, owners)"""
+    owners = _owners(rows)
+    before = _snapshot(rows, owners)
+    ids = [row.id for row in rows]
+
+    cells = {}
+    for row in rows:
+        heatmap.accumulate(cells, heatmap.entry_cells(row, -1))
+    heatmap.apply_cells(cells, set(owners))
+
+    db.session.execute(insert(TipEntryTombstone).from_select(
+        ['tip_id', 'user_id', 'work_date'],
+        select(TipEntry.id, TipEntry.user_id, TipEntry.work_date).where(TipEntry.id.in_(ids)),
+    ))
+    db.session.execute(
+        delete(TipEntry).where(TipEntry.id.in_(ids)).execution_options(synchronize_session=False)
+    )
+    for row in rows:
+        db.session.expunge(row)
+
+    pool_entries = []
+    for tip in before:
+        _, role, restaurant_id = owners.get(tip['user_id'], NO_OWNER)
+        pool_entries.append((tip, restaurant_id, role, -1))
+    tip_pool.apply_entries(pool_entries)
+    return before, owners
+
+
+def publish_events(before, after, owners):
+    """Publish change events after commit.
+
+    Small batches send a tip_deleted/tip_created pair per row so dashboards
+    patch in place; larger ones send one tips_bulk_changed per user.
+    """
+    if len(before) + len(after) <= 2 * BULK_ROW_EVENTS_MAX:
+        for tips, kind in ((before, 'tip_deleted'), (after, 'tip_created')):
+            for tip in tips:
+                publish_tip_event(kind, tip, owners.get(tip['user_id'], NO_OWNER)[2])
+        return
+
+    counts = {}
+    for tip in before:
+        counts[tip['user_id']] = counts.get(tip['user_id'], 0) + 1
+    for user_id, count in counts.items():
+        publish_bulk_event(user_id, owners.get(user_id, NO_OWNER)[2], count)
@@ -0,0 +1,71 @@
+"""Per-restaurant response cache invalidated by tip writes.
+
+Entries are grouped by scope (a restaurant_id, or None for managers that
+see every restaurant). Any tip event in a restaurant bumps that scope's
+generation, so cached results are served until the next write in scope.
+Workers only see each other's writes with EVENT_BACKEND=postgres; the TTL
+bounds staleness otherwise.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from events import bus
+
+CACHE_TTL_SECONDS = float(os.environ.get("STATS_CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_ENTRIES = int(os.environ.get("STATS_CACHE_MAX_ENTRIES", "512"))
+
+
+class ScopedCache:
+    """Small LRU whose entries die when their scope sees a write"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generations = {}
+
+    def get(self, scope, key):
+        with self.lock:
+            entry = self.entries.get((scope, key))
+            if entry is None:
+                return None
+            generation, stored_at, value = entry
+            if generation != self.generations.get(scope, 0) or time.monotonic() - stored_at > self.ttl:
+                del self.entries[(scope, key)]
+                return None
+            self.entries.move_to_end((scope, key))
+            return value
+
+    def set(self, scope, key, value):
+        with self.lock:
+            self.entries[(scope, key)] = (self.generations.get(scope, 0), time.monotonic(), value)
+            self.entries.move_to_end((scope, key))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, scope):
+        with self.lock:
+            self.generations[scope] = self.generations.get(scope, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+stats_cache = ScopedCache()
+
+
+def _invalidate_on_write(event):
+    if event.get("type") == "anomaly_flags_updated":
+        # Flags span every restaurant and change what exclude_flagged results hold
+        stats_cache.clear()
+        return
+    # The unscoped (None) view covers every restaurant, so it always goes stale
+    stats_cache.invalidate(event.get("restaurant_id"))
+    stats_cache.invalidate(None)
+
+
+bus.add_listener(_invalidate_on_write)
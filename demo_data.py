@@ -1,5 +1,6 @@
-from datetime import date, timedelta
+from datetime import date, datetime, time, timedelta, timezone
 import random
+import uuid
 
 def get_demo_data(data_type):
     """Generate demo data for different endpoints"""
@@ -128,4 +129,284 @@ def get_demo_data(data_type):
             })
         return {'section_stats': section_stats}
 
+    elif data_type == 'monthly_stats':
+        # Monthly totals for the last 24 months, oldest first
+        monthly_stats = []
+        month = date.today().replace(day=1)
+        for _ in range(24):
+            total_tips = round(random.uniform(2500, 4500), 2)
+            total_hours = round(random.uniform(140, 200), 2)
+            total_sales = round(random.uniform(14000, 24000), 2)
+            monthly_stats.append({
+                'month': month.strftime('%Y-%m'),
+                'total_tips': total_tips,
+                'total_hours': total_hours,
+                'total_sales': total_sales,
+                'tips_per_hour': round(total_tips / total_hours, 2),
+                'tip_percentage': round(total_tips / total_sales * 100, 2),
+                'entries': random.randint(18, 26),
+            })
+            month = (month - timedelta(days=1)).replace(day=1)
+        return {'monthly_stats': monthly_stats[::-1]}
+
+    elif data_type == 'heatmap':
+        # Dinner-heavy week with a weekend brunch bump
+        heatmap = []
+        for weekday in range(7):
+            hours = list(range(17, 23)) + ([10, 11, 12, 13] if weekday >= 5 else [])
+            for hour in sorted(hours):
+                total_hours = round(random.uniform(6, 20), 2)
+                total_tips = round(total_hours * random.uniform(15, 45) * (1.3 if weekday >= 4 else 1), 2)
+                total_sales = round(total_tips / random.uniform(0.16, 0.21), 2)
+                heatmap.append({
+                    'weekday': weekday,
+                    'hour': hour,
+                    'total_tips': total_tips,
+                    'total_sales': total_sales,
+                    'total_hours': total_hours,
+                    'tips_per_hour': round(total_tips / total_hours, 2),
+                    'tip_percentage': round(total_tips / total_sales * 100, 2),
+                    'shifts': random.randint(4, 12),
+                })
+        return {'heatmap': heatmap}
+
+    elif data_type == 'team_stats':
+        names = ['Alex', 'Jordan', 'Sam', 'Taylor', 'Casey', 'Riley']
+        team = []
+        for name in names:
+            hours = round(random.uniform(80, 160), 2)
+            sales = round(hours * random.uniform(80, 120), 2)
+            tips = round(sales * random.uniform(0.15, 0.22), 2)
+            prev_hours = round(random.uniform(80, 160), 2)
+            prev_sales = round(prev_hours * random.uniform(80, 120), 2)
+            prev_tips = round(prev_sales * random.uniform(0.15, 0.22), 2)
+            team.append({
+                'user_id': f'demo-{name.lower()}',
+                'user_name': name,
+                'total_tips': tips,
+                'total_hours': hours,
+                'total_sales': sales,
+                'tips_per_hour': round(tips / hours, 2),
+                'tip_percentage': round(tips / sales * 100, 2),
+                'entries': random.randint(10, 22),
+                'previous': {
+                    'total_tips': prev_tips,
+                    'total_hours': prev_hours,
+                    'total_sales': prev_sales,
+                    'tips_per_hour': round(prev_tips / prev_hours, 2),
+                    'tip_percentage': round(prev_tips / prev_sales * 100, 2),
+                    'entries': random.randint(10, 22),
+                },
+            })
+
+        for i, member in enumerate(sorted(team, key=lambda m: m['total_tips'], reverse=True)):
+            member['rank'] = i + 1
+        for i, member in enumerate(sorted(team, key=lambda m: m['previous']['total_tips'], reverse=True)):
+            member['previous']['rank'] = i + 1
+        for member in team:
+            member['delta'] = {
+                'total_tips': round(member['total_tips'] - member['previous']['total_tips'], 2),
+                'tips_per_hour': round(member['tips_per_hour'] - member['previous']['tips_per_hour'], 2),
+                'tip_percentage': round(member['tip_percentage'] - member['previous']['tip_percentage'], 2),
+                'rank': member['previous']['rank'] - member['rank'],
+            }
+        team.sort(key=lambda m: m['rank'])
+
+        end = date.today()
+        start = end - timedelta(days=30)
+        return {
+            'period': {'start_date': start.isoformat(), 'end_date': end.isoformat()},
+            'previous_period': {
+                'start_date': (start - timedelta(days=31)).isoformat(),
+                'end_date': (start - timedelta(days=1)).isoformat(),
+            },
+            'team': team,
+        }
+
     return {}
+
+
+# ---------- Synthetic dataset generator (benchmarks / load tests) ----------
+
+SECTIONS = ['bar', 'patio', 'cocktail', 'server 1', 'server 2', 'server 3', 'server 4', 'banquet']
+COMMENTS = ['Busy night', 'Slow shift', 'Great tips', 'Large party', 'Rain, patio closed',
+            'Short staffed', 'Holiday rush', 'Private event']
+WEEKDAY_MULTIPLIER = [0.8, 0.8, 0.9, 1.0, 1.3, 1.4, 1.1]  # Mon..Sun
+MONTH_MULTIPLIER = [0.85, 0.85, 0.95, 1.0, 1.05, 1.1, 1.15, 1.1, 1.0, 0.95, 1.0, 1.2]
+
+
+def _seeded_uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def generate_users(restaurants=1, servers=10, managers=1, seed=42):
+    """Generate user rows for N restaurants with M servers each"""
+    rng = random.Random(seed)
+    users = []
+    for r in range(restaurants):
+        restaurant_id = _seeded_uuid(rng)
+        for m in range(managers):
+            users.append({
+                'id': _seeded_uuid(rng),
+                'email': f'manager{m + 1}.r{r + 1}@example.com',
+                'name': f'Manager {m + 1} (R{r + 1})',
+                'role': 'manager',
+                'restaurant_id': restaurant_id,
+            })
+        for s in range(servers):
+            users.append({
+                'id': _seeded_uuid(rng),
+                'email': f'server{s + 1}.r{r + 1}@example.com',
+                'name': f'Server {s + 1} (R{r + 1})',
+                'role': 'server',
+                'restaurant_id': restaurant_id,
+            })
+    return users
+
+
+def generate_tip_entries(users, years=1, seed=42, end_date=None):
+    """Yield tip entry rows covering `years` of shifts for every server.
+
+    Each server gets a stable skill level, home sections and weekly shift
+    pattern so per-user, per-weekday and per-section aggregates look like
+    a real restaurant rather than uniform noise.
+    """
+    rng = random.Random(seed + 1)
+    # Separate stream so adding shift times doesn't change the other columns
+    shift_rng = random.Random(seed + 2)
+    end_date = end_date or date.today()
+    start_date = end_date - timedelta(days=int(365 * years))
+    total_days = (end_date - start_date).days + 1
+
+    for user in users:
+        if user['role'] != 'server':
+            continue
+        skill = rng.uniform(0.8, 1.25)
+        home_sections = rng.sample(SECTIONS, 3)
+        shifts_per_week = rng.randint(3, 6)
+        work_days = set(rng.sample(range(7), shifts_per_week))
+
+        for offset in range(total_days):
+            work_date = start_date + timedelta(days=offset)
+            weekday = work_date.weekday()
+            if weekday not in work_days or rng.random() < 0.08:
+                continue
+
+            factor = skill * WEEKDAY_MULTIPLIER[weekday] * MONTH_MULTIPLIER[work_date.month - 1]
+            hours_worked = round(min(rng.gauss(6.5, 1.5), 12) if weekday < 4 else rng.uniform(6, 10), 2)
+            hours_worked = max(hours_worked, 2.0)
+            sales_amount = round(hours_worked * rng.uniform(70, 130) * factor, 2)
+            tip_rate = max(rng.gauss(0.185, 0.03), 0.05)
+            total_tips = round(sales_amount * tip_rate, 2)
+            card_tips = round(total_tips * rng.uniform(0.6, 0.9), 2)
+            cash_tips = round(total_tips - card_tips, 2)
+            total_tips = round(cash_tips + card_tips, 2)
+            created_at = datetime.combine(work_date, time(23, 0), tzinfo=timezone.utc)
+            # Weekday shifts mostly start for dinner, weekend shifts can start at brunch
+            start_minutes = shift_rng.choice((16 * 60, 16 * 60 + 30, 17 * 60) if weekday < 4
+                                             else (10 * 60, 11 * 60, 16 * 60, 17 * 60))
+            end_minutes = (start_minutes + int(round(hours_worked * 60))) % (24 * 60)
+            shift_start = time(start_minutes // 60, start_minutes % 60)
+            shift_end = time(end_minutes // 60, end_minutes % 60)
+
+            yield {
+                'user_id': user['id'],
+                'cash_tips': cash_tips,
+                'card_tips': card_tips,
+                'hours_worked': hours_worked,
+                'section': rng.choice(home_sections),
+                'sales_amount': sales_amount,
+                'work_date': work_date,
+                'weekday': weekday,
+                'shift_start': shift_start,
+                'shift_end': shift_end,
+                'total_tips': total_tips,
+                'tips_per_hour': round(total_tips / hours_worked, 2),
+                'tip_percentage': round(total_tips / sales_amount * 100, 2) if sales_amount > 0 else 0,
+                'comments': rng.choice(COMMENTS) if rng.random() < 0.15 else None,
+                'created_at': created_at,
+                'updated_at': created_at,
+            }
+
+
+def bulk_load(restaurants=1, servers=10, years=1, seed=42, managers=1, batch_size=5000, truncate=False):
+    """Bulk insert a generated dataset into the configured database.
+
+    Uses executemany inserts on the Core tables, so it works the same way
+    against SQLite and Postgres. Returns (user_count, tip_entry_count).
+    """
+    from app import app, db
+    from models import (User, TipEntry, TipHeatmapCell, TipEntryFlag, AnomalyBaseline,
+                        TipEntryArchive, TipArchiveSummary, TipEntryTombstone, JobState,
+                        PayrollSnapshot, PayrollSnapshotLine)
+    import anomaly
+    import heatmap
+
+    users = generate_users(restaurants, servers, managers, seed)
+    with app.app_context():
+        if truncate:
+            # Everything derived from tip entries goes with them
+            db.session.execute(TipHeatmapCell.__table__.delete())
+            db.session.execute(TipEntryFlag.__table__.delete())
+            db.session.execute(AnomalyBaseline.__table__.delete())
+            db.session.execute(JobState.__table__.delete().where(JobState.key == anomaly.WATERMARK_KEY))
+            db.session.execute(PayrollSnapshotLine.__table__.delete())
+            db.session.execute(PayrollSnapshot.__table__.delete())
+            db.session.execute(TipEntryTombstone.__table__.delete())
+            db.session.execute(TipArchiveSummary.__table__.delete())
+            db.session.execute(TipEntryArchive.__table__.delete())
+            db.session.execute(TipEntry.__table__.delete())
+            db.session.execute(User.__table__.delete())
+        db.session.execute(User.__table__.insert(), users)
+
+        count = 0
+        batch = []
+        cells = {}
+        for row in generate_tip_entries(users, years, seed):
+            batch.append(row)
+            heatmap.accumulate(cells, heatmap.shift_cells(
+                row['user_id'], row['work_date'], row['shift_start'], row['shift_end'],
+                row['section'], row['total_tips'], row['sales_amount']))
+            if len(batch) >= batch_size:
+                db.session.execute(TipEntry.__table__.insert(), batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            db.session.execute(TipEntry.__table__.insert(), batch)
+            count += len(batch)
+        if truncate:
+            heatmap.replace_all(cells, batch_size)
+        else:
+            heatmap.rebuild(batch_size)
+        db.session.commit()
+    return len(users), count
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description='Load a seeded synthetic Tip Tracker dataset')
+    parser.add_argument('--database-url', help='Target database (defaults to DATABASE_URL)')
+    parser.add_argument('--restaurants', type=int, default=1)
+    parser.add_argument('--servers', type=int, default=10, help='Servers per restaurant')
+    parser.add_argument('--managers', type=int, default=1, help='Managers per restaurant')
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--truncate', action='store_true', help='Delete existing users and tips first')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+
+    user_count, tip_count = bulk_load(
+        restaurants=args.restaurants,
+        servers=args.servers,
+        years=args.years,
+        seed=args.seed,
+        managers=args.managers,
+        batch_size=args.batch_size,
+        truncate=args.truncate,
+    )
+    print(f'Loaded {user_count} users and {tip_count} tip entries')
@@ -0,0 +1,237 @@
+"""In-process pub/sub for tip change events.
+
+API writes publish to `bus`; `/api/stream` subscribes per client and
+forwards matching events over Server-Sent Events. The transport between
+publishers and subscribers is pluggable:
+
+* memory   -- deliver inside this process only (default)
+* postgres -- LISTEN/NOTIFY, so every worker sees every write
+
+Each subscription has a bounded buffer. A slow client loses the oldest
+events and is told to resync instead of growing memory without limit.
+
+Every event carries a `seq` of the form "<host>-<pid>:<n>": unique
+across workers, and ordered only among events of the same worker.
+"""
+import itertools
+import json
+import logging
+import os
+import select
+import socket
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+EVENT_BACKEND = os.environ.get("EVENT_BACKEND", "memory")
+SUBSCRIBER_BUFFER = int(os.environ.get("SSE_CLIENT_BUFFER", "100"))  # events per client
+NOTIFY_CHANNEL = "tip_events"
+
+
+class Subscription:
+    """Bounded per-client event buffer"""
+
+    def __init__(self, predicate, maxsize=SUBSCRIBER_BUFFER):
+        self.predicate = predicate
+        self.maxsize = maxsize
+        self.buffer = deque()
+        self.overflowed = False
+        self.cond = threading.Condition()
+
+    def push(self, event):
+        with self.cond:
+            if len(self.buffer) >= self.maxsize:
+                self.buffer.popleft()
+                self.overflowed = True
+            self.buffer.append(event)
+            self.cond.notify()
+
+    def drain(self, timeout):
+        """Wait up to `timeout` seconds; return (events, overflowed)"""
+        with self.cond:
+            if not self.buffer:
+                self.cond.wait(timeout)
+            events = list(self.buffer)
+            self.buffer.clear()
+            overflowed, self.overflowed = self.overflowed, False
+        return events, overflowed
+
+
+class MemoryBackend:
+    """Delivers published events straight to local subscribers"""
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, event):
+        self.deliver(event)
+
+    def close(self):
+        pass
+
+
+class PostgresNotifyBackend:
+    """Fans events out to every worker through Postgres LISTEN/NOTIFY"""
+
+    def __init__(self, deliver, dsn):
+        import psycopg2
+
+        self.deliver = deliver
+        self.dsn = dsn
+        self.psycopg2 = psycopg2
+        self.lock = threading.Lock()
+        self.publish_conn = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._listen, name="event-listener", daemon=True)
+        self.thread.start()
+
+    def _connect(self):
+        conn = self.psycopg2.connect(self.dsn)
+        conn.set_session(autocommit=True)
+        return conn
+
+    def publish(self, event):
+        payload = json.dumps(event)
+        with self.lock:
+            try:
+                if self.publish_conn is None or self.publish_conn.closed:
+                    self.publish_conn = self._connect()
+                with self.publish_conn.cursor() as cur:
+                    cur.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, payload))
+            except self.psycopg2.Error as e:
+                logger.warning("NOTIFY failed, delivering locally only: %s", e)
+                self.publish_conn = None
+                self.deliver(event)
+
+    def _listen(self):
+        while not self.stopped.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                while not self.stopped.is_set():
+                    if select.select([conn], [], [], 5.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            self.deliver(json.loads(notify.payload))
+                        except ValueError:
+                            logger.warning("Dropping malformed event payload")
+            except self.psycopg2.Error as e:
+                logger.warning("Event listener connection lost: %s", e)
+                self.stopped.wait(2.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def close(self):
+        self.stopped.set()
+
+
+class EventBus:
+    """Routes published events to listeners and client subscriptions"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        self.listeners = []
+        self.sequence = itertools.count(1)
+        self.backend = MemoryBackend(self._deliver)
+
+    def configure(self, backend):
+        self.backend.close()
+        self.backend = backend
+
+    def publish(self, event):
+        # The pid is read here rather than at import, so forked workers differ
+        event.setdefault("seq", f"{socket.gethostname()}-{os.getpid()}:{next(self.sequence)}")
+        self.backend.publish(event)
+
+    def subscribe(self, predicate, maxsize=SUBSCRIBER_BUFFER):
+        sub = Subscription(predicate, maxsize)
+        with self.lock:
+            self.subscriptions.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscriptions.discard(sub)
+
+    def add_listener(self, fn):
+        """Call fn(event) for every event delivered to this process"""
+        self.listeners.append(fn)
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscriptions)
+
+    def _deliver(self, event):
+        for fn in self.listeners:
+            try:
+                fn(event)
+            except Exception:
+                logger.exception("Event listener failed")
+        with self.lock:
+            targets = [s for s in self.subscriptions if s.predicate(event)]
+        for sub in targets:
+            sub.push(event)
+
+
+bus = EventBus()
+
+
+def init_app(app):
+    """Select the event backend for this process"""
+    uri = app.config.get("SQLALCHEMY_DATABASE_URI", "")
+    if EVENT_BACKEND == "postgres":
+        if not uri.startswith("postgresql"):
+            logger.warning("EVENT_BACKEND=postgres needs a Postgres database; using in-memory events")
+            return
+        from sqlalchemy.engine import make_url
+
+        dsn = make_url(uri).set(drivername="postgresql").render_as_string(hide_password=False)
+        bus.configure(PostgresNotifyBackend(bus._deliver, dsn))
+        logger.info("Tip events fan out via Postgres LISTEN/NOTIFY")
+
+
+def publish_tip_event(kind, tip, restaurant_id=None):
+    """Publish a tip_created / tip_deleted event with its breakdown delta"""
+    sign = 1 if kind == "tip_created" else -1
+    bus.publish({
+        "type": kind,
+        "user_id": tip["user_id"],
+        "restaurant_id": restaurant_id,
+        "tip": tip,
+        "breakdown_delta": {
+            "cash_tips": sign * tip["cash_tips"],
+            "card_tips": sign * tip["card_tips"],
+            "total_tips": sign * tip["total_tips"],
+            "total_sales": sign * tip["sales_amount"],
+            "total_hours": sign * tip["hours_worked"],
+            "entries": sign,
+        },
+    })
+
+
+def publish_bulk_event(user_id, restaurant_id, count):
+    """Publish one tips_bulk_changed event for a bulk edit/delete of a user's entries"""
+    bus.publish({
+        "type": "tips_bulk_changed",
+        "user_id": user_id,
+        "restaurant_id": restaurant_id,
+        "count": count,
+    })
+
+
+def publish_flags_event(flagged):
+    """Publish anomaly_flags_updated after the anomaly job rewrites tip_entry_flags"""
+    bus.publish({
+        "type": "anomaly_flags_updated",
+        "user_id": None,
+        "restaurant_id": None,
+        "flagged": flagged,
+    })
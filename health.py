@@ -0,0 +1,199 @@
+"""Cached database health for /healthz, /livez and /readyz.
+
+A per-process health.probe job runs `SELECT 1` every
+HEALTH_PROBE_SECONDS on the scheduler's pool. It records latency, the
+last error and the connection pool's checked-in / checked-out / overflow
+counts, so the health endpoints answer from memory instead of taking a
+pool connection on every orchestrator poll. While the pool is fully
+checked out the probe skips the query rather than queue for a
+connection. Without a running scheduler (SCHEDULER_ENABLED=0) the
+endpoints probe themselves, at most once per interval.
+
+At startup in primary mode, DB_POOL_PREWARM connections are opened in
+parallel and returned to the pool, so the first requests don't pay the
+TLS handshake to Supabase. Liveness (/livez) only says the process is
+serving. Readiness (/readyz) also needs the pre-warm to have finished and
+a successful probe within HEALTH_STALE_SECONDS.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PROBE_SECONDS = float(os.environ.get("HEALTH_PROBE_SECONDS", "10"))
+HEALTH_STALE_SECONDS = float(os.environ.get("HEALTH_STALE_SECONDS", str(3 * HEALTH_PROBE_SECONDS)))
+
+
+def pool_stats(engine):
+    """Connection counts of an engine's pool (None where the pool class doesn't track them)"""
+    pool = engine.pool
+    size = pool.size() if hasattr(pool, 'size') else None
+    max_overflow = getattr(pool, '_max_overflow', None)
+    return {
+        'pool': type(pool).__name__,
+        'size': size,
+        'capacity': size + max(max_overflow, 0) if size is not None and max_overflow is not None else None,
+        'checked_in': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+        'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+        'overflow': pool.overflow() if hasattr(pool, 'overflow') else None,
+    }
+
+
+class HealthState:
+    """Result of the latest probe plus startup progress"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.ok = False
+        self.latency_ms = None
+        self.error = None
+        self.checked_at = None  # monotonic
+        self.checked_at_utc = None
+        self.probes = 0
+        self.failures = 0
+        self.skipped = 0
+        self.pool = {}
+        self.warmed = False
+        self.warmed_connections = 0
+
+    @property
+    def age(self):
+        return None if self.checked_at is None else time.monotonic() - self.checked_at
+
+    def fresh(self):
+        return self.age is not None and self.age <= HEALTH_STALE_SECONDS
+
+    def to_dict(self):
+        return {
+            'ok': self.ok,
+            'latency_ms': self.latency_ms,
+            'error': self.error,
+            'checked_at': self.checked_at_utc,
+            'age_seconds': None if self.age is None else round(self.age, 3),
+            'probes': self.probes,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'pool': self.pool,
+            'warmed_connections': self.warmed_connections,
+        }
+
+
+state = HealthState()
+
+
+def probe():
+    """Ping the database once and update `state`; returns whether it answered"""
+    engine = db.engine
+    stats = pool_stats(engine)
+    with state.lock:
+        state.pool = stats
+    if stats['capacity'] is not None and (stats['checked_out'] or 0) >= stats['capacity']:
+        # Every connection is busy; waiting for one would only add to the queue
+        with state.lock:
+            state.skipped += 1
+        return state.ok
+
+    start = time.perf_counter()
+    error = None
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        error = str(e)
+    latency_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    with state.lock:
+        state.ok = error is None
+        state.latency_ms = latency_ms
+        state.error = error
+        state.checked_at = time.monotonic()
+        state.checked_at_utc = datetime.now(timezone.utc).isoformat()
+        state.probes += 1
+        state.pool = pool_stats(engine)
+        if error is not None:
+            state.failures += 1
+    if error is not None:
+        logger.warning("Health probe failed after %.0fms: %s", latency_ms, error)
+    return error is None
+
+
+_inline_probe = threading.Lock()
+
+
+def current():
+    """Health state, probing inline when no prober has run for an interval"""
+    age = state.age
+    if (age is None or age > HEALTH_PROBE_SECONDS) and _inline_probe.acquire(blocking=False):
+        try:
+            probe()
+        finally:
+            _inline_probe.release()
+    return state
+
+
+def prewarm(count):
+    """Open `count` pool connections in parallel and check them back in"""
+    engine = db.engine
+    size = pool_stats(engine)['size']
+    if size is not None:
+        count = min(count, size)  # overflow connections would be closed on check-in
+    if count <= 0:
+        state.warmed = True
+        return 0
+
+    def connect(_):
+        try:
+            conn = engine.connect()
+            conn.execute(text("SELECT 1"))
+            return conn
+        except Exception as e:
+            logger.warning("Pool pre-warm connection failed: %s", e)
+            return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        connections = [conn for conn in executor.map(connect, range(count)) if conn is not None]
+    for conn in connections:
+        conn.close()
+    state.warmed_connections = len(connections)
+    state.warmed = True
+    logger.info("Pre-warmed %d/%d pool connections in %.0fms",
+                len(connections), count, (time.perf_counter() - start) * 1000)
+    return len(connections)
+
+
+def liveness():
+    return {'status': 'alive', 'uptime_seconds': round(time.monotonic() - state.started_at, 1)}
+
+
+def readiness():
+    """(ready, reasons) -- reasons lists what is keeping the process out of rotation"""
+    current()
+    reasons = []
+    if not state.warmed:
+        reasons.append('pool not pre-warmed yet')
+    if not state.ok:
+        reasons.append(f'database probe failing: {state.error}' if state.error else 'no successful probe yet')
+    elif not state.fresh():
+        reasons.append('last probe is stale')
+    return not reasons, reasons
+
+
+def init_app(app, prewarm_connections=0):
+    """Pre-warm the pool and register the per-process probe job"""
+    from scheduler import APP_ONE_SHOT, scheduler
+
+    if APP_ONE_SHOT:
+        return
+    prewarm(prewarm_connections)
+    probe()
+    scheduler.add_job('health.probe', probe, interval=HEALTH_PROBE_SECONDS, leader=False, record=False)
@@ -0,0 +1,177 @@
+"""Weekday x hour-of-day x section tip cube behind /api/stats/heatmap.
+
+Entries with shift start/end times are spread across the clock hours
+they cover: each hour gets the share of the shift's tips and sales that
+matches the minutes worked in it. Cells are kept per user and updated
+with an upsert in the same transaction as the tip write, so reads never
+touch tip_entries and cost the same however much history there is.
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from app import db
+from models import TipHeatmapCell
+import archive
+
+ONE_HOUR = timedelta(hours=1)
+SECONDS_PER_HOUR = Decimal(3600)
+
+
+def shift_span(work_date, shift_start, shift_end):
+    """Start/end datetimes of a shift; an end at or before the start runs past midnight"""
+    start = datetime.combine(work_date, shift_start)
+    end = datetime.combine(work_date, shift_end)
+    if end <= start:
+        end += timedelta(days=1)
+    return start, end
+
+
+def shift_hours(shift_start, shift_end, work_date=None):
+    """Length of a shift in hours"""
+    start, end = shift_span(work_date or date.today(), shift_start, shift_end)
+    return (end - start).total_seconds() / 3600
+
+
+def exceeds_shift(hours_worked, shift_start, shift_end):
+    """Whether hours_worked is longer than the shift (with a rounding allowance)"""
+    if shift_start is None or shift_end is None:
+        return False
+    return float(hours_worked) > shift_hours(shift_start, shift_end) + 0.01
+
+
+def shift_slices(work_date, shift_start, shift_end):
+    """Yield (weekday, hour, fraction of shift, hours) for each clock hour a shift covers"""
+    start, end = shift_span(work_date, shift_start, shift_end)
+    span = Decimal((end - start).total_seconds())
+    cursor = start
+    while cursor < end:
+        bucket_end = min(cursor.replace(minute=0, second=0, microsecond=0) + ONE_HOUR, end)
+        seconds = Decimal((bucket_end - cursor).total_seconds())
+        yield cursor.weekday(), cursor.hour, seconds / span, seconds / SECONDS_PER_HOUR
+        cursor = bucket_end
+
+
+def shift_cells(user_id, work_date, shift_start, shift_end, section, total_tips, sales_amount, sign=1):
+    """Cell increments for one shift"""
+    tips = Decimal(str(total_tips)) * sign
+    sales = Decimal(str(sales_amount)) * sign
+    return [
+        {
+            'user_id': user_id,
+            'weekday': weekday,
+            'hour': hour,
+            'section': section or '',
+            'total_tips': tips * fraction,
+            'total_sales': sales * fraction,
+            'total_hours': hours * sign,
+            'shifts': sign,
+        }
+        for weekday, hour, fraction, hours in shift_slices(work_date, shift_start, shift_end)
+    ]
+
+
+def entry_cells(tip, sign=1):
+    """Cell increments for one TipEntry (empty if it has no shift times)"""
+    if tip.shift_start is None or tip.shift_end is None:
+        return []
+    return shift_cells(tip.user_id, tip.work_date, tip.shift_start, tip.shift_end,
+                       tip.section, tip.total_tips, tip.sales_amount, sign)
+
+
+def accumulate(cells, increments):
+    """Merge cell increments into a {(user_id, weekday, hour, section): row} dict"""
+    for row in increments:
+        key = (row['user_id'], row['weekday'], row['hour'], row['section'])
+        cell = cells.get(key)
+        if cell is None:
+            cells[key] = row
+        else:
+            for column in ('total_tips', 'total_sales', 'total_hours', 'shifts'):
+                cell[column] += row[column]
+    return cells
+
+
+def replace_all(cells, batch_size=5000):
+    """Replace the cube with accumulated cells (caller commits)"""
+    db.session.execute(TipHeatmapCell.__table__.delete())
+    rows = list(cells.values())
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(TipHeatmapCell.__table__.insert(), rows[i:i + batch_size])
+    return len(rows)
+
+
+def _upsert(rows):
+    table = TipHeatmapCell.__table__
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    stmt = insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'weekday', 'hour', 'section'],
+        set_={
+            'total_tips': table.c.total_tips + stmt.excluded.total_tips,
+            'total_sales': table.c.total_sales + stmt.excluded.total_sales,
+            'total_hours': table.c.total_hours + stmt.excluded.total_hours,
+            'shifts': table.c.shifts + stmt.excluded.shifts,
+        },
+    )
+    db.session.execute(stmt)
+
+
+def apply_cells(cells, user_ids, batch_size=500):
+    """Upsert accumulated cell increments and drop cells left without shifts.
+
+    Runs inside the caller's transaction; the caller commits.
+    """
+    rows = list(cells.values())
+    for i in range(0, len(rows), batch_size):
+        _upsert(rows[i:i + batch_size])
+    if rows:
+        TipHeatmapCell.query.filter(
+            TipHeatmapCell.user_id.in_(user_ids),
+            TipHeatmapCell.shifts <= 0,
+        ).delete(synchronize_session=False)
+
+
+def apply_entry(tip, sign):
+    """Add (sign=1) or remove (sign=-1) a TipEntry's shift from the cube.
+
+    Runs inside the caller's transaction; the caller commits.
+    """
+    rows = entry_cells(tip, sign)
+    if not rows:
+        return
+    _upsert(rows)
+    if sign < 0:
+        TipHeatmapCell.query.filter(
+            TipHeatmapCell.user_id == tip.user_id,
+            TipHeatmapCell.shifts <= 0,
+        ).delete(synchronize_session=False)
+
+
+def rebuild(batch_size=5000):
+    """Recompute the whole cube from every entry, archived ones included; returns the number of cells"""
+    entries = archive.entries()
+    rows = db.session.query(
+        entries.user_id, entries.work_date, entries.shift_start, entries.shift_end,
+        entries.section, entries.total_tips, entries.sales_amount,
+    ).filter(
+        entries.shift_start.isnot(None),
+        entries.shift_end.isnot(None),
+    ).yield_per(batch_size)
+
+    cells = {}
+    for row in rows:
+        accumulate(cells, shift_cells(*row))
+    count = replace_all(cells, batch_size)
+    db.session.commit()
+    return count
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        print(f'Rebuilt heatmap: {rebuild()} cells')
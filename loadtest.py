@@ -0,0 +1,328 @@
+"""Shift-end load-test harness.
+
+Drives the real Flask app over HTTP with concurrent virtual users that
+follow scripted scenarios:
+
+* server: log in through /auth/session, submit a shift, load the
+  dashboard fan-out, occasionally delete an entry
+* manager: log in, then keep refreshing the dashboard
+
+Access tokens are minted locally with SUPABASE_JWT_SECRET, so no Supabase
+round trip is involved. By default the app is served in-process on a free
+port against a seeded database (SQLite temp file or --database-url for a
+local Postgres), which also lets the harness sample connection-pool
+saturation. Use --target to hit an already running server instead.
+
+    python loadtest.py --size small --servers 40 --managers 5 --duration 60
+    python loadtest.py --target http://localhost:5000 --jwt-secret ... --no-seed
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from http.cookiejar import CookieJar
+
+import jwt
+
+from benchmark import SIZES, percentile
+
+# Requests fired by loadDashboard() in static/js/app.js
+DASHBOARD_REQUESTS = [
+    '/api/stats/breakdown?days=30',
+    '/api/tips?days=30',
+    '/api/stats/daily?days=30',
+    '/api/stats/breakdown?days=30',
+    '/api/stats/weekday?days=30',
+    '/api/stats/daily?days=30',
+    '/api/stats/daily?days=30',
+    '/api/stats/section?days=30',
+    '/api/sections',
+]
+BROWSER_CONNECTIONS = 6  # parallel requests per host a browser allows
+
+
+class Metrics:
+    """Thread-safe latency/error collector"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(int)
+
+    def record(self, name, elapsed_ms, status):
+        with self.lock:
+            self.latencies[name].append(elapsed_ms)
+            self.statuses[status] += 1
+            if status == 0 or status >= 400:
+                self.errors[name] += 1
+
+    def report(self, elapsed):
+        total = sum(len(v) for v in self.latencies.values())
+        errors = sum(self.errors.values())
+        all_samples = [ms for v in self.latencies.values() for ms in v]
+        steps = {}
+        for name, samples in sorted(self.latencies.items()):
+            steps[name] = {
+                'requests': len(samples),
+                'errors': self.errors.get(name, 0),
+                'p50_ms': round(percentile(samples, 50), 2),
+                'p90_ms': round(percentile(samples, 90), 2),
+                'p99_ms': round(percentile(samples, 99), 2),
+                'max_ms': round(max(samples), 2),
+            }
+        return {
+            'duration_s': round(elapsed, 2),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0,
+            'error_rate': round(errors / total, 4) if total else 0,
+            'statuses': {str(k): v for k, v in sorted(self.statuses.items())},
+            'latency_ms': {
+                'p50': round(percentile(all_samples, 50), 2),
+                'p90': round(percentile(all_samples, 90), 2),
+                'p99': round(percentile(all_samples, 99), 2),
+            },
+            'steps': steps,
+        }
+
+
+class PoolSampler(threading.Thread):
+    """Samples SQLAlchemy pool usage of the in-process app"""
+
+    def __init__(self, engine, interval=0.05):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        from health import pool_stats
+
+        while not self.stopped.is_set():
+            stats = pool_stats(self.engine)
+            self.samples.append((stats['checked_out'] or 0, stats['overflow'] or 0))
+            time.sleep(self.interval)
+
+    def report(self):
+        from health import pool_stats
+
+        stats = pool_stats(self.engine)
+        capacity = stats['capacity']
+        checked = [s[0] for s in self.samples] or [0]
+        saturated = sum(1 for c in checked if capacity and c >= capacity)
+        return {
+            'pool': stats['pool'],
+            'capacity': capacity,
+            'max_checked_out': max(checked),
+            'mean_checked_out': round(sum(checked) / len(checked), 2),
+            'max_overflow': max((max(s[1], 0) for s in self.samples), default=0),
+            'saturated_fraction': round(saturated / len(checked), 4),
+        }
+
+
+class VirtualUser:
+    """One browser session: cookie jar plus a small fan-out pool"""
+
+    def __init__(self, base_url, user, token, metrics):
+        self.base_url = base_url
+        self.user = user
+        self.token = token
+        self.metrics = metrics
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        self.created_ids = []
+
+    def request(self, name, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        start = time.perf_counter()
+        status, payload = 0, None
+        try:
+            with self.opener.open(req, timeout=30) as resp:
+                status = resp.status
+                payload = resp.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (urllib.error.URLError, OSError):
+            status = 0
+        self.metrics.record(name, (time.perf_counter() - start) * 1000, status)
+        return status, payload
+
+    def login(self):
+        status, _ = self.request('login', 'POST', '/auth/session', {'access_token': self.token})
+        return status == 200
+
+    def submit_shift(self, rng):
+        work_date = date.today() - timedelta(days=rng.randint(0, 2))
+        sales = round(rng.uniform(300, 1500), 2)
+        tips = round(sales * rng.uniform(0.15, 0.22), 2)
+        status, payload = self.request('submit_shift', 'POST', '/api/tips', {
+            'cash_tips': round(tips * 0.3, 2),
+            'card_tips': round(tips * 0.7, 2),
+            'hours_worked': round(rng.uniform(4, 9), 2),
+            'sales_amount': sales,
+            'section': rng.choice(['bar', 'patio', 'server 1', 'server 2']),
+            'work_date': work_date.isoformat(),
+            'comments': 'load test',
+        })
+        if status == 201 and payload:
+            self.created_ids.append(json.loads(payload)['tip_entry']['id'])
+
+    def dashboard(self, executor):
+        futures = [executor.submit(self.request, 'dashboard', 'GET', path) for path in DASHBOARD_REQUESTS]
+        start = time.perf_counter()
+        statuses = [f.result()[0] for f in futures]
+        # The fan-out fails if any request did: a connection error (0), else the highest status
+        status = 0 if 0 in statuses else max(statuses)
+        self.metrics.record('dashboard_fanout', (time.perf_counter() - start) * 1000, status)
+
+    def delete_entry(self):
+        if self.created_ids:
+            self.request('delete_entry', 'DELETE', f'/api/tips/{self.created_ids.pop()}')
+
+
+def run_user(vu, role, deadline, think_time, rng, start_delay):
+    time.sleep(start_delay)
+    if not vu.login():
+        return
+    with ThreadPoolExecutor(max_workers=BROWSER_CONNECTIONS) as executor:
+        if role == 'server':
+            vu.submit_shift(rng)
+            vu.dashboard(executor)
+            while time.time() < deadline:
+                time.sleep(rng.uniform(0, think_time))
+                roll = rng.random()
+                if roll < 0.5:
+                    vu.submit_shift(rng)
+                elif roll < 0.6:
+                    vu.delete_entry()
+                vu.dashboard(executor)
+        else:
+            while time.time() < deadline:
+                vu.dashboard(executor)
+                time.sleep(rng.uniform(0, think_time))
+
+
+def mint_token(user, secret, ttl=3600):
+    now = int(time.time())
+    return jwt.encode({
+        'sub': user['id'],
+        'email': user['email'],
+        'aud': 'authenticated',
+        'role': 'authenticated',
+        'iat': now,
+        'exp': now + ttl,
+        'user_metadata': {'name': user['name']},
+    }, secret, algorithm='HS256')
+
+
+def serve_in_process():
+    """Start the app on a free local port; returns (base_url, engine, server)"""
+    from werkzeug.serving import make_server
+    from app import app, db
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    with app.app_context():
+        engine = db.engine
+    return f'http://127.0.0.1:{server.server_port}', engine, server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate shift-end traffic against Tip Tracker')
+    parser.add_argument('--target', help='Base URL of a running server (default: serve in-process)')
+    parser.add_argument('--database-url', help='Database for the in-process server (default: temp SQLite)')
+    parser.add_argument('--size', default='small', choices=list(SIZES), help='Seed dataset size')
+    parser.add_argument('--no-seed', action='store_true', help='Use existing data instead of bulk loading')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--servers', type=int, default=30, help='Concurrent server virtual users')
+    parser.add_argument('--managers', type=int, default=3, help='Concurrent manager virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--ramp', type=float, default=0, help='Seconds over which users start')
+    parser.add_argument('--think-time', type=float, default=2.0, help='Max seconds between actions')
+    parser.add_argument('--jwt-secret', help='Secret for minting tokens (defaults to SUPABASE_JWT_SECRET)')
+    parser.add_argument('--output', help='Write the JSON report here')
+    args = parser.parse_args()
+
+    secret = args.jwt_secret or os.environ.get('SUPABASE_JWT_SECRET')
+    if args.target and not secret:
+        parser.error('--jwt-secret (or SUPABASE_JWT_SECRET) must match the target server')
+    secret = secret or secrets.token_urlsafe(32)
+    os.environ['SUPABASE_JWT_SECRET'] = secret
+
+    import demo_data
+
+    restaurants, servers_per_restaurant, years = SIZES[args.size]
+    engine = None
+    if args.target:
+        base_url = args.target.rstrip('/')
+    else:
+        # Scheduled jobs (anomaly passes etc.) would skew the timings
+        os.environ.setdefault('SCHEDULER_ENABLED', '0')
+        if args.database_url:
+            os.environ['DATABASE_URL'] = args.database_url
+        else:
+            fd, path = tempfile.mkstemp(prefix='tiptracker-load-', suffix='.db')
+            os.close(fd)
+            os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+        if not args.no_seed:
+            users, tips = demo_data.bulk_load(restaurants, servers_per_restaurant, years,
+                                              seed=args.seed, truncate=True)
+            print(f'Seeded {users} users / {tips} tip entries')
+        base_url, engine, _ = serve_in_process()
+
+    users = demo_data.generate_users(restaurants, servers_per_restaurant, 1, args.seed)
+    server_users = [u for u in users if u['role'] == 'server']
+    manager_users = [u for u in users if u['role'] == 'manager']
+
+    metrics = Metrics()
+    sampler = PoolSampler(engine) if engine is not None else None
+    if sampler:
+        sampler.start()
+
+    plan = [('server', server_users[i % len(server_users)]) for i in range(args.servers)]
+    plan += [('manager', manager_users[i % len(manager_users)]) for i in range(args.managers)]
+
+    start = time.time()
+    deadline = start + args.duration
+    threads = []
+    for i, (role, user) in enumerate(plan):
+        rng = random.Random(args.seed + i)
+        vu = VirtualUser(base_url, user, mint_token(user, secret), metrics)
+        delay = args.ramp * i / max(len(plan), 1)
+        t = threading.Thread(target=run_user, args=(vu, role, deadline, args.think_time, rng, delay), daemon=True)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    report = metrics.report(elapsed)
+    report['virtual_users'] = {'servers': args.servers, 'managers': args.managers}
+    if sampler:
+        sampler.stopped.set()
+        report['connection_pool'] = sampler.report()
+        import admission
+        report['admission'] = admission.controller.metrics()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 1 if report['error_rate'] > 0.01 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
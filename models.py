@@ -1,6 +1,7 @@
 from app import db
 from datetime import datetime, timezone
 from sqlalchemy import func
+import json
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -18,6 +19,11 @@ class User(db.Model):
 
 class TipEntry(db.Model):
     __tablename__ = 'tip_entries'
+    __table_args__ = (
+        # Delta sync (/api/tips/changes) scans by modification time
+        db.Index('idx_tip_entries_updated_at', 'updated_at'),
+        db.Index('idx_tip_entries_user_updated', 'user_id', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
@@ -28,6 +34,8 @@ class TipEntry(db.Model):
     sales_amount = db.Column(db.Numeric(10, 2), nullable=False, default=0)
     work_date = db.Column(db.Date, nullable=False)
     weekday = db.Column(db.Integer, nullable=False)  # 0=Monday, 6=Sunday
+    shift_start = db.Column(db.Time, nullable=True)  # Optional; shift_end < shift_start means past midnight
+    shift_end = db.Column(db.Time, nullable=True)
     total_tips = db.Column(db.Numeric(10, 2), nullable=False)  # Computed field
     tips_per_hour = db.Column(db.Numeric(8, 2), nullable=False)  # Computed field
     tip_percentage = db.Column(db.Numeric(5, 2), nullable=False)  # Computed field
@@ -59,6 +67,8 @@ class TipEntry(db.Model):
             'sales_amount': float(self.sales_amount),
             'work_date': self.work_date.isoformat(),
             'weekday': self.weekday,
+            'shift_start': self.shift_start.strftime('%H:%M') if self.shift_start else None,
+            'shift_end': self.shift_end.strftime('%H:%M') if self.shift_end else None,
             'total_tips': float(self.total_tips),
             'tips_per_hour': float(self.tips_per_hour),
             'tip_percentage': float(self.tip_percentage),
@@ -66,3 +76,240 @@ class TipEntry(db.Model):
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
+
+
+class TipEntryArchive(db.Model):
+    """A tip entry older than the archive horizon, moved out of tip_entries.
+
+    Same columns as TipEntry (ids are kept) and read-only. On Postgres the
+    table is range-partitioned by month of work_date; archive.py creates
+    the partitions as it moves rows.
+    """
+    __tablename__ = 'tip_entries_archive'
+    __table_args__ = (
+        db.Index('idx_tip_entries_archive_user_date', 'user_id', 'work_date'),
+        {'postgresql_partition_by': 'RANGE (work_date)'},
+    )
+
+    # Partitioned tables need the partition key in the primary key
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    work_date = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    cash_tips = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    card_tips = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    hours_worked = db.Column(db.Numeric(4, 2), nullable=False)
+    section = db.Column(db.String(50), nullable=True)
+    sales_amount = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    weekday = db.Column(db.Integer, nullable=False)
+    shift_start = db.Column(db.Time, nullable=True)
+    shift_end = db.Column(db.Time, nullable=True)
+    total_tips = db.Column(db.Numeric(10, 2), nullable=False)
+    tips_per_hour = db.Column(db.Numeric(8, 2), nullable=False)
+    tip_percentage = db.Column(db.Numeric(5, 2), nullable=False)
+    comments = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True))
+    updated_at = db.Column(db.DateTime(timezone=True))
+
+
+class TipArchiveSummary(db.Model):
+    """Monthly totals of archived entries for one (user, weekday, section)"""
+    __tablename__ = 'tip_archive_summaries'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'month', 'weekday', 'section', name='uq_tip_archive_summary'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    month = db.Column(db.Date, nullable=False)  # first day of the month
+    weekday = db.Column(db.Integer, nullable=False)
+    section = db.Column(db.String(50), nullable=False, default='')  # '' when the entry has none
+    cash_tips = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    card_tips = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    total_tips = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    hours_worked = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    sales_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    tips_per_hour_sum = db.Column(db.Numeric(14, 2), nullable=False, default=0)  # for averages
+    entries = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TipEntryTombstone(db.Model):
+    """Record of a deleted tip entry, so delta sync can report deletions"""
+    __tablename__ = 'tip_entry_tombstones'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tip_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.String, nullable=False, index=True)
+    work_date = db.Column(db.Date, nullable=False)
+    deleted_at = db.Column(db.DateTime(timezone=True), default=func.now(), nullable=False, index=True)
+
+
+class TipHeatmapCell(db.Model):
+    """Tips one user earned in a (weekday, hour of day, section) slot.
+
+    Maintained on every write from entries that have shift times; each
+    shift's tips and sales are spread over the hours it covers in
+    proportion to the minutes worked in each hour.
+    """
+    __tablename__ = 'tip_heatmap_cells'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'weekday', 'hour', 'section', name='uq_tip_heatmap_cell'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    weekday = db.Column(db.Integer, nullable=False)  # 0=Monday, 6=Sunday
+    hour = db.Column(db.Integer, nullable=False)  # 0-23
+    section = db.Column(db.String(50), nullable=False, default='')  # '' when the entry has none
+    total_tips = db.Column(db.Numeric(14, 4), nullable=False, default=0)
+    total_sales = db.Column(db.Numeric(14, 4), nullable=False, default=0)
+    total_hours = db.Column(db.Numeric(12, 4), nullable=False, default=0)
+    shifts = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TipEntryFlag(db.Model):
+    """An entry the anomaly job scored as an outlier against its baselines"""
+    __tablename__ = 'tip_entry_flags'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tip_id = db.Column(db.Integer, db.ForeignKey('tip_entries.id', ondelete='CASCADE'),
+                       nullable=False, unique=True)
+    user_id = db.Column(db.String, nullable=False, index=True)
+    work_date = db.Column(db.Date, nullable=False)
+    score = db.Column(db.Float, nullable=False)  # largest robust z-score among flagged metrics
+    reasons = db.Column(db.Text, nullable=False)  # JSON {metric: {value, z_user, z_section}}
+    flagged_at = db.Column(db.DateTime(timezone=True), default=func.now())
+
+    def to_dict(self):
+        return {
+            'tip_id': self.tip_id,
+            'user_id': self.user_id,
+            'work_date': self.work_date.isoformat(),
+            'score': round(self.score, 2),
+            'reasons': json.loads(self.reasons),
+            'flagged_at': self.flagged_at.isoformat() if self.flagged_at else None,
+        }
+
+
+class AnomalyBaseline(db.Model):
+    """Robust (median, scaled MAD) baseline of one metric for a weekday group"""
+    __tablename__ = 'anomaly_baselines'
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'group_key', 'weekday', 'metric', name='uq_anomaly_baseline'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)  # 'user' or 'section'
+    group_key = db.Column(db.String, nullable=False)  # user_id, or restaurant_id:section
+    weekday = db.Column(db.Integer, nullable=False)
+    metric = db.Column(db.String(30), nullable=False)
+    median = db.Column(db.Float, nullable=False)
+    sigma = db.Column(db.Float, nullable=False)  # 1.4826 * MAD
+    samples = db.Column(db.Integer, nullable=False)
+
+
+class JobState(db.Model):
+    """Small key/value store for background job progress (watermarks etc.)"""
+    __tablename__ = 'job_state'
+
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime(timezone=True), default=func.now(), onupdate=func.now())
+
+
+class UserSession(db.Model):
+    """Server-side session data; the cookie only carries the session token"""
+    __tablename__ = 'user_sessions'
+
+    id = db.Column(db.String(64), primary_key=True)  # sha256 of the cookie token
+    user_id = db.Column(db.String, nullable=True, index=True)
+    data = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime(timezone=True), default=func.now(), nullable=False)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+
+
+class TipPoolRule(db.Model):
+    """One tip pool rule for a restaurant.
+
+    'contribute' rules take `percent` of matching entries' tips into the
+    pool; 'receive' rules share `percent` of the pool among users with
+    matching entries, weighted by hours worked. A null section or role
+    matches anything.
+    """
+    __tablename__ = 'tip_pool_rules'
+
+    id = db.Column(db.Integer, primary_key=True)
+    restaurant_id = db.Column(db.String, nullable=True, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'contribute' or 'receive'
+    section = db.Column(db.String(50), nullable=True)
+    role = db.Column(db.String(20), nullable=True)
+    percent = db.Column(db.Numeric(5, 2), nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), default=func.now())
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'section': self.section,
+            'role': self.role,
+            'percent': float(self.percent),
+        }
+
+
+class PayrollSnapshot(db.Model):
+    """Tip pool distribution for one restaurant and pay period"""
+    __tablename__ = 'payroll_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    restaurant_id = db.Column(db.String, nullable=True, index=True)
+    period_start = db.Column(db.Date, nullable=False)
+    period_end = db.Column(db.Date, nullable=False)
+    rules = db.Column(db.Text, nullable=False)  # JSON copy of the rules used
+    pool_total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    computed_at = db.Column(db.DateTime(timezone=True), default=func.now())
+    updated_at = db.Column(db.DateTime(timezone=True), default=func.now(), onupdate=func.now())
+
+    lines = db.relationship('PayrollSnapshotLine', backref='snapshot', lazy=True,
+                            cascade='all, delete-orphan')
+
+    def to_dict(self, include_lines=True):
+        result = {
+            'id': self.id,
+            'restaurant_id': self.restaurant_id,
+            'period_start': self.period_start.isoformat(),
+            'period_end': self.period_end.isoformat(),
+            'pool_total': float(self.pool_total),
+            'computed_at': self.computed_at.isoformat() if self.computed_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+        if include_lines:
+            result['lines'] = [line.to_dict() for line in self.lines]
+        return result
+
+
+class PayrollSnapshotLine(db.Model):
+    """One person's pool result, plus the accumulators needed to update it"""
+    __tablename__ = 'payroll_snapshot_lines'
+
+    id = db.Column(db.Integer, primary_key=True)
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('payroll_snapshots.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
+    user_id = db.Column(db.String, nullable=False)
+    user_name = db.Column(db.String(255), nullable=True)
+    hours_worked = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    gross_tips = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    contribution_basis = db.Column(db.Numeric(16, 6), nullable=False, default=0)  # exact, pre-rounding
+    receive_hours = db.Column(db.Text, nullable=False, default='{}')  # JSON {rule_index: hours}
+    tips_contributed = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    tips_received = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    net_tips = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'user_name': self.user_name,
+            'hours_worked': float(self.hours_worked),
+            'gross_tips': float(self.gross_tips),
+            'tips_contributed': float(self.tips_contributed),
+            'tips_received': float(self.tips_received),
+            'net_tips': float(self.net_tips),
+        }
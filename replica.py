@@ -0,0 +1,244 @@
+"""Read-replica routing for read-only requests.
+
+With DATABASE_URL_READ set (one URL, or several separated by commas),
+GET and HEAD requests to the api blueprint read through a replica engine
+instead of the primary. Everything else stays on the primary:
+
+- writes (flushes and INSERT/UPDATE/DELETE statements) and SELECT ... FOR
+  UPDATE, and every read after the request's first write
+- views marked @use_primary (delta sync, where a lagging read would move
+  the client's watermark past rows it never saw)
+- a user's requests for READ_STICKY_SECONDS after they last wrote
+  (read-your-writes; the write time travels in a short-lived cookie so
+  it holds across workers), or longer while the replica lags behind it
+- replicas that failed their last check, are lagging more than
+  REPLICA_MAX_LAG_SECONDS, or raised a connection error
+
+A read that fails on its replica with an OperationalError (a dropped
+connection, a recovery conflict) marks the replica down and is re-run
+on the primary, so the request still succeeds.
+
+Replica health and lag are rechecked every REPLICA_CHECK_SECONDS on the
+scheduler's pool; requests only read the cached state.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+READ_URIS = [uri.strip() for uri in os.environ.get("DATABASE_URL_READ", "").split(",") if uri.strip()]
+READ_STICKY_SECONDS = float(os.environ.get("READ_STICKY_SECONDS", "5"))
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "10"))
+REPLICA_CHECK_SECONDS = float(os.environ.get("REPLICA_CHECK_SECONDS", "10"))
+WRITE_COOKIE = "db_write_at"
+
+# Seconds the replica is behind the primary; 0 when it has replayed all WAL it received
+PG_LAG_SQL = """
+SELECT CASE
+  WHEN NOT pg_is_in_recovery() THEN 0
+  WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+  ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class Replica:
+    """A read engine with its last known health and lag"""
+
+    def __init__(self, uri, engine):
+        self.uri = uri
+        self.engine = engine
+        self.healthy = False  # until the first check passes
+        self.lag = None
+        self.checked_at = None
+        self.last_error = None
+        self.reads = 0
+        self.failures = 0
+
+    @property
+    def stale(self):
+        return self.checked_at is None or time.monotonic() - self.checked_at > REPLICA_CHECK_SECONDS
+
+    def usable(self, since_write=None):
+        if not self.healthy or self.lag is None or self.lag > REPLICA_MAX_LAG_SECONDS:
+            return False
+        return since_write is None or since_write > max(READ_STICKY_SECONDS, self.lag)
+
+    def check(self):
+        try:
+            with self.engine.connect() as conn:
+                if self.engine.dialect.name == 'postgresql':
+                    lag = float(conn.execute(text(PG_LAG_SQL)).scalar() or 0)
+                else:
+                    conn.execute(text("SELECT 1"))
+                    lag = 0.0
+            self.healthy, self.lag, self.last_error = True, lag, None
+        except Exception as e:
+            self.healthy, self.last_error = False, str(e)
+            logger.warning("Read replica %s failed its check: %s", _safe_uri(self.uri), e)
+        self.checked_at = time.monotonic()
+        return self.healthy
+
+    def mark_down(self, error):
+        self.healthy, self.last_error = False, str(error)
+        self.failures += 1
+        logger.warning("Read replica %s marked down: %s", _safe_uri(self.uri), error)
+
+    def status(self):
+        return {
+            'uri': _safe_uri(self.uri),
+            'healthy': self.healthy,
+            'lag_seconds': self.lag,
+            'last_error': self.last_error,
+            'reads': self.reads,
+            'failures': self.failures,
+        }
+
+
+replicas = []
+_next = itertools.count()
+_lock = threading.Lock()
+
+
+def _safe_uri(uri):
+    from app import _safe_uri as safe
+    return safe(uri)
+
+
+def init_app(app, engine_options):
+    """Create the replica engines and the request hooks that route to them"""
+    for uri in READ_URIS:
+        options = dict(engine_options)
+        if uri.startswith('sqlite'):
+            options.pop('connect_args', None)
+        replica = Replica(uri, create_engine(uri, **options))
+
+        def on_error(context, replica=replica):
+            # A dropped or refused connection takes the replica out until its next good check
+            if context.is_disconnect or context.connection is None:
+                replica.mark_down(context.original_exception)
+
+        event.listen(replica.engine, 'handle_error', on_error)
+        replicas.append(replica)
+
+    if not replicas:
+        return
+    logger.info("Routing read-only requests to %d replica(s)", len(replicas))
+    app.before_request(_route_request)
+    app.after_request(_remember_write)
+
+
+def use_primary(view):
+    """Keep a read-only view on the primary"""
+    view.use_primary = True
+    return view
+
+
+def _route_request():
+    g.read_replica = None
+    if request.blueprint != 'api' or request.method not in ('GET', 'HEAD'):
+        return
+    view = current_app.view_functions.get(request.endpoint)
+    if view is None or getattr(view, 'use_primary', False):
+        return
+    try:
+        write_at = float(request.cookies[WRITE_COOKIE])
+    except (KeyError, ValueError):
+        write_at = None
+    g.read_replica = pick(write_at)
+
+
+def pick(write_at=None):
+    """A usable replica for a user who last wrote at write_at (epoch seconds), or None"""
+    since_write = None if write_at is None else time.time() - write_at
+    for replica in replicas:
+        if replica.stale:
+            _schedule_check(replica)
+    usable = [replica for replica in replicas if replica.usable(since_write)]
+    if not usable:
+        return None
+    with _lock:
+        replica = usable[next(_next) % len(usable)]
+        replica.reads += 1
+    return replica
+
+
+def _schedule_check(replica):
+    from scheduler import scheduler
+    scheduler.submit(replica.check, key=f'replica.check.{replicas.index(replica)}')
+
+
+def _remember_write(response):
+    if g.get('db_wrote'):
+        # Only needed until any replica could have caught up, so the cookie expires itself
+        response.set_cookie(WRITE_COOKIE, f'{time.time():.3f}', httponly=True, samesite='Lax',
+                            max_age=int(READ_STICKY_SECONDS + REPLICA_MAX_LAG_SECONDS) + 1)
+    return response
+
+
+def _mark_write():
+    if has_request_context():
+        g.db_wrote = True
+
+
+def status():
+    return [replica.status() for replica in replicas]
+
+
+class RoutingSession(Session):
+    """db.session that reads through the request's replica when there is one"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context():
+            replica = g.get('read_replica')
+            if replica is not None and not g.get('db_wrote') and not _is_write(clause):
+                return replica.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def execute(self, statement, *args, **kwargs):
+        return self._read_with_fallback(super().execute, statement, *args, **kwargs)
+
+    def scalar(self, statement, *args, **kwargs):
+        return self._read_with_fallback(super().scalar, statement, *args, **kwargs)
+
+    def scalars(self, statement, *args, **kwargs):
+        return self._read_with_fallback(super().scalars, statement, *args, **kwargs)
+
+    def _read_with_fallback(self, run, statement, *args, **kwargs):
+        replica = g.get('read_replica') if has_request_context() else None
+        if replica is None or g.get('db_wrote') or _is_write(statement):
+            return run(statement, *args, **kwargs)
+        try:
+            return run(statement, *args, **kwargs)
+        except OperationalError as e:
+            if replica.healthy:
+                replica.mark_down(e.orig)
+            logger.warning("Read failed on replica %s; retrying on the primary", _safe_uri(replica.uri))
+            # Nothing was written in this request (it would be on the primary otherwise)
+            g.read_replica = None
+            self.rollback()
+            return run(statement, *args, **kwargs)
+
+
+def _is_write(clause):
+    return isinstance(clause, UpdateBase) or getattr(clause, '_for_update_arg', None) is not None
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    _mark_write()
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _do_orm_execute(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        _mark_write()
@@ -0,0 +1,477 @@
+"""In-process scheduler for periodic maintenance and deferred work.
+
+Each app process runs one scheduler thread that fires interval and
+cron-style jobs on a small thread pool. Jobs marked `leader` run on only
+one process at a time: the run holds a transaction-level advisory lock
+on Postgres, or an flock'ed file next to the other temp files on SQLite,
+and a process that can't take the lock skips that run. Request handlers
+can hand work off with `submit()` (any callable) or `trigger()` (run a
+registered job now).
+
+Timing metrics are kept per process (GET /api/jobs) and each job's last
+run is recorded in job_state so every worker and the CLI can see it:
+
+    python scheduler.py list
+    python scheduler.py run anomaly.incremental
+"""
+import atexit
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+if __name__ == '__main__':
+    # The import of app below boots it; build it without a scheduler thread or
+    # health prober, so running one job doesn't also fire whatever else is due
+    os.environ['APP_ONE_SHOT'] = '1'
+
+from sqlalchemy import text
+
+from app import db
+from models import JobState
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, every process counts as leader
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") not in ("0", "false", "False")
+# Set by one-shot commands (python scheduler.py ...): no scheduler thread, no health prober
+APP_ONE_SHOT = os.environ.get("APP_ONE_SHOT", "0") in ("1", "true", "True")
+SCHEDULER_WORKERS = int(os.environ.get("SCHEDULER_WORKERS", "2"))
+SCHEDULER_TICK_SECONDS = float(os.environ.get("SCHEDULER_TICK_SECONDS", "1"))
+SCHEDULER_LOCK_DIR = os.environ.get("SCHEDULER_LOCK_DIR", tempfile.gettempdir())
+
+ANOMALY_INTERVAL_SECONDS = int(os.environ.get("ANOMALY_INTERVAL_SECONDS", "300"))
+ANOMALY_FULL_CRON = os.environ.get("ANOMALY_FULL_CRON", "15 3 * * *")
+TOMBSTONE_PRUNE_CRON = os.environ.get("TOMBSTONE_PRUNE_CRON", "0 3 * * *")
+ARCHIVE_CRON = os.environ.get("ARCHIVE_CRON", "30 2 * * *")
+SESSION_SWEEP_CRON = os.environ.get("SESSION_SWEEP_CRON", "20 * * * *")
+
+# (min, max) for minute, hour, day of month, month, day of week (0 = Sunday)
+CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+
+def _parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/', 1)
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-', 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f'Cron field out of range: {field}')
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+def parse_cron(expr):
+    """Parse 'minute hour day month weekday' into sets of allowed values.
+
+    Supports *, lists (1,15), ranges (1-5) and steps (*/10). Day of month
+    and day of week must both match.
+    """
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError(f'Cron expression needs 5 fields: {expr!r}')
+    try:
+        return tuple(_parse_cron_field(f, low, high) for f, (low, high) in zip(fields, CRON_RANGES))
+    except ValueError as e:
+        raise ValueError(f'Invalid cron expression {expr!r}: {e}')
+
+
+def next_cron_time(fields, after):
+    """First minute strictly after `after` (naive local time) matching the cron fields"""
+    minutes, hours, days, months, weekdays = fields
+    t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = t + timedelta(days=366 * 4)  # covers Feb 29
+    while t < limit:
+        if t.month not in months:
+            t = (t.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+        elif t.day not in days or (t.weekday() + 1) % 7 not in weekdays:
+            t = t.replace(hour=0, minute=0) + timedelta(days=1)
+        elif t.hour not in hours:
+            t = t.replace(minute=0) + timedelta(hours=1)
+        elif t.minute not in minutes:
+            t += timedelta(minutes=1)
+        else:
+            return t
+    raise ValueError('Cron expression never matches')
+
+
+class Job:
+    """A registered job with its schedule and per-process timing metrics"""
+
+    def __init__(self, name, func, interval=None, cron=None, leader=True, record=True):
+        if (interval is None) == (cron is None):
+            raise ValueError('Give a job either interval or cron')
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cron = cron
+        self.cron_fields = parse_cron(cron) if cron else None
+        self.leader = leader
+        self.record_runs = record  # save each run to job_state (off for frequent per-process jobs)
+        self.running = False
+        self.next_run = self.schedule_after(datetime.now())
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = None
+        self.last_started = None
+        self.last_error = None
+
+    def schedule_after(self, now):
+        if self.interval is not None:
+            return now + timedelta(seconds=self.interval)
+        return next_cron_time(self.cron_fields, now)
+
+    def record(self, started, seconds, error=None):
+        self.runs += 1
+        self.last_started = started
+        self.last_seconds = seconds
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if error is not None:
+            self.failures += 1
+            self.last_error = error
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'schedule': f'every {self.interval}s' if self.interval is not None else self.cron,
+            'leader': self.leader,
+            'running': self.running,
+            'next_run': self.next_run.isoformat(),
+            'runs': self.runs,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'last_started': self.last_started.isoformat() if self.last_started else None,
+            'last_seconds': round(self.last_seconds, 3) if self.last_seconds is not None else None,
+            'avg_seconds': round(self.total_seconds / self.runs, 3) if self.runs else None,
+            'max_seconds': round(self.max_seconds, 3),
+            'last_error': self.last_error,
+        }
+
+
+@contextmanager
+def leader_lock(name):
+    """Yield True if this process may run job `name` now, False if another holds it"""
+    if db.engine.dialect.name == 'postgresql':
+        # Transaction-level, so it also holds through PgBouncer in transaction mode
+        key = zlib.crc32(f'tiptracker.job.{name}'.encode())
+        with db.engine.connect() as conn, conn.begin():
+            yield bool(conn.execute(text('SELECT pg_try_advisory_xact_lock(:key)'), {'key': key}).scalar())
+        return
+
+    if fcntl is None:
+        yield True
+        return
+    database = zlib.crc32(str(db.engine.url).encode())
+    path = os.path.join(SCHEDULER_LOCK_DIR, f'tiptracker-{database:08x}-{name}.lock')
+    with open(path, 'a') as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _state_key(name):
+    return f'job.{name}'
+
+
+def _save_last_run(name, started, seconds, error, result):
+    state = db.session.get(JobState, _state_key(name)) or JobState(key=_state_key(name))
+    state.value = json.dumps({
+        'started': started.isoformat(),
+        'seconds': round(seconds, 3),
+        'status': 'failed' if error else 'ok',
+        'error': error,
+        'result': result,
+    }, default=str)
+    db.session.add(state)
+    db.session.commit()
+
+
+def last_runs():
+    """{job name: last recorded run} from job_state, across all processes"""
+    prefix = _state_key('')
+    states = JobState.query.filter(JobState.key.startswith(prefix)).all()
+    return {s.key[len(prefix):]: json.loads(s.value) for s in states if s.value}
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs = {}
+        self.app = None
+        self.executor = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.pending = set()  # keys of submitted tasks not yet finished
+        self.tasks = {'submitted': 0, 'completed': 0, 'failed': 0, 'coalesced': 0}
+
+    # ---- registration ----
+
+    def add_job(self, name, func, interval=None, cron=None, leader=True, record=True):
+        """Register func to run every `interval` seconds or on a cron schedule"""
+        with self.lock:
+            self.jobs[name] = Job(name, func, interval=interval, cron=cron, leader=leader, record=record)
+        return func
+
+    def every(self, seconds, name=None, leader=True):
+        def decorator(func):
+            return self.add_job(name or func.__name__, func, interval=seconds, leader=leader)
+        return decorator
+
+    def cron(self, expr, name=None, leader=True):
+        def decorator(func):
+            return self.add_job(name or func.__name__, func, cron=expr, leader=leader)
+        return decorator
+
+    # ---- lifecycle ----
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, app):
+        if self.running:
+            return
+        self.app = app
+        self.stop_event.clear()
+        self.executor = ThreadPoolExecutor(max_workers=SCHEDULER_WORKERS, thread_name_prefix='scheduler')
+        self.thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+        logger.info("Scheduler started with %d jobs", len(self.jobs))
+
+    def stop(self):
+        self.stop_event.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.thread = None
+
+    def _loop(self):
+        while not self.stop_event.wait(SCHEDULER_TICK_SECONDS):
+            now = datetime.now()
+            with self.lock:
+                due = [job for job in self.jobs.values() if job.next_run <= now]
+                for job in due:
+                    job.next_run = job.schedule_after(now)
+            for job in due:
+                self._dispatch(job)
+
+    def _dispatch(self, job):
+        with self.lock:
+            if job.running:
+                # Previous run still going: don't pile up
+                job.skipped += 1
+                return False
+            job.running = True
+        try:
+            self.executor.submit(self._run_in_context, job)
+        except RuntimeError:  # executor shut down
+            job.running = False
+            return False
+        return True
+
+    def _run_in_context(self, job):
+        with self.app.app_context():
+            return self._run(job)
+
+    def _run(self, job):
+        """Run a job under its leader lock; returns (ran, result)"""
+        job.running = True
+        try:
+            with (leader_lock(job.name) if job.leader else _no_lock()) as acquired:
+                if not acquired:
+                    job.skipped += 1
+                    logger.debug("Job %s is running on another worker; skipped", job.name)
+                    return False, None
+                started = datetime.now(timezone.utc)
+                start = time.perf_counter()
+                result = error = None
+                try:
+                    result = job.func()
+                except Exception as e:
+                    db.session.rollback()
+                    error = f'{type(e).__name__}: {e}'
+                    logger.exception("Job %s failed", job.name)
+                seconds = time.perf_counter() - start
+                job.record(started, seconds, error)
+                try:
+                    if job.record_runs:
+                        _save_last_run(job.name, started, seconds, error, result)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Could not record run of job %s", job.name)
+                if error:
+                    raise RuntimeError(error)
+                return True, result
+        finally:
+            job.running = False
+
+    # ---- handing work off ----
+
+    def run_job(self, name):
+        """Run a registered job now in the calling thread (needs an app context).
+
+        Returns (ran, result); ran is False when another worker holds the lock.
+        """
+        job = self.jobs.get(name)
+        if job is None:
+            raise KeyError(f'No job named {name}')
+        with self.lock:
+            if job.running:
+                job.skipped += 1
+                return False, None
+            job.running = True
+        return self._run(job)
+
+    def trigger(self, name):
+        """Queue a registered job to run now; no-op if it is running or the scheduler is stopped"""
+        job = self.jobs.get(name)
+        if job is None:
+            raise KeyError(f'No job named {name}')
+        if not self.running:
+            return False
+        return self._dispatch(job)
+
+    def submit(self, func, *args, key=None, **kwargs):
+        """Run func(*args, **kwargs) on the scheduler's pool with an app context.
+
+        Tasks with a `key` are dropped while another task with the same key
+        is still pending. When the scheduler isn't running (CLI scripts,
+        SCHEDULER_ENABLED=0) the task runs inline instead.
+        """
+        with self.lock:
+            if key is not None and key in self.pending:
+                self.tasks['coalesced'] += 1
+                return None
+            if key is not None:
+                self.pending.add(key)
+            self.tasks['submitted'] += 1
+
+        if not self.running:
+            return self._run_task(func, args, kwargs, key)
+        return self.executor.submit(self._run_task_in_context, func, args, kwargs, key)
+
+    def _run_task_in_context(self, func, args, kwargs, key):
+        with self.app.app_context():
+            return self._run_task(func, args, kwargs, key)
+
+    def _run_task(self, func, args, kwargs, key):
+        try:
+            result = func(*args, **kwargs)
+            outcome = 'completed'
+            return result
+        except Exception:
+            db.session.rollback()
+            outcome = 'failed'
+            logger.exception("Background task %s failed", getattr(func, '__name__', func))
+        finally:
+            with self.lock:
+                self.tasks[outcome] += 1
+                self.pending.discard(key)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'running': self.running,
+                'jobs': [job.to_dict() for job in self.jobs.values()],
+                'tasks': {**self.tasks, 'pending': len(self.pending)},
+            }
+
+
+@contextmanager
+def _no_lock():
+    yield True
+
+
+scheduler = Scheduler()
+
+
+def register_default_jobs():
+    """Register the built-in maintenance jobs"""
+    import anomaly
+    import archive
+    import sessions
+    import sync
+
+    scheduler.add_job('archive.run', archive.run, cron=ARCHIVE_CRON)
+    scheduler.add_job('sync.prune_tombstones', sync.prune_tombstones, cron=TOMBSTONE_PRUNE_CRON)
+    scheduler.add_job('sessions.sweep', sessions.sweep, cron=SESSION_SWEEP_CRON)
+    scheduler.add_job('anomaly.incremental', anomaly.run, interval=ANOMALY_INTERVAL_SECONDS)
+    scheduler.add_job('anomaly.full', functools.partial(anomaly.run, full=True), cron=ANOMALY_FULL_CRON)
+
+
+def init_app(app):
+    """Register the built-in jobs and start this process's scheduler thread"""
+    register_default_jobs()
+    if APP_ONE_SHOT:
+        logger.debug("One-shot process; not starting the scheduler")
+    elif SCHEDULER_ENABLED:
+        scheduler.start(app)
+    else:
+        logger.info("Scheduler disabled (SCHEDULER_ENABLED=0); run jobs with python scheduler.py")
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    from app import app
+    # app boot registered the jobs on the imported module, not this __main__ copy
+    from scheduler import scheduler, last_runs
+
+    parser = argparse.ArgumentParser(description='List or run scheduled jobs')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='Show jobs, schedules and their last recorded run')
+    run_parser = commands.add_parser('run', help='Run a job now (respects the leader lock)')
+    run_parser.add_argument('name')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'list':
+            recorded = last_runs()
+            for job in scheduler.jobs.values():
+                info = job.to_dict()
+                print(f"{job.name:28} {info['schedule']:16} next {info['next_run'][:16]}  "
+                      f"last {json.dumps(recorded.get(job.name), default=str)}")
+        else:
+            if args.name not in scheduler.jobs:
+                print(f'Unknown job {args.name}; known: {", ".join(scheduler.jobs)}', file=sys.stderr)
+                sys.exit(2)
+            try:
+                ran, result = scheduler.run_job(args.name)
+            except RuntimeError as e:
+                print(f'{args.name} failed: {e}', file=sys.stderr)
+                sys.exit(1)
+            if not ran:
+                print(f'{args.name} is running on another worker', file=sys.stderr)
+                sys.exit(1)
+            print(json.dumps(result, default=str))
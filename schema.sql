@@ -34,6 +34,8 @@ create table if not exists public.tip_entries (
   sales_amount numeric(10,2) not null default 0 check (sales_amount >= 0),
   work_date date not null,
   weekday smallint not null check (weekday between 0 and 6), -- 0=Mon .. 6=Sun
+  shift_start time, -- optional; shift_end <= shift_start means the shift ran past midnight
+  shift_end time,
   total_tips numeric(10,2) not null default 0,
   tips_per_hour numeric(8,2) not null default 0,
   tip_percentage numeric(5,2) not null default 0,
@@ -47,6 +49,168 @@ create index if not exists idx_tip_entries_user_id on public.tip_entries(user_id
 create index if not exists idx_tip_entries_work_date on public.tip_entries(work_date);
 create index if not exists idx_tip_entries_weekday on public.tip_entries(weekday);
 create index if not exists idx_tip_entries_user_date on public.tip_entries(user_id, work_date);
+create index if not exists idx_tip_entries_updated_at on public.tip_entries(updated_at);
+create index if not exists idx_tip_entries_user_updated on public.tip_entries(user_id, updated_at);
+-- Full-text search over comments (/api/tips/search); the expression must match search.py
+create index if not exists idx_tip_entries_comments_fts on public.tip_entries
+  using gin (to_tsvector('simple', coalesce(comments, '')));
+
+-- Existing installs: add the optional shift times
+alter table public.tip_entries add column if not exists shift_start time;
+alter table public.tip_entries add column if not exists shift_end time;
+
+-- HEATMAP: per-user tips by (weekday, hour of day, section), maintained by the app on write
+create table if not exists public.tip_heatmap_cells (
+  id bigserial primary key,
+  user_id uuid not null references public.users(id) on delete cascade,
+  weekday smallint not null check (weekday between 0 and 6),
+  hour smallint not null check (hour between 0 and 23),
+  section text not null default '',
+  total_tips numeric(14,4) not null default 0,
+  total_sales numeric(14,4) not null default 0,
+  total_hours numeric(12,4) not null default 0,
+  shifts integer not null default 0,
+  constraint uq_tip_heatmap_cell unique (user_id, weekday, hour, section)
+);
+
+-- TOMBSTONES: deleted entries, so /api/tips/changes can report deletions
+create table if not exists public.tip_entry_tombstones (
+  id bigserial primary key,
+  tip_id bigint not null,
+  user_id uuid not null references public.users(id) on delete cascade,
+  work_date date not null,
+  deleted_at timestamptz not null default now()
+);
+
+create index if not exists ix_tip_entry_tombstones_user_id on public.tip_entry_tombstones(user_id);
+create index if not exists ix_tip_entry_tombstones_deleted_at on public.tip_entry_tombstones(deleted_at);
+
+-- ARCHIVE: entries older than ARCHIVE_HORIZON_DAYS, moved here by archive.py (read-only).
+-- Partitioned by month of work_date; archive.py creates tip_entries_archive_YYYYMM partitions.
+create table if not exists public.tip_entries_archive (
+  id bigint not null,
+  user_id uuid not null references public.users(id) on delete cascade,
+  cash_tips numeric(10,2) not null default 0,
+  card_tips numeric(10,2) not null default 0,
+  hours_worked numeric(4,2) not null,
+  section text,
+  sales_amount numeric(10,2) not null default 0,
+  work_date date not null,
+  weekday smallint not null check (weekday between 0 and 6),
+  shift_start time,
+  shift_end time,
+  total_tips numeric(10,2) not null default 0,
+  tips_per_hour numeric(8,2) not null default 0,
+  tip_percentage numeric(5,2) not null default 0,
+  comments text,
+  created_at timestamptz,
+  updated_at timestamptz,
+  primary key (id, work_date)
+) partition by range (work_date);
+
+create index if not exists idx_tip_entries_archive_user_date on public.tip_entries_archive(user_id, work_date);
+
+-- Monthly totals of archived entries per (user, weekday, section) for /api/stats/monthly
+create table if not exists public.tip_archive_summaries (
+  id bigserial primary key,
+  user_id uuid not null references public.users(id) on delete cascade,
+  month date not null, -- first day of the month
+  weekday smallint not null check (weekday between 0 and 6),
+  section text not null default '',
+  cash_tips numeric(14,2) not null default 0,
+  card_tips numeric(14,2) not null default 0,
+  total_tips numeric(14,2) not null default 0,
+  hours_worked numeric(12,2) not null default 0,
+  sales_amount numeric(14,2) not null default 0,
+  tips_per_hour_sum numeric(14,2) not null default 0,
+  entries integer not null default 0,
+  constraint uq_tip_archive_summary unique (user_id, month, weekday, section)
+);
+
+-- ANOMALIES: entries flagged by anomaly.py, robust baselines and job watermarks
+create table if not exists public.tip_entry_flags (
+  id bigserial primary key,
+  tip_id bigint not null unique references public.tip_entries(id) on delete cascade,
+  user_id uuid not null references public.users(id) on delete cascade,
+  work_date date not null,
+  score double precision not null,
+  reasons text not null,
+  flagged_at timestamptz not null default now()
+);
+
+create index if not exists ix_tip_entry_flags_user_id on public.tip_entry_flags(user_id);
+
+create table if not exists public.anomaly_baselines (
+  id bigserial primary key,
+  scope text not null check (scope in ('user','section')),
+  group_key text not null,
+  weekday smallint not null check (weekday between 0 and 6),
+  metric text not null,
+  median double precision not null,
+  sigma double precision not null,
+  samples integer not null,
+  constraint uq_anomaly_baseline unique (scope, group_key, weekday, metric)
+);
+
+create table if not exists public.job_state (
+  key text primary key,
+  value text,
+  updated_at timestamptz not null default now()
+);
+
+-- SESSIONS: server-side session data; the cookie only carries a token whose sha256 is the id
+create table if not exists public.user_sessions (
+  id text primary key,
+  user_id uuid,
+  data text not null,
+  created_at timestamptz not null default now(),
+  expires_at timestamptz not null
+);
+
+create index if not exists ix_user_sessions_user_id on public.user_sessions(user_id);
+create index if not exists ix_user_sessions_expires_at on public.user_sessions(expires_at);
+
+-- TIP POOL: rules per restaurant and computed payroll snapshots
+create table if not exists public.tip_pool_rules (
+  id bigserial primary key,
+  restaurant_id uuid,
+  kind text not null check (kind in ('contribute','receive')),
+  section text,
+  role text check (role in ('server','manager')),
+  percent numeric(5,2) not null check (percent > 0 and percent <= 100),
+  created_at timestamptz not null default now()
+);
+
+create index if not exists ix_tip_pool_rules_restaurant_id on public.tip_pool_rules(restaurant_id);
+
+create table if not exists public.payroll_snapshots (
+  id bigserial primary key,
+  restaurant_id uuid,
+  period_start date not null,
+  period_end date not null,
+  rules text not null,
+  pool_total numeric(12,2) not null default 0,
+  computed_at timestamptz not null default now(),
+  updated_at timestamptz not null default now()
+);
+
+create index if not exists ix_payroll_snapshots_restaurant_id on public.payroll_snapshots(restaurant_id);
+
+create table if not exists public.payroll_snapshot_lines (
+  id bigserial primary key,
+  snapshot_id bigint not null references public.payroll_snapshots(id) on delete cascade,
+  user_id uuid not null,
+  user_name text,
+  hours_worked numeric(10,2) not null default 0,
+  gross_tips numeric(12,2) not null default 0,
+  contribution_basis numeric(16,6) not null default 0,
+  receive_hours text not null default '{}',
+  tips_contributed numeric(12,2) not null default 0,
+  tips_received numeric(12,2) not null default 0,
+  net_tips numeric(12,2) not null default 0
+);
+
+create index if not exists ix_payroll_snapshot_lines_snapshot_id on public.payroll_snapshot_lines(snapshot_id);
 
 -- Compute totals/tips_per_hour
 create or replace function public.calculate_tip_totals()
@@ -86,6 +250,17 @@ for each row execute function public.update_updated_at_column();
 -- Enable RLS per table
 alter table public.users enable row level security;
 alter table public.tip_entries enable row level security;
+alter table public.tip_entry_tombstones enable row level security;
+alter table public.tip_heatmap_cells enable row level security;
+alter table public.tip_entries_archive enable row level security;
+alter table public.tip_archive_summaries enable row level security;
+alter table public.tip_entry_flags enable row level security;
+alter table public.anomaly_baselines enable row level security;
+alter table public.job_state enable row level security;
+alter table public.user_sessions enable row level security;
+alter table public.tip_pool_rules enable row level security;
+alter table public.payroll_snapshots enable row level security;
+alter table public.payroll_snapshot_lines enable row level security;
 
 -- USERS RLS
 -- Users can select/update/insert only their own row (id must equal auth.uid()).
@@ -132,6 +307,55 @@ drop policy if exists "Users can delete own tip entries" on public.tip_entries;
 create policy "Users can delete own tip entries" on public.tip_entries
   for delete using (auth.uid() = user_id);
 
+-- TIP_ENTRY_TOMBSTONES RLS
+drop policy if exists "Users can view own tombstones" on public.tip_entry_tombstones;
+create policy "Users can view own tombstones" on public.tip_entry_tombstones
+  for select using (auth.uid() = user_id);
+
+-- TIP_HEATMAP_CELLS RLS
+drop policy if exists "Users can view own heatmap cells" on public.tip_heatmap_cells;
+create policy "Users can view own heatmap cells" on public.tip_heatmap_cells
+  for select using (auth.uid() = user_id);
+
+-- ARCHIVE RLS (read-only: rows are only moved by archive.py)
+drop policy if exists "Users can view own archived entries" on public.tip_entries_archive;
+create policy "Users can view own archived entries" on public.tip_entries_archive
+  for select using (auth.uid() = user_id);
+
+drop policy if exists "Users can view own archive summaries" on public.tip_archive_summaries;
+create policy "Users can view own archive summaries" on public.tip_archive_summaries
+  for select using (auth.uid() = user_id);
+
+-- TIP_ENTRY_FLAGS RLS (baselines, job state and sessions are server-side only: no policies)
+drop policy if exists "Users can view own flags" on public.tip_entry_flags;
+create policy "Users can view own flags" on public.tip_entry_flags
+  for select using (auth.uid() = user_id);
+
+-- TIP POOL RLS: managers can view their restaurant's rules and snapshots
+drop policy if exists "Managers can view pool rules" on public.tip_pool_rules;
+create policy "Managers can view pool rules" on public.tip_pool_rules
+  for select using (
+    exists (
+      select 1 from public.users me
+      where me.id = auth.uid() and me.role = 'manager'
+        and me.restaurant_id is not distinct from public.tip_pool_rules.restaurant_id
+    )
+  );
+
+drop policy if exists "Managers can view payroll snapshots" on public.payroll_snapshots;
+create policy "Managers can view payroll snapshots" on public.payroll_snapshots
+  for select using (
+    exists (
+      select 1 from public.users me
+      where me.id = auth.uid() and me.role = 'manager'
+        and me.restaurant_id is not distinct from public.payroll_snapshots.restaurant_id
+    )
+  );
+
+drop policy if exists "Users can view own payroll lines" on public.payroll_snapshot_lines;
+create policy "Users can view own payroll lines" on public.payroll_snapshot_lines
+  for select using (auth.uid() = user_id);
+
 -- View for stats (RLS applies via underlying tables; don't enable RLS on a view)
 create or replace view public.tip_statistics as
 select
@@ -0,0 +1,141 @@
+"""Full-text search over tip entry comments for /api/tips/search.
+
+Postgres uses a GIN index on to_tsvector('simple', comments) and ranks
+with ts_rank_cd. SQLite uses an external-content FTS5 table kept in sync
+by triggers and ranks with bm25. Queries are reduced to plain word
+tokens and every token must match (as a prefix), so user input can't
+produce syntax errors in either engine. If the SQLite build lacks FTS5,
+search falls back to LIKE.
+
+Results are ordered by (score, id) descending and paginated with an
+opaque cursor holding the last row's score and id.
+"""
+import base64
+import json
+import logging
+import re
+
+from sqlalchemy import Float, cast, column, func, literal_column, or_, and_, table, text
+
+from app import db
+from models import TipEntry
+
+logger = logging.getLogger(__name__)
+
+MAX_TOKENS = 8
+# No stemming: stemmed indexes miss partially typed words ('wedd' vs 'wed')
+TS_CONFIG = 'simple'
+
+FTS_TABLE = 'tip_entries_fts'
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "comments, content='tip_entries', content_rowid='id', tokenize='unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON tip_entries BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, comments) VALUES (new.id, new.comments); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON tip_entries BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, comments) VALUES ('delete', old.id, old.comments); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF comments ON tip_entries BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, comments) VALUES ('delete', old.id, old.comments); "
+    f"INSERT INTO {FTS_TABLE}(rowid, comments) VALUES (new.id, new.comments); END",
+]
+POSTGRES_DDL = [
+    "CREATE INDEX IF NOT EXISTS idx_tip_entries_comments_fts ON tip_entries "
+    f"USING gin (to_tsvector('{TS_CONFIG}', coalesce(comments, '')))",
+]
+
+_fts_table = table(FTS_TABLE, column('rowid'))
+_backend = None  # 'postgres', 'fts5' or 'like', set by ensure_index
+
+
+def ensure_index():
+    """Create the full-text index (and SQLite sync triggers) if missing"""
+    global _backend
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == 'postgresql':
+            with db.engine.begin() as conn:
+                for statement in POSTGRES_DDL:
+                    conn.execute(text(statement))
+            _backend = 'postgres'
+        elif dialect == 'sqlite':
+            with db.engine.begin() as conn:
+                existed = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': FTS_TABLE},
+                ).first() is not None
+                for statement in SQLITE_DDL:
+                    conn.execute(text(statement))
+                if not existed:
+                    # Index rows that predate the table
+                    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+            _backend = 'fts5'
+        else:
+            _backend = 'like'
+    except Exception as e:
+        logger.warning("Full-text index unavailable, search will use LIKE: %s", e)
+        _backend = 'like'
+    return _backend
+
+
+def tokenize(q):
+    """Lowercase word tokens of a query (at most MAX_TOKENS)"""
+    return re.findall(r'\w+', (q or '').lower())[:MAX_TOKENS]
+
+
+def encode_cursor(score, tip_id):
+    raw = json.dumps([score, tip_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (score, id) for a cursor, or None if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        score, tip_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(score), int(tip_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+def _match(query, tokens):
+    """Apply the match condition; returns (query, score expression)"""
+    backend = _backend or ensure_index()
+    if backend == 'postgres':
+        vector = func.to_tsvector(TS_CONFIG, func.coalesce(TipEntry.comments, ''))
+        tsquery = func.to_tsquery(TS_CONFIG, ' & '.join(f'{t}:*' for t in tokens))
+        # ts_rank_cd is real; as double the value ordered on is exactly the one the cursor sends back
+        return query.filter(vector.op('@@')(tsquery)), cast(func.ts_rank_cd(vector, tsquery), Float(53))
+    if backend == 'fts5':
+        fts = literal_column(FTS_TABLE)
+        expression = ' '.join(f'"{t}"*' for t in tokens)
+        query = query.join(_fts_table, _fts_table.c.rowid == TipEntry.id).filter(fts.op('MATCH')(expression))
+        # bm25 is lower-is-better
+        return query, -func.bm25(fts)
+    for t in tokens:
+        query = query.filter(TipEntry.comments.ilike(f'%{t}%'))
+    return query, literal_column('0.0')
+
+
+def search(query, q, limit, cursor=None):
+    """Run a search on an already scoped TipEntry query.
+
+    Returns ([(tip, score)], next_cursor).
+    """
+    tokens = tokenize(q)
+    query, score = _match(query, tokens)
+    score = score.label('score')
+    query = query.add_columns(score)
+    if cursor is not None:
+        last_score, last_id = cursor
+        query = query.filter(or_(
+            score < last_score,
+            and_(score == last_score, TipEntry.id < last_id),
+        ))
+    rows = query.order_by(score.desc(), TipEntry.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        tip, last = rows[-1]
+        next_cursor = encode_cursor(float(last), tip.id)
+    return [(tip, float(value)) for tip, value in rows], next_cursor
@@ -0,0 +1,231 @@
+"""Server-side sessions.
+
+The session cookie holds only a random token. The session data lives in
+user_sessions (keyed by the token's sha256, so the table alone can't be
+used to sign in) with a per-process LRU in front, so resolving
+`session['user']` is a dict lookup on most requests.
+
+Expiry slides: every request pushes a session's expiry out to
+SESSION_IDLE_SECONDS from now, written to the table (and the cookie) at
+most once per SESSION_TOUCH_SECONDS. Cached entries are re-read from the
+table after SESSION_CACHE_SECONDS, which bounds how long a session
+revoked on another worker keeps working here. Expired rows are deleted
+by the sessions.sweep job.
+"""
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import delete, insert, select, update
+from werkzeug.datastructures import CallbackDict
+
+from app import db
+from models import UserSession
+
+logger = logging.getLogger(__name__)
+
+SESSION_IDLE_SECONDS = int(os.environ.get("SESSION_IDLE_SECONDS", str(7 * 24 * 3600)))
+SESSION_TOUCH_SECONDS = int(os.environ.get("SESSION_TOUCH_SECONDS", "300"))
+SESSION_CACHE_SECONDS = float(os.environ.get("SESSION_CACHE_SECONDS", "30"))
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", "10000"))
+
+TABLE = UserSession.__table__
+
+
+def _key(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _epoch(value):
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def _datetime(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its token and whether it changed"""
+
+    def __init__(self, initial=None, token=None, expires_at=None):
+        def on_update(session):
+            session.modified = True
+            session.accessed = True
+
+        super().__init__(initial, on_update)
+        self.token = token
+        self.expires_at = expires_at
+        self.user_id = (initial or {}).get('user', {}).get('id')
+        self.modified = False
+
+
+class SessionStore:
+    """LRU of session rows in front of the user_sessions table"""
+
+    def __init__(self, max_entries=SESSION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> [data, user_id, expires_at, checked_at]
+        self.hits = 0
+        self.misses = 0
+
+    def _cache(self, key, data, user_id, expires_at):
+        with self.lock:
+            self.entries[key] = [data, user_id, expires_at, time.monotonic()]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _evict(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def load(self, token):
+        """(data, expires_at) for a live session token, or None"""
+        key = _key(token)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[3] < SESSION_CACHE_SECONDS:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                if entry[2] > now:
+                    return entry[0], entry[2]
+                del self.entries[key]
+                return None
+            self.misses += 1
+
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                select(TABLE.c.data, TABLE.c.user_id, TABLE.c.expires_at).where(TABLE.c.id == key)
+            ).first()
+        if row is None or _epoch(row.expires_at) <= now:
+            self._evict(key)
+            return None
+        data = json.loads(row.data)
+        self._cache(key, data, row.user_id, _epoch(row.expires_at))
+        return data, _epoch(row.expires_at)
+
+    def save(self, token, data, user_id, expires_at, new):
+        key = _key(token)
+        values = {'data': json.dumps(data), 'user_id': user_id, 'expires_at': _datetime(expires_at)}
+        with db.engine.begin() as conn:
+            if new:
+                conn.execute(insert(TABLE).values(id=key, created_at=datetime.now(timezone.utc), **values))
+            else:
+                conn.execute(update(TABLE).where(TABLE.c.id == key).values(**values))
+        self._cache(key, data, user_id, expires_at)
+
+    def touch(self, token, expires_at):
+        key = _key(token)
+        with db.engine.begin() as conn:
+            conn.execute(update(TABLE).where(TABLE.c.id == key).values(expires_at=_datetime(expires_at)))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry[2] = expires_at
+
+    def delete(self, token):
+        key = _key(token)
+        with db.engine.begin() as conn:
+            conn.execute(delete(TABLE).where(TABLE.c.id == key))
+        self._evict(key)
+
+    def revoke_user(self, user_id):
+        """Delete every session of a user; returns the number deleted"""
+        with db.engine.begin() as conn:
+            deleted = conn.execute(delete(TABLE).where(TABLE.c.user_id == user_id)).rowcount
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry[1] == user_id]:
+                del self.entries[key]
+        return deleted
+
+    def sweep(self):
+        """Delete expired sessions; returns the number deleted"""
+        now = time.time()
+        with db.engine.begin() as conn:
+            deleted = conn.execute(delete(TABLE).where(TABLE.c.expires_at <= _datetime(now))).rowcount
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry[2] <= now]:
+                del self.entries[key]
+        return deleted
+
+    def metrics(self):
+        with self.lock:
+            return {'cached': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+store = SessionStore()
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface backed by `store`"""
+
+    def open_session(self, app, request):
+        token = request.cookies.get(self.get_cookie_name(app))
+        if token:
+            try:
+                loaded = store.load(token)
+            except Exception:
+                # Sessions are unavailable with the database; treat the request as signed out
+                logger.exception("Could not load session")
+                loaded = None
+            if loaded is not None:
+                data, expires_at = loaded
+                return ServerSession(data, token=token, expires_at=expires_at)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        cookie = dict(domain=self.get_cookie_domain(app), path=self.get_cookie_path(app),
+                      secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+                      httponly=self.get_cookie_httponly(app))
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified:
+                if session.token:
+                    store.delete(session.token)
+                response.delete_cookie(name, **cookie)
+                response.vary.add("Cookie")
+            return
+
+        expires_at = time.time() + SESSION_IDLE_SECONDS
+        if session.modified:
+            user_id = (session.get('user') or {}).get('id')
+            # A new sign-in (or a different user) gets a fresh token
+            new = session.token is None or user_id != session.user_id
+            if new and session.token:
+                store.delete(session.token)
+            token = secrets.token_urlsafe(32) if new else session.token
+            store.save(token, dict(session), user_id, expires_at, new)
+        elif expires_at - session.expires_at >= SESSION_TOUCH_SECONDS:
+            token = session.token
+            store.touch(token, expires_at)
+        else:
+            return
+
+        response.set_cookie(name, token, expires=_datetime(expires_at), **cookie)
+        response.vary.add("Cookie")
+
+
+def init_app(app):
+    app.session_interface = ServerSessionInterface()
+
+
+def revoke_user(user_id):
+    return store.revoke_user(user_id)
+
+
+def sweep():
+    deleted = store.sweep()
+    logger.info("Swept %d expired sessions", deleted)
+    return {'deleted': deleted}
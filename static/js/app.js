@@ -2,6 +2,19 @@
 let currentUser = null;
 let charts = {};
 let demoMode = false;
+let eventSource = null;
+let teamRefreshTimer = null;
+let heatmapRefreshTimer = null;
+let bulkRefreshTimer = null;
+let tipSearchTimer = null;
+
+// Comment search over tip history; an empty query shows dashboardState.tips
+let tipSearch = { query: '', results: [], nextCursor: null };
+
+// Last dashboard payloads, patched in place by live updates
+let dashboardState = { breakdown: null, daily: [], weekday: [], section: [], tips: [] };
+const WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'];
+const TIP_CACHE_VERSION = 1;
 
 function escapeHtml(text) {
     const div = document.createElement('div');
@@ -14,6 +27,10 @@ function formatLocalDate(dateStr) {
     return new Date(year, month - 1, day).toLocaleDateString();
 }
 
+function toIsoDate(d) {
+    return `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}-${String(d.getDate()).padStart(2, '0')}`;
+}
+
 // Initialize app
 document.addEventListener('DOMContentLoaded', function() {
     checkAuthStatus();
@@ -48,6 +65,7 @@ async function checkAuthStatus() {
             showMainApp();
             await loadUserRole();
             loadDashboard();
+            startLiveUpdates();
             return;
         }
 
@@ -58,6 +76,7 @@ async function checkAuthStatus() {
             showMainApp();
             await loadUserRole();
             loadDashboard();
+            startLiveUpdates();
         } else {
             showAuthRequired();
         }
@@ -88,6 +107,8 @@ async function logout() {
     try {
         await supabase.auth.signOut();
         await fetch('/auth/logout', { method: 'POST' });
+        stopLiveUpdates();
+        clearTipCache();
         currentUser = null;
         showAuthRequired();
     } catch (error) {
@@ -222,6 +243,11 @@ async function loadUserRole() {
             roleElement.textContent = data.role.charAt(0).toUpperCase() + data.role.slice(1);
             roleElement.className = `badge ${data.role === 'manager' ? 'bg-warning' : 'bg-secondary'} ms-2`;
 
+            const teamRow = document.getElementById('teamLeaderboardRow');
+            if (teamRow) {
+                teamRow.classList.toggle('d-none', data.role !== 'manager');
+            }
+
             const userHeader = document.getElementById('userColumnHeader');
             if (userHeader) {
                 if (data.role === 'manager') {
@@ -268,6 +294,9 @@ function setupEventListeners() {
     document.getElementById('startDate').addEventListener('change', handleCustomDateChange);
     document.getElementById('endDate').addEventListener('change', handleCustomDateChange);
 
+    // Tip history comment search
+    document.getElementById('tipSearch').addEventListener('input', handleTipSearchInput);
+
     // Feature request / bug report submission
     document.getElementById('requestForm').addEventListener('submit', handleRequestSubmission);
 }
@@ -284,7 +313,10 @@ async function handleTipSubmission(e) {
     const formData = {
         cash_tips: parseFloat(document.getElementById('cashTips').value) || 0,
         card_tips: parseFloat(document.getElementById('cardTips').value) || 0,
-        hours_worked: parseFloat(document.getElementById('hoursWorked').value) || 0,
+        hours_worked: document.getElementById('hoursWorked').value === '' ? null :
+            parseFloat(document.getElementById('hoursWorked').value),
+        shift_start: document.getElementById('shiftStart').value || null,
+        shift_end: document.getElementById('shiftEnd').value || null,
         sales_amount: parseFloat(document.getElementById('totalSales').value) || 0,
         section: document.getElementById('section').value.trim().toLowerCase(),
         comments: document.getElementById('comments').value.trim(),
@@ -315,7 +347,11 @@ async function handleTipSubmission(e) {
             if (tipDateInput) {
                 tipDateInput.value = new Date().toISOString().split('T')[0];
             }
-            loadDashboard();
+            if (liveUpdatesActive()) {
+                loadSections();
+            } else {
+                loadDashboard();
+            }
         } else {
             if (result.errors) {
                 showAlert('Validation errors: ' + result.errors.join(', '), 'danger');
@@ -425,8 +461,14 @@ function getDateFilterParams() {
 async function loadDashboard() {
     loadQuickStats();
     loadTipEntries();
+    if (tipSearch.query) {
+        searchTips();
+    }
     loadCharts();
     loadSections();
+    if (currentUser && currentUser.role === 'manager') {
+        loadTeamStats();
+    }
 }
 
 // Load quick stats
@@ -437,39 +479,8 @@ async function loadQuickStats() {
         
         if (response.ok) {
             const data = await response.json();
-            const breakdown = data.breakdown;
-            
-            document.getElementById('quickStats').innerHTML = `
-                <div class="row">
-                    <div class="col-6 col-md-4 col-lg-2 mb-3 mb-lg-0">
-                        <h6 class="text-success">Total Tips</h6>
-                        <h4>$${breakdown.total_tips.toFixed(2)}</h4>
-                    </div>
-                    <div class="col-6 col-md-4 col-lg-2 mb-3 mb-lg-0">
-                        <h6 class="text-info">Cash</h6>
-                        <h5>$${breakdown.cash_tips.toFixed(2)}</h5>
-                        <small class="text-muted">${breakdown.cash_percentage}%</small>
-                    </div>
-                    <div class="col-6 col-md-4 col-lg-2 mb-3 mb-lg-0">
-                        <h6 class="text-warning">Card</h6>
-                        <h5>$${breakdown.card_tips.toFixed(2)}</h5>
-                        <small class="text-muted">${breakdown.card_percentage}%</small>
-                    </div>
-                    <div class="col-6 col-md-4 col-lg-2 mb-3 mb-lg-0">
-                        <h6 class="text-primary">Tip %</h6>
-                        <h5>${breakdown.tip_percentage.toFixed(2)}%</h5>
-                        <small class="text-muted">on $${breakdown.total_sales.toFixed(2)}</small>
-                    </div>
-                    <div class="col-6 col-md-4 col-lg-2 mb-3 mb-lg-0">
-                        <h6 class="text-secondary">Hours</h6>
-                        <h5>${breakdown.total_hours.toFixed(2)}</h5>
-                    </div>
-                    <div class="col-6 col-md-4 col-lg-2 mb-3 mb-lg-0">
-                        <h6 class="text-danger">Avg $/hr</h6>
-                        <h5>$${breakdown.avg_tips_per_hour.toFixed(2)}</h5>
-                    </div>
-                </div>
-            `;
+            dashboardState.breakdown = data.breakdown;
+            renderQuickStats(data.breakdown);
         }
     } catch (error) {
         console.error('Failed to load quick stats:', error);
@@ -477,6 +488,40 @@ async function loadQuickStats() {
     }
 }
 
+function renderQuickStats(breakdown) {
+    document.getElementById('quickStats').innerHTML = `
+        <div class="row">
+            <div class="col-6 col-md-4 col-lg-2 mb-3 mb-lg-0">
+                <h6 class="text-success">Total Tips</h6>
+                <h4>$${breakdown.total_tips.toFixed(2)}</h4>
+            </div>
+            <div class="col-6 col-md-4 col-lg-2 mb-3 mb-lg-0">
+                <h6 class="text-info">Cash</h6>
+                <h5>$${breakdown.cash_tips.toFixed(2)}</h5>
+                <small class="text-muted">${breakdown.cash_percentage}%</small>
+            </div>
+            <div class="col-6 col-md-4 col-lg-2 mb-3 mb-lg-0">
+                <h6 class="text-warning">Card</h6>
+                <h5>$${breakdown.card_tips.toFixed(2)}</h5>
+                <small class="text-muted">${breakdown.card_percentage}%</small>
+            </div>
+            <div class="col-6 col-md-4 col-lg-2 mb-3 mb-lg-0">
+                <h6 class="text-primary">Tip %</h6>
+                <h5>${breakdown.tip_percentage.toFixed(2)}%</h5>
+                <small class="text-muted">on $${breakdown.total_sales.toFixed(2)}</small>
+            </div>
+            <div class="col-6 col-md-4 col-lg-2 mb-3 mb-lg-0">
+                <h6 class="text-secondary">Hours</h6>
+                <h5>${breakdown.total_hours.toFixed(2)}</h5>
+            </div>
+            <div class="col-6 col-md-4 col-lg-2 mb-3 mb-lg-0">
+                <h6 class="text-danger">Avg $/hr</h6>
+                <h5>$${breakdown.avg_tips_per_hour.toFixed(2)}</h5>
+            </div>
+        </div>
+    `;
+}
+
 // Load sections for autocomplete
 async function loadSections() {
     try {
@@ -499,47 +544,244 @@ async function loadSections() {
 
 // Load tip entries
 async function loadTipEntries() {
+    if (demoMode) {
+        return loadDemoTipEntries();
+    }
+
+    try {
+        const range = getDateRange();
+        let cache = readTipCache();
+        const params = new URLSearchParams();
+
+        // Only ask for deltas when the cache already covers the requested window
+        if (cache && cache.coverageStart <= range.start) {
+            params.append('since', cache.syncToken);
+            params.append('start_date', cache.coverageStart);
+        } else {
+            cache = { version: TIP_CACHE_VERSION, coverageStart: range.start, syncToken: null, tips: {} };
+            params.append('start_date', range.start);
+        }
+
+        const response = await fetch(`/api/tips/changes?${params}`);
+        if (!response.ok) {
+            renderTipsTableError();
+            return;
+        }
+
+        const data = await response.json();
+        if (data.full) {
+            cache.tips = {};
+            cache.coverageStart = data.start_date;
+        }
+        data.deleted.forEach(id => { delete cache.tips[id]; });
+        data.tips.forEach(tip => { cache.tips[tip.id] = tip; });
+        cache.syncToken = data.sync_token;
+        writeTipCache(cache);
+
+        dashboardState.tips = Object.values(cache.tips)
+            .filter(tip => tip.work_date >= range.start && (!range.end || tip.work_date <= range.end))
+            .sort((a, b) => b.work_date.localeCompare(a.work_date));
+        renderTipsTable();
+    } catch (error) {
+        console.error('Failed to load tips:', error);
+        renderTipsTableError();
+    }
+}
+
+async function loadDemoTipEntries() {
     try {
         const params = getDateFilterParams();
         const response = await fetch(`/api/tips?${params}`);
-        const tbody = document.getElementById('tipsTableBody');
-        const isManager = currentUser && currentUser.role === 'manager';
-        const columnCount = isManager ? 12 : 11;
 
         if (response.ok) {
             const data = await response.json();
-            const tips = data.tips || [];
+            dashboardState.tips = data.tips || [];
+            renderTipsTable();
+        } else {
+            renderTipsTableError();
+        }
+    } catch (error) {
+        console.error('Failed to load tips:', error);
+        renderTipsTableError();
+    }
+}
 
-            if (!tips.length) {
-                tbody.innerHTML = `<tr><td colspan="${columnCount}" class="text-center text-muted">No entries found</td></tr>`;
-                return;
-            }
+// Current date filter as {start, end} ISO dates (end is null for "last N days")
+function getDateRange() {
+    const selectedFilter = document.querySelector('input[name="dateFilter"]:checked').value;
+    if (selectedFilter === 'custom') {
+        const startDate = document.getElementById('startDate').value;
+        const endDate = document.getElementById('endDate').value;
+        if (startDate && endDate) {
+            return { start: startDate, end: endDate };
+        }
+    }
+    const start = new Date();
+    start.setDate(start.getDate() - (parseInt(selectedFilter, 10) || 30));
+    return { start: toIsoDate(start), end: null };
+}
+
+// ---------- Local tip cache (synced via /api/tips/changes) ----------
+
+function tipCacheKey() {
+    return currentUser ? `tipCache:${currentUser.id}:${currentUser.role || 'server'}` : null;
+}
+
+function readTipCache() {
+    const key = tipCacheKey();
+    if (!key) {
+        return null;
+    }
+    try {
+        const cache = JSON.parse(localStorage.getItem(key));
+        return cache && cache.version === TIP_CACHE_VERSION && cache.syncToken ? cache : null;
+    } catch (error) {
+        return null;
+    }
+}
+
+function writeTipCache(cache) {
+    const key = tipCacheKey();
+    if (!key) {
+        return;
+    }
+    try {
+        localStorage.setItem(key, JSON.stringify(cache));
+    } catch (error) {
+        // Quota exceeded: drop the cache and fetch full windows next time
+        localStorage.removeItem(key);
+    }
+}
+
+function clearTipCache() {
+    Object.keys(localStorage)
+        .filter(key => key.startsWith('tipCache:'))
+        .forEach(key => localStorage.removeItem(key));
+}
+
+function renderTipsTable() {
+    const tbody = document.getElementById('tipsTableBody');
+    const isManager = currentUser && currentUser.role === 'manager';
+    const columnCount = isManager ? 12 : 11;
+    const searching = tipSearch.query !== '';
+    const tips = searching ? tipSearch.results : dashboardState.tips;
+
+    if (!tips.length) {
+        const message = searching ? 'No matching entries' : 'No entries found';
+        tbody.innerHTML = `<tr><td colspan="${columnCount}" class="text-center text-muted">${message}</td></tr>`;
+        return;
+    }
 
-            tbody.innerHTML = tips.map(tip => `
+    tbody.innerHTML = tips.map(tip => `
+        <tr>
+            <td>${formatLocalDate(tip.work_date)}</td>
+            ${isManager ? `<td>${tip.user_name ? escapeHtml(tip.user_name) : ''}</td>` : ''}
+            <td>${tip.section ? escapeHtml(tip.section) : ''}</td>
+            <td>$${tip.sales_amount.toFixed(2)}</td>
+            <td>$${tip.cash_tips.toFixed(2)}</td>
+            <td>$${tip.card_tips.toFixed(2)}</td>
+            <td>$${tip.total_tips.toFixed(2)}</td>
+            <td>${tip.tip_percentage.toFixed(2)}%</td>
+            <td>${tip.hours_worked.toFixed(2)}</td>
+            <td>$${tip.tips_per_hour.toFixed(2)}</td>
+            <td>${tip.comments ? escapeHtml(tip.comments) : ''}</td>
+            <td><button class="btn btn-sm btn-outline-danger" onclick="deleteTip(${tip.id})"><i class="fas fa-trash"></i></button></td>
+        </tr>
+    `).join('');
+
+    if (searching && tipSearch.nextCursor) {
+        tbody.innerHTML += `<tr><td colspan="${columnCount}" class="text-center">
+            <button class="btn btn-sm btn-outline-primary" onclick="searchTips(true)">Load more</button>
+        </td></tr>`;
+    }
+}
+
+function handleTipSearchInput(e) {
+    clearTimeout(tipSearchTimer);
+    tipSearch = { query: e.target.value.trim(), results: [], nextCursor: null };
+    if (!tipSearch.query) {
+        renderTipsTable();
+        return;
+    }
+    tipSearchTimer = setTimeout(() => searchTips(), 300);
+}
+
+// Search comments within the current date filter; `more` appends the next page
+async function searchTips(more = false) {
+    const query = tipSearch.query;
+    const params = getDateFilterParams();
+    params.append('q', query);
+    if (more && tipSearch.nextCursor) {
+        params.append('cursor', tipSearch.nextCursor);
+    }
+
+    try {
+        const response = await fetch(`/api/tips/search?${params}`);
+        if (query !== tipSearch.query) {
+            return;  // a newer search is in flight
+        }
+        if (!response.ok) {
+            renderTipsTableError();
+            return;
+        }
+        const data = await response.json();
+        tipSearch.results = more ? tipSearch.results.concat(data.tips) : data.tips;
+        tipSearch.nextCursor = data.next_cursor;
+        renderTipsTable();
+    } catch (error) {
+        console.error('Failed to search tips:', error);
+        renderTipsTableError();
+    }
+}
+
+function renderTipsTableError() {
+    const tbody = document.getElementById('tipsTableBody');
+    const isManager = currentUser && currentUser.role === 'manager';
+    const columnCount = isManager ? 12 : 11;
+    tbody.innerHTML = `<tr><td colspan="${columnCount}" class="text-center text-danger">Failed to load entries</td></tr>`;
+}
+
+// Load manager leaderboard
+async function loadTeamStats() {
+    const tbody = document.getElementById('teamTableBody');
+    try {
+        const params = getDateFilterParams();
+        const response = await fetch(`/api/stats/team?${params}`);
+        if (!response.ok) {
+            tbody.innerHTML = '<tr><td colspan="7" class="text-center text-danger">Failed to load leaderboard</td></tr>';
+            return;
+        }
+
+        const data = await response.json();
+        if (!data.team.length) {
+            tbody.innerHTML = '<tr><td colspan="7" class="text-center text-muted">No entries found</td></tr>';
+            return;
+        }
+
+        tbody.innerHTML = data.team.map(member => {
+            const delta = member.delta;
+            const tipsClass = delta.total_tips >= 0 ? 'text-success' : 'text-danger';
+            let rankChange = '';
+            if (delta.rank > 0) {
+                rankChange = `<span class="text-success ms-2"><i class="fas fa-arrow-up"></i>${delta.rank}</span>`;
+            } else if (delta.rank < 0) {
+                rankChange = `<span class="text-danger ms-2"><i class="fas fa-arrow-down"></i>${-delta.rank}</span>`;
+            }
+            return `
                 <tr>
-                    <td>${formatLocalDate(tip.work_date)}</td>
-                    ${isManager ? `<td>${tip.user_name ? escapeHtml(tip.user_name) : ''}</td>` : ''}
-                    <td>${tip.section ? escapeHtml(tip.section) : ''}</td>
-                    <td>$${tip.sales_amount.toFixed(2)}</td>
-                    <td>$${tip.cash_tips.toFixed(2)}</td>
-                    <td>$${tip.card_tips.toFixed(2)}</td>
-                    <td>$${tip.total_tips.toFixed(2)}</td>
-                    <td>${tip.tip_percentage.toFixed(2)}%</td>
-                    <td>${tip.hours_worked.toFixed(2)}</td>
-                    <td>$${tip.tips_per_hour.toFixed(2)}</td>
-                    <td>${tip.comments ? escapeHtml(tip.comments) : ''}</td>
-                    <td><button class="btn btn-sm btn-outline-danger" onclick="deleteTip(${tip.id})"><i class="fas fa-trash"></i></button></td>
+                    <td>${member.rank}${rankChange}</td>
+                    <td>${escapeHtml(member.user_name || '')}</td>
+                    <td>$${member.total_tips.toFixed(2)}</td>
+                    <td>$${member.tips_per_hour.toFixed(2)}</td>
+                    <td>${member.tip_percentage.toFixed(2)}%</td>
+                    <td>${member.total_hours.toFixed(2)}</td>
+                    <td class="${tipsClass}">${delta.total_tips >= 0 ? '+' : '-'}$${Math.abs(delta.total_tips).toFixed(2)}</td>
                 </tr>
-            `).join('');
-        } else {
-            tbody.innerHTML = `<tr><td colspan="${columnCount}" class="text-center text-danger">Failed to load entries</td></tr>`;
-        }
+            `;
+        }).join('');
     } catch (error) {
-        console.error('Failed to load tips:', error);
-        const tbody = document.getElementById('tipsTableBody');
-        const isManager = currentUser && currentUser.role === 'manager';
-        const columnCount = isManager ? 12 : 11;
-        tbody.innerHTML = `<tr><td colspan="${columnCount}" class="text-center text-danger">Failed to load entries</td></tr>`;
+        console.error('Failed to load team stats:', error);
+        tbody.innerHTML = '<tr><td colspan="7" class="text-center text-danger">Failed to load leaderboard</td></tr>';
     }
 }
 
@@ -561,7 +803,9 @@ async function deleteTip(id) {
 
         if (response.ok) {
             showAlert('Tip entry deleted', 'success');
-            loadDashboard();
+            if (!liveUpdatesActive()) {
+                loadDashboard();
+            }
         } else {
             const result = await response.json();
             showAlert('Failed to delete tip entry: ' + (result.error || 'Unknown error'), 'danger');
@@ -592,6 +836,7 @@ async function loadDailyChart() {
         if (response.ok) {
             const data = await response.json();
             const dailyStats = data.daily_stats;
+            dashboardState.daily = dailyStats;
             
             const ctx = document.getElementById('dailyChart').getContext('2d');
             
@@ -649,6 +894,7 @@ async function loadBreakdownChart() {
         if (response.ok) {
             const data = await response.json();
             const breakdown = data.breakdown;
+            dashboardState.breakdown = breakdown;
             
             const ctx = document.getElementById('breakdownChart').getContext('2d');
             
@@ -693,6 +939,7 @@ async function loadWeekdayChart() {
         if (response.ok) {
             const data = await response.json();
             const weekdayStats = data.weekday_stats;
+            dashboardState.weekday = weekdayStats;
             
             const ctx = document.getElementById('weekdayChart').getContext('2d');
             
@@ -739,15 +986,22 @@ async function loadWeekdayChart() {
     }
 }
 
-// Load hourly chart
+// Load hourly chart (all-time tips per hour by hour of day, from the heatmap cube)
 async function loadHourlyChart() {
     try {
-        const params = getDateFilterParams();
-        const response = await fetch(`/api/stats/daily?${params}`);
+        const params = new URLSearchParams();
+        if (demoMode) {
+            params.append('demo', 'true');
+        }
+        const response = await fetch(`/api/stats/heatmap?${params}`);
         
         if (response.ok) {
             const data = await response.json();
-            const dailyStats = data.daily_stats;
+            const byHour = Array.from({ length: 24 }, () => ({ tips: 0, hours: 0 }));
+            data.heatmap.forEach(cell => {
+                byHour[cell.hour].tips += cell.total_tips;
+                byHour[cell.hour].hours += cell.total_hours;
+            });
             
             const ctx = document.getElementById('hourlyChart').getContext('2d');
             
@@ -759,10 +1013,10 @@ async function loadHourlyChart() {
             charts.hourly = new Chart(ctx, {
                 type: 'bar',
                 data: {
-                    labels: dailyStats.map(stat => formatLocalDate(stat.date)),
+                    labels: byHour.map((_, hour) => formatHour(hour)),
                     datasets: [{
                         label: 'Tips per Hour',
-                        data: dailyStats.map(stat => stat.avg_tips_per_hour),
+                        data: byHour.map(h => h.hours > 0 ? h.tips / h.hours : 0),
                         backgroundColor: '#dc3545',
                         borderColor: '#dc3545',
                         borderWidth: 1
@@ -794,6 +1048,11 @@ async function loadHourlyChart() {
     }
 }
 
+function formatHour(hour) {
+    const suffix = hour < 12 ? 'AM' : 'PM';
+    return `${hour % 12 || 12} ${suffix}`;
+}
+
 // Load tip percentage chart
 async function loadPercentageChart() {
     try {
@@ -859,6 +1118,7 @@ async function loadSectionChart() {
         if (response.ok) {
             const data = await response.json();
             const sectionStats = data.section_stats;
+            dashboardState.section = sectionStats;
 
             const ctx = document.getElementById('sectionChart').getContext('2d');
 
@@ -904,6 +1164,182 @@ async function loadSectionChart() {
     }
 }
 
+// ---------- Live updates (Server-Sent Events) ----------
+
+function startLiveUpdates() {
+    if (eventSource || !window.EventSource) {
+        return;
+    }
+
+    let connectedBefore = false;
+    eventSource = new EventSource('/api/stream');
+    eventSource.onopen = function() {
+        // Events may have been missed while disconnected
+        if (connectedBefore && !demoMode) {
+            loadDashboard();
+        }
+        connectedBefore = true;
+    };
+    eventSource.addEventListener('tip_created', e => applyTipEvent(JSON.parse(e.data)));
+    eventSource.addEventListener('tip_deleted', e => applyTipEvent(JSON.parse(e.data)));
+    eventSource.addEventListener('tips_bulk_changed', () => {
+        // Many entries changed at once (one event per user); refetch once they settle
+        if (!demoMode) {
+            clearTimeout(bulkRefreshTimer);
+            bulkRefreshTimer = setTimeout(loadDashboard, 500);
+        }
+    });
+    eventSource.addEventListener('resync', () => {
+        if (!demoMode) {
+            loadDashboard();
+        }
+    });
+}
+
+function stopLiveUpdates() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+}
+
+function liveUpdatesActive() {
+    return eventSource !== null && eventSource.readyState === EventSource.OPEN;
+}
+
+// Is a YYYY-MM-DD work date inside the dashboard's current date filter?
+function isInDateWindow(workDate) {
+    const range = getDateRange();
+    return workDate >= range.start && (!range.end || workDate <= range.end);
+}
+
+// Patch dashboard state and charts for one created/deleted entry
+function applyTipEvent(event) {
+    const tip = event.tip;
+    if (demoMode || !isInDateWindow(tip.work_date)) {
+        return;
+    }
+    const sign = event.type === 'tip_created' ? 1 : -1;
+
+    patchBreakdown(event.breakdown_delta);
+    patchDailyStats(tip, sign);
+    patchAverage(dashboardState.weekday, stat => stat.weekday === tip.weekday, tip.total_tips, sign,
+        () => ({ weekday: tip.weekday, weekday_name: WEEKDAY_NAMES[tip.weekday] }),
+        (a, b) => a.weekday - b.weekday);
+    if (tip.section) {
+        patchAverage(dashboardState.section, stat => stat.section === tip.section, tip.total_tips, sign,
+            () => ({ section: tip.section }),
+            (a, b) => a.section.localeCompare(b.section));
+    }
+    patchTips(tip, sign);
+    if (currentUser && currentUser.role === 'manager') {
+        // Ranks depend on the whole team; refetch once a burst of events settles
+        clearTimeout(teamRefreshTimer);
+        teamRefreshTimer = setTimeout(loadTeamStats, 2000);
+    }
+    if (tip.shift_start && tip.shift_end) {
+        // The heatmap spreads shifts across hours server-side; refetch once events settle
+        clearTimeout(heatmapRefreshTimer);
+        heatmapRefreshTimer = setTimeout(loadHourlyChart, 2000);
+    }
+
+    updateChart(charts.weekday, dashboardState.weekday.map(stat => stat.weekday_name),
+        dashboardState.weekday.map(stat => stat.avg_tips));
+    updateChart(charts.section, dashboardState.section.map(stat => stat.section || 'Unknown'),
+        dashboardState.section.map(stat => stat.avg_tips));
+}
+
+function patchBreakdown(delta) {
+    const b = dashboardState.breakdown;
+    if (!b) {
+        return;
+    }
+    b.cash_tips += delta.cash_tips;
+    b.card_tips += delta.card_tips;
+    b.total_tips += delta.total_tips;
+    b.total_sales += delta.total_sales;
+    b.total_hours += delta.total_hours;
+    b.cash_percentage = b.total_tips > 0 ? Math.round(b.cash_tips / b.total_tips * 1000) / 10 : 0;
+    b.card_percentage = b.total_tips > 0 ? Math.round(b.card_tips / b.total_tips * 1000) / 10 : 0;
+    b.tip_percentage = b.total_sales > 0 ? b.total_tips / b.total_sales * 100 : 0;
+    b.avg_tips_per_hour = b.total_hours > 0 ? b.total_tips / b.total_hours : 0;
+
+    renderQuickStats(b);
+    if (charts.breakdown) {
+        charts.breakdown.data.datasets[0].data = [b.cash_tips, b.card_tips];
+        charts.breakdown.update('none');
+    }
+}
+
+function patchDailyStats(tip, sign) {
+    const daily = dashboardState.daily;
+    let stat = daily.find(s => s.date === tip.work_date);
+    if (!stat) {
+        if (sign < 0) {
+            return;
+        }
+        stat = { date: tip.work_date, total_cash: 0, total_card: 0, total_tips: 0, total_hours: 0,
+                 avg_tips_per_hour: 0, total_sales: 0, avg_tip_percentage: 0, entries: 0 };
+        daily.push(stat);
+        daily.sort((a, b) => a.date.localeCompare(b.date));
+    }
+
+    const entries = stat.entries + sign;
+    stat.avg_tips_per_hour = entries > 0 ? (stat.avg_tips_per_hour * stat.entries + sign * tip.tips_per_hour) / entries : 0;
+    stat.entries = entries;
+    stat.total_cash += sign * tip.cash_tips;
+    stat.total_card += sign * tip.card_tips;
+    stat.total_tips += sign * tip.total_tips;
+    stat.total_hours += sign * tip.hours_worked;
+    stat.total_sales += sign * tip.sales_amount;
+    stat.avg_tip_percentage = stat.total_sales > 0 ? stat.total_tips / stat.total_sales * 100 : 0;
+    if (entries <= 0) {
+        daily.splice(daily.indexOf(stat), 1);
+    }
+
+    const labels = daily.map(s => formatLocalDate(s.date));
+    updateChart(charts.daily, labels, daily.map(s => s.total_tips));
+    updateChart(charts.percentage, labels, daily.map(s => s.avg_tip_percentage));
+}
+
+// Update a running average ({avg_tips, entries}) in a stats list
+function patchAverage(list, match, value, sign, create, compare) {
+    let stat = list.find(match);
+    if (!stat) {
+        if (sign < 0) {
+            return;
+        }
+        stat = { ...create(), avg_tips: 0, entries: 0 };
+        list.push(stat);
+        list.sort(compare);
+    }
+    const entries = stat.entries + sign;
+    stat.avg_tips = entries > 0 ? (stat.avg_tips * stat.entries + sign * value) / entries : 0;
+    stat.entries = entries;
+    if (entries <= 0) {
+        list.splice(list.indexOf(stat), 1);
+    }
+}
+
+function patchTips(tip, sign) {
+    const tips = dashboardState.tips.filter(t => t.id !== tip.id);
+    if (sign > 0) {
+        tips.push(tip);
+        tips.sort((a, b) => b.work_date.localeCompare(a.work_date));
+    }
+    dashboardState.tips = tips;
+    renderTipsTable();
+}
+
+function updateChart(chart, labels, data) {
+    if (!chart) {
+        return;
+    }
+    chart.data.labels = labels;
+    chart.data.datasets[0].data = data;
+    chart.update('none');
+}
+
 // Utility function to show alerts
 function showAlert(message, type = 'info') {
     const alertArea = document.getElementById('alertArea');
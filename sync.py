@@ -0,0 +1,65 @@
+"""Sync tokens and tombstone retention for /api/tips/changes.
+
+A sync token is an opaque, URL-safe encoding of the newest modification
+time the client has seen. Deltas are computed with a small overlap before
+that watermark, because a transaction can commit after a later one and
+still carry an older timestamp; clients merge idempotently by id.
+"""
+import base64
+import os
+from datetime import datetime, timedelta, timezone
+
+from app import db
+from models import TipEntryTombstone
+
+SYNC_OVERLAP_SECONDS = int(os.environ.get("SYNC_OVERLAP_SECONDS", "5"))
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get("TOMBSTONE_RETENTION_DAYS", "30"))
+
+
+def encode_token(watermark):
+    return base64.urlsafe_b64encode(watermark.isoformat().encode()).decode().rstrip("=")
+
+
+def decode_token(token):
+    """Return the watermark datetime for a token, or None if it is malformed"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        return datetime.fromisoformat(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _utc(value):
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def token_expired(watermark):
+    """Tokens older than the tombstone retention can't be served as deltas"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    return _utc(watermark) < cutoff
+
+
+def delta_floor(watermark):
+    return watermark - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+
+
+def next_watermark(watermark, started_at, timestamps):
+    """Latest of the previous watermark, the returned rows and the request start.
+
+    The request start (minus the overlap) keeps idle scopes from sliding
+    out of the tombstone retention window.
+    """
+    best = started_at - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+    for value in (watermark, *timestamps):
+        if value is not None and _utc(value) > _utc(best):
+            best = value
+    return best
+
+
+def prune_tombstones():
+    """Delete tombstones older than the retention window; returns rows removed"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    removed = TipEntryTombstone.query.filter(TipEntryTombstone.deleted_at < cutoff).delete(
+        synchronize_session=False)
+    db.session.commit()
+    return removed
@@ -0,0 +1,319 @@
+"""Tip pool engine: pool rules, pay-period distributions and payroll snapshots.
+
+A restaurant's rules say how much of each entry's tips goes into the pool
+(contribute rules) and how the pool is shared out by hours worked
+(receive rules). Money is handled as Decimal and every split uses
+largest-remainder rounding, so contributions and shares add up to the
+pool exactly to the cent.
+
+Snapshots keep per-person accumulators (hours, gross tips, exact
+contribution basis, hours per receive rule). A late or deleted entry is
+folded into those accumulators and only the cheap allocation step is
+re-run, instead of re-reading the whole pay period.
+"""
+import json
+from datetime import date
+from decimal import Decimal, ROUND_FLOOR, ROUND_HALF_UP
+
+from sqlalchemy import or_
+
+from app import db
+from models import User, TipPoolRule, PayrollSnapshot, PayrollSnapshotLine
+import archive
+
+ZERO = Decimal('0')
+HUNDRED = Decimal('100')
+RULE_KINDS = ('contribute', 'receive')
+RULE_ROLES = (None, 'server', 'manager')
+
+
+class PoolRuleError(ValueError):
+    """Raised when a rule set can't be used to distribute a pool"""
+
+
+def scope_filter(column, restaurant_id):
+    return column.is_(None) if restaurant_id is None else column == restaurant_id
+
+
+# ---------- Rules ----------
+
+def load_rules(restaurant_id):
+    rules = TipPoolRule.query.filter(scope_filter(TipPoolRule.restaurant_id, restaurant_id)) \
+        .order_by(TipPoolRule.id).all()
+    return [_rule_dict(r.kind, r.section, r.role, r.percent) for r in rules]
+
+
+def _rule_dict(kind, section, role, percent):
+    return {'kind': kind, 'section': section, 'role': role, 'percent': str(Decimal(str(percent)))}
+
+
+def validate_rules(data):
+    """Normalize a list of rule dicts; raises PoolRuleError on bad input"""
+    if not isinstance(data, list):
+        raise PoolRuleError('Rules must be a list')
+
+    rules = []
+    for item in data:
+        if not isinstance(item, dict):
+            raise PoolRuleError('Each rule must be an object')
+        kind = item.get('kind')
+        if kind not in RULE_KINDS:
+            raise PoolRuleError("Rule kind must be 'contribute' or 'receive'")
+        section = item.get('section')
+        if section is not None:
+            section = str(section).strip().lower() or None
+        if section and len(section) > 50:
+            raise PoolRuleError('Section cannot exceed 50 characters')
+        role = item.get('role') or None
+        if role not in RULE_ROLES:
+            raise PoolRuleError("Rule role must be 'server', 'manager' or empty")
+        try:
+            percent = Decimal(str(item.get('percent')))
+        except ArithmeticError:
+            raise PoolRuleError('Rule percent must be a number')
+        if not percent.is_finite():
+            raise PoolRuleError('Rule percent must be a number')
+        percent = percent.quantize(Decimal('0.01'))
+        if percent <= 0 or percent > 100:
+            raise PoolRuleError('Rule percent must be between 0 and 100')
+        rules.append(_rule_dict(kind, section, role, percent))
+
+    receive_total = sum((Decimal(r['percent']) for r in rules if r['kind'] == 'receive'), ZERO)
+    has_contribute = any(r['kind'] == 'contribute' for r in rules)
+    if has_contribute and receive_total != HUNDRED:
+        raise PoolRuleError('Receive rule percentages must add up to 100')
+    return rules
+
+
+def replace_rules(restaurant_id, rules):
+    TipPoolRule.query.filter(scope_filter(TipPoolRule.restaurant_id, restaurant_id)) \
+        .delete(synchronize_session=False)
+    for rule in rules:
+        db.session.add(TipPoolRule(
+            restaurant_id=restaurant_id,
+            kind=rule['kind'],
+            section=rule['section'],
+            role=rule['role'],
+            percent=Decimal(rule['percent']),
+        ))
+    db.session.commit()
+
+
+# ---------- Engine ----------
+
+def _matches(rule, section, role):
+    return (rule['section'] is None or rule['section'] == section) and \
+        (rule['role'] is None or rule['role'] == role)
+
+
+def _specificity(rule):
+    return (rule['section'] is not None) * 2 + (rule['role'] is not None)
+
+
+def _new_accumulator(user_name):
+    return {'user_name': user_name, 'hours': ZERO, 'gross': ZERO, 'basis': ZERO, 'receive_hours': {}}
+
+
+def accumulate(accumulators, rows, rules, sign=1):
+    """Fold entry rows into per-user accumulators in a single pass.
+
+    rows: (user_id, user_name, role, section, total_tips, hours_worked)
+    Each entry contributes under its most specific matching contribute
+    rule and counts its hours towards every receive rule it matches.
+    """
+    contribute = sorted((r for r in rules if r['kind'] == 'contribute'), key=_specificity, reverse=True)
+    contribute = [(r, Decimal(r['percent'])) for r in contribute]
+    receive = [(str(i), r) for i, r in enumerate(rules) if r['kind'] == 'receive']
+    sign = Decimal(sign)
+
+    for user_id, user_name, role, section, tips, hours in rows:
+        acc = accumulators.get(user_id)
+        if acc is None:
+            acc = accumulators[user_id] = _new_accumulator(user_name)
+        tips = Decimal(str(tips or 0)) * sign
+        hours = Decimal(str(hours or 0)) * sign
+        acc['gross'] += tips
+        acc['hours'] += hours
+
+        for rule, percent in contribute:
+            if _matches(rule, section, role):
+                acc['basis'] += tips * percent / HUNDRED
+                break
+        for key, rule in receive:
+            if _matches(rule, section, role):
+                acc['receive_hours'][key] = acc['receive_hours'].get(key, ZERO) + hours
+    return accumulators
+
+
+def largest_remainder(exact_cents, total_cents):
+    """Round {key: exact cents} to integers that sum to total_cents.
+
+    Every value is floored, then the leftover cents go to the largest
+    fractional remainders (ties broken by key, so results are stable).
+    """
+    floors = {k: int(v.to_integral_value(ROUND_FLOOR)) for k, v in exact_cents.items()}
+    leftover = total_cents - sum(floors.values())
+    order = sorted(exact_cents, key=lambda k: (-(exact_cents[k] - floors[k]), str(k)))
+    for k in order[:max(leftover, 0)]:
+        floors[k] += 1
+    return floors
+
+
+def allocate(accumulators, rules):
+    """Turn accumulators into {user_id: (contributed, received)} cents plus the pool total"""
+    receive = [(str(i), Decimal(r['percent'])) for i, r in enumerate(rules) if r['kind'] == 'receive']
+    rule_hours = {
+        key: sum((acc['receive_hours'].get(key, ZERO) for acc in accumulators.values()), ZERO)
+        for key, _ in receive
+    }
+    # Shares of rules nobody worked under are spread over the rules that did
+    active = [(key, percent) for key, percent in receive if rule_hours[key] > 0]
+    if not active:
+        return {user_id: (0, 0) for user_id in accumulators}, 0
+
+    basis_cents = {u: acc['basis'] * HUNDRED for u, acc in accumulators.items()}
+    pool_exact = sum(basis_cents.values(), ZERO)
+    pool_cents = int(pool_exact.to_integral_value(ROUND_HALF_UP))
+    contributed = largest_remainder(basis_cents, pool_cents)
+
+    percent_total = sum((p for _, p in active), ZERO)
+    share_cents = {u: ZERO for u in accumulators}
+    for key, percent in active:
+        rule_cents = Decimal(pool_cents) * percent / percent_total
+        for user_id, acc in accumulators.items():
+            hours = acc['receive_hours'].get(key, ZERO)
+            if hours > 0:
+                share_cents[user_id] += rule_cents * hours / rule_hours[key]
+    received = largest_remainder(share_cents, pool_cents)
+
+    return {u: (contributed[u], received[u]) for u in accumulators}, pool_cents
+
+
+def compute_distribution(rows, rules):
+    """Distribute a pay period's pool; returns (accumulators, allocation, pool_cents)"""
+    accumulators = accumulate({}, rows, rules)
+    allocation, pool_cents = allocate(accumulators, rules)
+    return accumulators, allocation, pool_cents
+
+
+# ---------- Snapshots ----------
+
+def _cents(value):
+    return (Decimal(value) / HUNDRED).quantize(Decimal('0.01'))
+
+
+def _period_rows(restaurant_id, period_start, period_end):
+    entries = archive.entries(period_start)
+    query = db.session.query(
+        entries.user_id, User.name, User.role, entries.section,
+        entries.total_tips, entries.hours_worked,
+    ).join(User, User.id == entries.user_id).filter(
+        entries.work_date >= period_start,
+        entries.work_date <= period_end,
+    )
+    if restaurant_id is not None:
+        query = query.filter(User.restaurant_id == restaurant_id)
+    return query.all()
+
+
+def _write_lines(snapshot, accumulators, rules):
+    allocation, pool_cents = allocate(accumulators, rules)
+    lines = {line.user_id: line for line in snapshot.lines}
+
+    for user_id, acc in accumulators.items():
+        line = lines.get(user_id)
+        if acc['hours'] <= 0 and acc['gross'] <= 0:
+            if line is not None:
+                snapshot.lines.remove(line)
+            continue
+        if line is None:
+            line = PayrollSnapshotLine(user_id=user_id)
+            snapshot.lines.append(line)
+        contributed, received = allocation[user_id]
+        line.user_name = acc['user_name']
+        line.hours_worked = acc['hours']
+        line.gross_tips = acc['gross']
+        line.contribution_basis = acc['basis']
+        line.receive_hours = json.dumps({k: str(v) for k, v in acc['receive_hours'].items()})
+        line.tips_contributed = _cents(contributed)
+        line.tips_received = _cents(received)
+        line.net_tips = acc['gross'] - _cents(contributed) + _cents(received)
+    snapshot.pool_total = _cents(pool_cents)
+
+
+def _load_accumulators(snapshot):
+    accumulators = {}
+    for line in snapshot.lines:
+        acc = _new_accumulator(line.user_name)
+        acc['hours'] = Decimal(line.hours_worked)
+        acc['gross'] = Decimal(line.gross_tips)
+        acc['basis'] = Decimal(line.contribution_basis)
+        acc['receive_hours'] = {k: Decimal(v) for k, v in json.loads(line.receive_hours or '{}').items()}
+        accumulators[line.user_id] = acc
+    return accumulators
+
+
+def create_snapshot(restaurant_id, period_start, period_end):
+    """Compute and persist the pool distribution for a pay period"""
+    rules = load_rules(restaurant_id)
+    if not any(r['kind'] == 'receive' for r in rules):
+        raise PoolRuleError('No tip pool rules configured')
+
+    accumulators = accumulate({}, _period_rows(restaurant_id, period_start, period_end), rules)
+    snapshot = PayrollSnapshot(
+        restaurant_id=restaurant_id,
+        period_start=period_start,
+        period_end=period_end,
+        rules=json.dumps(rules),
+    )
+    _write_lines(snapshot, accumulators, rules)
+    db.session.add(snapshot)
+    db.session.commit()
+    return snapshot
+
+
+def apply_entries(entries):
+    """Fold created (sign=1) or deleted (sign=-1) entries into covering snapshots.
+
+    entries: (tip_dict, restaurant_id, role, sign) tuples. Each covering
+    snapshot is locked and rewritten once; the caller commits. Returns the
+    number of snapshots updated.
+    """
+    if not entries:
+        return 0
+    work_dates = [date.fromisoformat(tip['work_date']) for tip, _, _, _ in entries]
+    restaurants = {restaurant_id for _, restaurant_id, _, _ in entries if restaurant_id is not None}
+
+    # Unscoped snapshots cover every restaurant
+    scope = PayrollSnapshot.restaurant_id.is_(None)
+    if restaurants:
+        scope = or_(scope, PayrollSnapshot.restaurant_id.in_(restaurants))
+    snapshots = PayrollSnapshot.query.filter(
+        scope,
+        PayrollSnapshot.period_start <= max(work_dates),
+        PayrollSnapshot.period_end >= min(work_dates),
+    ).with_for_update().all()
+
+    updated = 0
+    for snapshot in snapshots:
+        rows = {1: [], -1: []}
+        for (tip, restaurant_id, role, sign), work_date in zip(entries, work_dates):
+            if snapshot.restaurant_id not in (None, restaurant_id):
+                continue
+            if snapshot.period_start <= work_date <= snapshot.period_end:
+                rows[sign].append((tip['user_id'], tip.get('user_name'), role, tip.get('section'),
+                                   tip['total_tips'], tip['hours_worked']))
+        if not rows[1] and not rows[-1]:
+            continue
+        rules = json.loads(snapshot.rules)
+        accumulators = _load_accumulators(snapshot)
+        for sign, sign_rows in rows.items():
+            accumulate(accumulators, sign_rows, rules, sign)
+        _write_lines(snapshot, accumulators, rules)
+        updated += 1
+    return updated
+
+
+def apply_entry(tip, restaurant_id, role, sign):
+    """Fold one late (sign=1) or deleted (sign=-1) entry into covering snapshots; the caller commits"""
+    return apply_entries([(tip, restaurant_id, role, sign)])